@@ -0,0 +1,99 @@
+"""
+abortable_session.py
+
+A requests.Session whose in-flight requests can be cut off from another thread.
+
+Session.close() only drops idle pooled connections; a request blocked in a
+long-poll keeps waiting for its answer. abort() shuts down the socket of every
+connection the session opened, so a blocked request fails at once with a
+connection error, and any request made afterwards fails immediately.
+
+Used for the lease pollers, so a drain does not sit out their long-polls.
+"""
+
+import socket
+import threading
+import weakref
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class SessionAborted(requests.ConnectionError):
+    """The session was aborted."""
+
+
+def _shutdown(conn: Any) -> None:
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _AbortAdapter(HTTPAdapter):
+    def __init__(self, session: "AbortableSession"):
+        # Set before HTTPAdapter.__init__, which builds the pool manager.
+        self._session = session
+        super().__init__()
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        session = self._session
+
+        class _HTTPConnection(HTTPConnection):
+            def connect(self) -> None:
+                super().connect()
+                session._track(self)
+
+        class _HTTPSConnection(HTTPSConnection):
+            def connect(self) -> None:
+                super().connect()
+                session._track(self)
+
+        class _HTTPPool(HTTPConnectionPool):
+            ConnectionCls = _HTTPConnection
+
+        class _HTTPSPool(HTTPSConnectionPool):
+            ConnectionCls = _HTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPPool, "https": _HTTPSPool}
+
+
+class AbortableSession(requests.Session):
+    def __init__(self) -> None:
+        super().__init__()
+        self._abort_lock = threading.Lock()
+        self._conns: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self.aborted = False
+        adapter = _AbortAdapter(self)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def _track(self, conn: Any) -> None:
+        with self._abort_lock:
+            if not self.aborted:
+                self._conns.add(conn)
+                return
+        # Connected just as the session was aborted.
+        _shutdown(conn)
+        raise SessionAborted("session aborted")
+
+    def request(self, *args: Any, **kwargs: Any) -> requests.Response:
+        if self.aborted:
+            raise SessionAborted("session aborted")
+        return super().request(*args, **kwargs)
+
+    def abort(self) -> None:
+        """Fail every in-flight and future request of this session."""
+        with self._abort_lock:
+            self.aborted = True
+            conns = list(self._conns)
+        for conn in conns:
+            _shutdown(conn)
+        self.close()
@@ -0,0 +1,148 @@
+"""
+admin_socket.py
+
+Local admin interface: a Unix-domain socket (mode 0600) that takes one JSON
+request per line and answers with one JSON line. The agent supplies the
+handler; see _admin() in app.py for the commands:
+
+    {"cmd": "get"}                              tunables and their current values
+    {"cmd": "stats"}                            runtime state (queues, pool, controllers, ...)
+    {"cmd": "set", "values": {"WAIT_MS": 500}}  change tunables now
+    {"cmd": "pool", "workers": 4}               resize the CPU pool (running tasks finish)
+    {"cmd": "reload"}                           re-read agent.env and apply its tunables
+
+Client:
+
+    python admin_socket.py [--socket PATH] get | stats | reload | pool N | set KEY=VALUE ...
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from typing import Any, Callable, Dict, Optional
+
+Handler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+_MAX_REQUEST_BYTES = 1024 * 1024
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    handler: Handler
+
+
+class _Conn(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline(_MAX_REQUEST_BYTES)
+            if not line:
+                return
+            try:
+                req = json.loads(line)
+                if not isinstance(req, dict):
+                    raise ValueError("request must be a JSON object")
+                resp = self.server.handler(req)
+            except Exception as e:
+                resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(resp, default=str).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class AdminServer:
+    def __init__(self, path: str, handler: Handler):
+        self.path = path
+        self._server: Optional[_Server] = None
+        self._handler = handler
+
+    def start(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path):
+            # Stale socket from a previous run; refuse to steal a live one.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise RuntimeError(f"admin socket {self.path} is in use by another process")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            finally:
+                probe.close()
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _Conn)
+        finally:
+            os.umask(old_umask)
+        self._server.handler = self._handler
+        threading.Thread(target=self._server.serve_forever, name="admin-socket", daemon=True).start()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# ---------------- client ----------------
+
+
+def request(path: str, req: Dict[str, Any], timeout: float = 60.0) -> Dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(json.dumps(req).encode("utf-8") + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return json.loads(buf)
+
+
+def _parse_value(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def main(argv: list) -> int:
+    import argparse
+
+    default_path = os.getenv("ADMIN_SOCKET") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "admin.sock")
+    ap = argparse.ArgumentParser(description="agent admin socket client")
+    ap.add_argument("--socket", default=default_path)
+    ap.add_argument("cmd", choices=("get", "stats", "reload", "pool", "set"))
+    ap.add_argument("args", nargs="*", help="pool: N; set: KEY=VALUE ...")
+    args = ap.parse_args(argv)
+
+    req: Dict[str, Any] = {"cmd": args.cmd}
+    if args.cmd == "pool":
+        if len(args.args) != 1:
+            ap.error("pool takes the new worker count")
+        req["workers"] = int(args.args[0])
+    elif args.cmd == "set":
+        if not args.args:
+            ap.error("set takes KEY=VALUE pairs")
+        values = {}
+        for kv in args.args:
+            key, sep, raw = kv.partition("=")
+            if not sep:
+                ap.error(f"expected KEY=VALUE, got {kv!r}")
+            values[key.strip()] = _parse_value(raw.strip())
+        req["values"] = values
+
+    resp = request(args.socket, req)
+    print(json.dumps(resp, indent=2, sort_keys=True))
+    return 0 if resp.get("ok") else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
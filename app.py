@@ -6,6 +6,29 @@
 #   - Register:    POST /api/agents/register            (also /agents/register)
 #   - Heartbeat:   POST /api/agents/heartbeat           (also /agents/heartbeat)
 #   - Result:      POST /api/result                     (also /result)
+#   - Leave:       POST /api/agents/leave               (also /agents/leave)
+#                  {agent, released: [job_id, ...]} — jobs handed back on drain
+#
+# Drain (SIGTERM / SIGINT, e.g. systemd restarts):
+#   - Stop leasing, hand back buffered tasks, let in-flight tasks finish until DRAIN_DEADLINE_SEC
+#   - Flush journaled results, then tell the controller we are leaving (and which jobs to re-queue)
+#   - A second signal skips the drain
+#
+# Controllers (controllers.py):
+#   - CONTROLLER_URLS lists every controller to serve (default: CONTROLLER_URL); the agent
+#     registers / heartbeats with each and posts every result back to the one that issued the job
+#   - A controller that errors is taken out of rotation with exponential backoff (failover)
+#
+# Identities (identities.py):
+#   - AGENT_IDENTITIES lets one agent process register several agents, each with its own
+#     name, TASKS, labels and controllers; they share one CPU pool, and the local scheduler
+#     splits pool time between them by their configured share
+#
+# Lease cadence (lease_cadence.py):
+#   - While tasks keep coming every worker leases for itself (non-blocking), spreading leases
+#     over the controllers that have work, weighted by their hit rate and latency
+#   - Each controller also has one long-poller thread; wait_ms and the pause between polls
+#     grow with consecutive misses and reset on the first hit, which wakes the workers
 #
 # Dynamic worker design:
 #   - Start with 1 worker loop
@@ -15,20 +38,42 @@
 # CPU execution:
 #   - ProcessPoolExecutor for CPU-bound ops (bypasses GIL)
 #   - I/O-light ops can still run inline if they’re cheap, but default is via CPU pool
+#   - Leased tasks go through a local scheduler (scheduler.py): per-op queues ordered by
+#     expected run time (per-op EWMA), with aging and optional priority / deadline fields
+#   - Pool processes measure each task's run time, CPU time and peak RSS (task_cost.py);
+#     results carry them in meta["usage"] and heartbeats carry per-op totals ("op_costs")
+#   - Same-op tasks of batch ops (register_op(name, batch=True)) run as one vectorized call
+#   - Optional shared-memory transport (SHM_TRANSPORT=1) moves large task/result JSON
+#     through recycled segments instead of pickling it (see shm_transport.py)
+#   - Every result is journaled to disk before upload and replayed in order after a
+#     controller outage or restart (see result_journal.py)
+#   - Recently seen job_ids are remembered (job_dedupe.py): a re-leased job that is still
+#     running is not started twice, and a finished one gets its stored result re-sent
+#   - Pool processes come from a forkserver that preloads the TASKS ops (see ops_preload.py)
+#     and are all spawned + warmed before register(), so the first task runs at steady-state speed
+#
+# Admin socket (admin_socket.py):
+#   - ADMIN_SOCKET (mode 0600) takes JSON commands to read stats and change tunables live:
+#     lease cadence, scaling, batching, scheduling, timeouts and the CPU pool size
+#   - "reload" re-reads agent.env (load_env.py) and applies the tunables in it
+#
+# Stats feed (stats_feed.py):
+#   - STATS_HTTP serves a read-only snapshot (status, throughput, queue, latency percentiles)
+#     on localhost for monitor.py: conditional GET (ETag), long-poll or SSE, pushed on change only
 #
 # Notes:
 #   - This file intentionally does NOT include any “battery power” behavior.
 #   - Designed to run cleanly on Linux + “forever stack” style service/runtime.
 
 import os
-import sys
 import time
 import json
+import math
 import socket
+import multiprocessing
 import signal
-import random
 import threading
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
 
 import requests
@@ -38,14 +83,39 @@ try:
 except Exception:
     psutil = None
 
-from ops_loader import load_ops
+if __name__ == "__main__":
+    # agent.env -> os.environ before the config below is read. Only in the main
+    # process: pool processes re-import this module and inherit the environment.
+    import load_env  # noqa: F401
+
+import job_dedupe
+import pipeline
+from abortable_session import AbortableSession
+from admin_socket import AdminServer
+from controllers import Controller, ControllerSet
+from identities import Identity, load_identities, parse_labels
+from job_dedupe import JobIndex
+from lease_cadence import LeaseCadence
+from ops_loader import LazyOp, describe_ops, init_worker, load_ops, run_batch, run_op, warm_worker
+from pipeline import PIPELINE_OP, run_pipeline
+from result_journal import ResultJournal
+from scheduler import LocalScheduler
+from shm_transport import SegmentPool, ShmRef, read_envelope, run_op_shm
+from stats_feed import StatsFeed, StatsServer, TaskStats
+from task_cost import OpCosts, measured
 from worker_sizing import build_worker_profile
 
 
 # ---------------- config ----------------
 
 CONTROLLER_URL = os.getenv("CONTROLLER_URL", "http://controller:8080").rstrip("/")
+# Comma-separated list of controllers to serve; defaults to CONTROLLER_URL alone.
+CONTROLLER_URLS = [u.strip().rstrip("/") for u in (os.getenv("CONTROLLER_URLS") or CONTROLLER_URL).split(",")
+                   if u.strip()]
 API_PREFIX_RAW = os.getenv("API_PREFIX", "/api").strip()
+# A controller that errors is skipped for this long, doubling per consecutive error
+CONTROLLER_FAIL_BACKOFF_SEC = float(os.getenv("CONTROLLER_FAIL_BACKOFF_SEC", "1.0"))
+CONTROLLER_FAIL_BACKOFF_MAX_SEC = float(os.getenv("CONTROLLER_FAIL_BACKOFF_MAX_SEC", "30"))
 AGENT_NAME = os.getenv("AGENT_NAME") or socket.gethostname()
 
 TASKS_RAW = os.getenv("TASKS", "echo")
@@ -53,10 +123,15 @@ TASKS = [t.strip() for t in TASKS_RAW.split(",") if t.strip()]
 
 # Leave some cores for OS / background services.
 RESERVED_CORES = int(os.getenv("RESERVED_CORES", "4"))
+# CPU pool processes; 0 = usable cores
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "0"))
 
 HEARTBEAT_SEC = float(os.getenv("HEARTBEAT_SEC", "3"))
 WAIT_MS = int(os.getenv("WAIT_MS", "2000"))
 LEASE_IDLE_SEC = float(os.getenv("LEASE_IDLE_SEC", "0.05"))
+# idle cadence: wait_ms and the pause after a miss double per consecutive miss, up to these caps
+LEASE_WAIT_MAX_MS = int(os.getenv("LEASE_WAIT_MAX_MS", "15000"))
+LEASE_IDLE_MAX_SEC = float(os.getenv("LEASE_IDLE_MAX_SEC", "1.0"))
 
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "6"))
 
@@ -69,20 +144,60 @@ SCALE_TICK_SEC = float(os.getenv("SCALE_TICK_SEC", "2.0"))
 # worker execution guardrails
 TASK_EXEC_TIMEOUT_SEC = float(os.getenv("TASK_EXEC_TIMEOUT_SEC", "60"))
 
-# labels
+# batch ops: max tasks per call, and how long to keep leasing to fill a batch
+BATCH_MAX_SIZE = max(1, int(os.getenv("BATCH_MAX_SIZE", "32")))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "20"))
+
+# local scheduling of leased tasks (shortest expected job first, with aging)
+SCHED_EWMA_ALPHA = float(os.getenv("SCHED_EWMA_ALPHA", "0.2"))
+SCHED_AGING = float(os.getenv("SCHED_AGING", "0.5"))  # ms of score credit per ms waited
+SCHED_PRIORITY_MS = float(os.getenv("SCHED_PRIORITY_MS", "1000"))  # score credit per priority level
+SCHED_PREFETCH = int(os.getenv("SCHED_PREFETCH", "4"))  # queue depth to top up to while leases hit
+
+# shared-memory transport for large task/result bodies (opt-in)
+SHM_TRANSPORT = os.getenv("SHM_TRANSPORT", "0").strip().lower() in ("1", "true", "yes", "on")
+SHM_MIN_BYTES = int(os.getenv("SHM_MIN_BYTES", str(256 * 1024)))
+SHM_POOL_MAX_BYTES = int(os.getenv("SHM_POOL_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# durable result journal (replayed when the controller is reachable again)
+RESULT_JOURNAL = os.getenv("RESULT_JOURNAL", "1").strip().lower() in ("1", "true", "yes", "on")
+RESULT_JOURNAL_PATH = os.getenv("RESULT_JOURNAL_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "journal", "results.journal")
+RESULT_JOURNAL_MAX_BYTES = int(os.getenv("RESULT_JOURNAL_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_JOURNAL_FSYNC_MS = float(os.getenv("RESULT_JOURNAL_FSYNC_MS", "2"))
+JOURNAL_REPLAY_SEC = float(os.getenv("JOURNAL_REPLAY_SEC", "2"))
+
+# job_id dedupe window for re-leased jobs
+DEDUPE_TTL_SEC = float(os.getenv("DEDUPE_TTL_SEC", "600"))
+DEDUPE_MAX_BYTES = int(os.getenv("DEDUPE_MAX_BYTES", str(64 * 1024 * 1024)))
+DEDUPE_MAX_ENTRIES = int(os.getenv("DEDUPE_MAX_ENTRIES", "100000"))
+
+# local multi-op pipelines (op "pipeline"), run in one pool process
+PIPELINES = os.getenv("PIPELINES", "1").strip().lower() in ("1", "true", "yes", "on")
+
+# drain on SIGTERM / SIGINT
+DRAIN_DEADLINE_SEC = float(os.getenv("DRAIN_DEADLINE_SEC", "25"))
+DRAIN_FLUSH_SEC = float(os.getenv("DRAIN_FLUSH_SEC", "5"))
+
+# local admin socket for live tuning ("" or "off" disables it)
+ADMIN_SOCKET = os.getenv("ADMIN_SOCKET", os.path.join(os.path.dirname(os.path.abspath(__file__)), "admin.sock"))
+
+# agent-local stats feed for monitor.py (host:port; "" or "off" disables it)
+STATS_HTTP = os.getenv("STATS_HTTP", "127.0.0.1:8099").strip()
+STATS_TICK_SEC = float(os.getenv("STATS_TICK_SEC", "1.0"))
+
+# CPU pool startup
+POOL_START_METHOD = os.getenv("POOL_START_METHOD", "forkserver").strip()
+POOL_WARM_TIMEOUT_SEC = float(os.getenv("POOL_WARM_TIMEOUT_SEC", "120"))
+
+# labels (JSON object, or simple k=v,k2=v2)
 AGENT_LABELS_RAW = os.getenv("AGENT_LABELS", "")
-AGENT_LABELS: Dict[str, Any] = {}
-if AGENT_LABELS_RAW.strip():
-    try:
-        AGENT_LABELS = json.loads(AGENT_LABELS_RAW)
-    except Exception:
-        # allow simple k=v,k2=v2
-        for part in AGENT_LABELS_RAW.split(","):
-            part = part.strip()
-            if not part or "=" not in part:
-                continue
-            k, v = part.split("=", 1)
-            AGENT_LABELS[k.strip()] = v.strip()
+AGENT_LABELS: Dict[str, Any] = parse_labels(AGENT_LABELS_RAW)
+
+# Agent identities served by this process (JSON list or @file; see identities.py).
+# Unset: one identity from AGENT_NAME / TASKS / AGENT_LABELS / CONTROLLER_URLS.
+AGENT_IDENTITIES_RAW = os.getenv("AGENT_IDENTITIES", "")
+IDENTITIES: List[Identity] = load_identities(AGENT_IDENTITIES_RAW, AGENT_NAME, TASKS, AGENT_LABELS, CONTROLLER_URLS)
 
 
 # ---------------- logging ----------------
@@ -103,7 +218,9 @@ def log(msg: str, key: str = "default", every: float = 1.0) -> None:
 # ---------------- runtime state ----------------
 
 stop_event = threading.Event()
-OPS = load_ops(TASKS)
+drain_event = threading.Event()  # set on first shutdown signal: stop leasing, finish in-flight work
+OPS: Dict[str, LazyOp] = {}
+FAILED_OPS: Dict[str, str] = {}  # op name -> last line of its load error, from the pool at startup
 
 WORKER_PROFILE = build_worker_profile()
 CPU_PROFILE = WORKER_PROFILE.get("cpu", {})
@@ -111,113 +228,280 @@ USABLE_CORES = int(CPU_PROFILE.get("usable_cores", 1))
 
 # ---------------- CPU execution pool ----------------
 
-# Use processes for true CPU parallelism (bypasses GIL)
-_CPU_WORKERS = max(1, USABLE_CORES)
-_CPU_POOL = ProcessPoolExecutor(max_workers=_CPU_WORKERS)
+# Use processes for true CPU parallelism (bypasses GIL).
+# Created in main() by _start_cpu_pool(), never at import: pool processes re-import this module.
+_CPU_WORKERS = CPU_POOL_WORKERS if CPU_POOL_WORKERS > 0 else max(1, USABLE_CORES)
+_CPU_POOL: Optional[ProcessPoolExecutor] = None
+_cpu_pool_lock = threading.Lock()  # serializes pool resizes
+
+# Recycled shared-memory segments (only when SHM_TRANSPORT is on) and the last
+# JSON result size seen per op, used to size result segments up front.
+_SHM_POOL: Optional[SegmentPool] = None
+_result_size_hint: Dict[str, int] = {}
+
+# Result journal (None when RESULT_JOURNAL=0) and the replay loop's wakeup
+_JOURNAL: Optional[ResultJournal] = None
+_replay_wakeup = threading.Event()
+
+
+def _running_ttl_sec() -> float:
+    # A running job whose finish went missing is forgotten well after any timeout;
+    # a batch may run for TASK_EXEC_TIMEOUT_SEC per task.
+    return max(DEDUPE_TTL_SEC, 2 * TASK_EXEC_TIMEOUT_SEC * BATCH_MAX_SIZE)
+
+
+# Recently leased job_ids (running or finished) and their stored result bodies
+_JOBS = JobIndex(DEDUPE_TTL_SEC, DEDUPE_MAX_BYTES, DEDUPE_MAX_ENTRIES, running_ttl_sec=_running_ttl_sec())
+
+# Startup timings (ms), reported in the log and in the register payload
+STARTUP: Dict[str, Any] = {}
 
 # Scaling state
 _current_workers_lock = threading.Lock()
-_current_workers = 1
+_current_workers = 0
 
 # Inflight tracking (best-effort)
 _hits = 0
 _misses = 0
 _inflight = 0
+_busy_workers = 0  # worker threads running a task or batch
 _worker_lock = threading.Lock()
 
-_session = requests.Session()
+# Per-op CPU time / memory measured in the pool processes
+_COSTS = OpCosts()
 
-# Determine API prefix (try /api then fallback)
-API_PREFIX = API_PREFIX_RAW if API_PREFIX_RAW.startswith("/") else f"/{API_PREFIX_RAW}"
+# Completed tasks (throughput, latency percentiles) and the feed monitors subscribe to
+_TASK_STATS = TaskStats()
+_FEED = StatsFeed()
+
+# Leased tasks waiting for a worker loop, shared fairly between the identities
+_SCHED = LocalScheduler(SCHED_EWMA_ALPHA, SCHED_AGING, SCHED_PRIORITY_MS)
+_IDENTS: Dict[str, Identity] = {ident.name: ident for ident in IDENTITIES}
+for _ident in IDENTITIES:
+    _SCHED.set_share(_ident.name, _ident.share)
 
+# Workers sleep on _work_cond while no controller has work; lease pollers wake them.
+_work_cond = threading.Condition()
 
-def _url(path: str) -> str:
-    if not path.startswith("/"):
-        path = "/" + path
-    return f"{CONTROLLER_URL}{path}"
+_session = requests.Session()
 
+# Determine API prefix (try /api then fallback), per controller
+API_PREFIX = API_PREFIX_RAW if API_PREFIX_RAW.startswith("/") else f"/{API_PREFIX_RAW}"
 
-def _api(path: str) -> str:
-    # path should start with /...
-    if not path.startswith("/"):
-        path = "/" + path
-    return _url(f"{API_PREFIX}{path}")
+# Each (identity, controller) pair has its own lease cadence, health and load statistics.
+_CTRLS = ControllerSet(
+    [(ident.name, url) for ident in IDENTITIES for url in ident.controllers],
+    API_PREFIX,
+    lambda: LeaseCadence(WAIT_MS, LEASE_WAIT_MAX_MS, LEASE_IDLE_SEC, LEASE_IDLE_MAX_SEC),
+    CONTROLLER_FAIL_BACKOFF_SEC,
+    CONTROLLER_FAIL_BACKOFF_MAX_SEC,
+)
 
 
-def _probe_prefix() -> None:
-    global API_PREFIX
+def _probe_prefix(ctrl: Controller) -> bool:
     # Try /api first, then no prefix
     candidates = [API_PREFIX, ""]
     for pref in candidates:
-        try_url = f"{CONTROLLER_URL}{pref}/healthz" if pref else f"{CONTROLLER_URL}/healthz"
+        try_url = f"{ctrl.base_url}{pref}/healthz"
         try:
             r = _session.get(try_url, timeout=HTTP_TIMEOUT)
             if r.status_code < 500:
-                API_PREFIX = pref
-                log(f"[agent] API prefix set to: '{API_PREFIX or '(none)'}'", "prefix", every=0.0)
-                return
+                ctrl.api_prefix = pref
+                log(f"[agent] {ctrl.base_url}: API prefix set to: '{pref or '(none)'}'", f"prefix{ctrl.base_url}",
+                    every=0.0)
+                return True
         except Exception:
             continue
     # If nothing worked, keep current and let registration attempts show the error.
-    log("[agent] WARNING: could not probe API prefix; using configured API_PREFIX.", "prefix_warn", every=0.0)
+    log(f"[agent] WARNING: could not probe API prefix of {ctrl.base_url}; using configured API_PREFIX.",
+        f"prefix_warn{ctrl.base_url}", every=30.0)
+    return False
+
+
+def _job_key(dest: str, job_id: str) -> Tuple[str, str]:
+    # job_ids are only unique per controller
+    return dest, job_id
+
+
+def _released_by_dest(keys: List[Tuple[str, str]]) -> Dict[str, List[str]]:
+    out: Dict[str, List[str]] = {}
+    for dest, job_id in keys:
+        out.setdefault(dest, []).append(job_id)
+    return out
 
 
 def _post_json(url: str, payload: Dict[str, Any]) -> requests.Response:
     return _session.post(url, json=payload, timeout=HTTP_TIMEOUT)
 
 
-def _get_json(url: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    r = _session.get(url, params=params, timeout=HTTP_TIMEOUT)
+def _post_body(url: str, body: bytes) -> requests.Response:
+    return _session.post(url, data=body, headers={"Content-Type": "application/json"}, timeout=HTTP_TIMEOUT)
+
+
+def _get_json(url: str, params: Dict[str, Any], timeout: Optional[float] = None,
+              session: Optional[requests.Session] = None,
+              decode: Optional[Callable[[bytes], Any]] = None) -> Optional[Dict[str, Any]]:
+    r = (session or _session).get(url, params=params, timeout=HTTP_TIMEOUT if timeout is None else timeout)
     if r.status_code == 204:
         return None
     r.raise_for_status()
-    return r.json()
+    return decode(r.content) if decode is not None else r.json()
+
+
+def _decode_task(body: bytes) -> Dict[str, Any]:
+    """
+    Decode a leased task for the shm transport. Of a large task that runs
+    through it, only the envelope is decoded here; the raw body is kept in
+    task["_raw"] and its payload decoded in the pool process. Batch ops and
+    pipelines need their payload here, so they are decoded in full.
+    """
+    if len(body) >= SHM_MIN_BYTES:
+        task = read_envelope(body)
+        if task is not None:
+            op = str(task.get("op") or "")
+            if op != PIPELINE_OP and not _is_batch_op(op):
+                task["_raw"] = body
+                return task
+    return json.loads(body)
+
+
+def _controller(dest: str) -> Optional[Controller]:
+    """Controller by key ("" = primary); None if `dest` is not configured (any more)."""
+    return _CTRLS.get(dest) if dest else _CTRLS.primary
+
+
+def _identity(dest: str) -> Identity:
+    """The identity a task or result belongs to, from its controller key ("" = primary)."""
+    ctrl = _controller(dest)
+    if ctrl is None:
+        raise KeyError(f"controller {dest!r} is not configured")
+    return _IDENTS[ctrl.agent]
+
+
+def _identity_ops(ident: Identity) -> List[str]:
+    """The identity's TASKS that loaded."""
+    return [name for name in ident.tasks if name in OPS]
 
 
-def register() -> None:
+def _served_ops(ident: Identity) -> List[str]:
+    """Op names advertised to controllers: TASKS plus the pipeline form when enabled."""
+    names = _identity_ops(ident)
+    if PIPELINES and PIPELINE_OP not in names:
+        names.append(PIPELINE_OP)
+    return names
+
+
+def _queue_cap(ident: Optional[Identity] = None) -> int:
+    """Prefetch limit for one identity's queued tasks, or for all of them."""
+    return SCHED_PREFETCH if ident is not None else SCHED_PREFETCH * len(IDENTITIES)
+
+
+def register(ctrl: Controller) -> None:
+    ident = _IDENTS[ctrl.agent]
     payload = {
-        "agent": AGENT_NAME,
-        "tasks": TASKS,
+        "agent": ident.name,
+        "tasks": _served_ops(ident),
         "worker_profile": WORKER_PROFILE,
-        "labels": AGENT_LABELS,
+        "labels": ident.labels,
+        "startup": STARTUP,
         "ts": time.time(),
     }
     # /agents/register (or /api/agents/register)
-    url = _api("/agents/register") if API_PREFIX else _url("/agents/register")
-    r = _post_json(url, payload)
+    r = _post_json(ctrl.url("/agents/register"), payload)
     r.raise_for_status()
-    log(f"[agent] registered as {AGENT_NAME} tasks={TASKS}", "register", every=0.0)
+    ctrl.registered = True
+    log(f"[agent] registered as {ident.name} at {ctrl.base_url} tasks={_served_ops(ident)}", f"register{ctrl.key}",
+        every=0.0)
 
 
-def heartbeat_loop() -> None:
-    url = _api("/agents/heartbeat") if API_PREFIX else _url("/agents/heartbeat")
-    while not stop_event.is_set():
+def _register_pending() -> int:
+    """Probe + register with every controller not registered yet; returns how many are registered."""
+    for ctrl in _CTRLS:
+        if ctrl.registered or not ctrl.healthy() or stop_event.is_set():
+            continue
         try:
-            payload = {"agent": AGENT_NAME, "ts": time.time()}
-            _post_json(url, payload)
+            _probe_prefix(ctrl)
+            register(ctrl)
+            ctrl.ok()
         except Exception as e:
-            log(f"[agent] heartbeat error: {e}", "hb_err", every=3.0)
+            backoff = ctrl.fail()
+            log(f"[agent] register error at {ctrl.key}: {e} (retry in {backoff:.0f}s)",
+                f"reg_err{ctrl.key}", every=2.0)
+    return sum(1 for c in _CTRLS if c.registered)
+
+
+def heartbeat_loop() -> None:
+    while not stop_event.is_set():
+        # Controllers that were down at startup join as soon as they answer.
+        _register_pending()
+        costs = _COSTS.snapshot()
+        for ctrl in _CTRLS:
+            if not ctrl.registered:
+                continue
+            ident = _IDENTS[ctrl.agent]
+            payload = {"agent": ident.name, "ts": time.time(),
+                       "op_costs": {op: c for op, c in costs.items() if op in _served_ops(ident)}}
+            if drain_event.is_set():
+                payload["draining"] = True
+            try:
+                r = _post_json(ctrl.url("/agents/heartbeat"), payload)
+                if r.status_code == 404 and not drain_event.is_set():
+                    # The controller restarted and forgot us; register again on the next tick.
+                    ctrl.registered = False
+                r.raise_for_status()
+            except Exception as e:
+                log(f"[agent] heartbeat error at {ctrl.key}: {e}", f"hb_err{ctrl.key}", every=3.0)
         stop_event.wait(HEARTBEAT_SEC)
 
 
-def lease_task() -> Optional[Dict[str, Any]]:
+def lease_task(ctrl: Controller, wait_ms: Optional[int] = None,
+               session: Optional[requests.Session] = None) -> Optional[Dict[str, Any]]:
+    """Lease one task from `ctrl`; the task is tagged with the controller + identity its result goes back to."""
     # /task?agent=...&wait_ms=...
-    url = _api("/task") if API_PREFIX else _url("/task")
-    params = {"agent": AGENT_NAME, "wait_ms": WAIT_MS}
+    wait_ms = WAIT_MS if wait_ms is None else wait_ms
+    params = {"agent": ctrl.agent, "wait_ms": wait_ms}
+    t0 = time.time()
     try:
-        task = _get_json(url, params)
-        return task
+        # The controller holds a long-poll for up to wait_ms; do not time out before it answers.
+        task = _get_json(ctrl.url("/task"), params, timeout=HTTP_TIMEOUT + wait_ms / 1000.0, session=session,
+                         decode=_decode_task if _SHM_POOL is not None else None)
     except requests.HTTPError as e:
-        log(f"[agent] lease HTTP error: {e}", "lease_http", every=2.0)
+        ctrl.fail()
+        log(f"[agent] lease HTTP error at {ctrl.key}: {e}", f"lease_http{ctrl.key}", every=2.0)
+        return None
     except Exception as e:
-        log(f"[agent] lease error: {e}", "lease_err", every=2.0)
-    return None
-
-
-def post_result(job_id: str, ok: bool, result: Any = None, error: str = "", meta: Optional[Dict[str, Any]] = None) -> None:
-    url = _api("/result") if API_PREFIX else _url("/result")
+        if isinstance(session, AbortableSession) and session.aborted:
+            # Cut off by the drain; not the controller's fault.
+            return None
+        ctrl.fail()
+        log(f"[agent] lease error at {ctrl.key}: {e}", f"lease_err{ctrl.key}", every=2.0)
+        return None
+    # Latency only means something when the controller did not hold the request.
+    ctrl.ok((time.time() - t0) * 1000.0 if wait_ms == 0 else None)
+    ctrl.lease_outcome(task is not None)
+    if task is not None:
+        task["_controller"] = ctrl.key
+        task["_agent"] = ctrl.agent
+    return task
+
+
+def post_result(job_id: str, ok: bool, result: Any = None, error: str = "", meta: Optional[Dict[str, Any]] = None,
+                result_json: Optional[Any] = None, dest: str = "") -> None:
+    """
+    Post a task result to `dest`, the controller (key) that issued the job ("" = primary).
+
+    `result_json` (bytes-like) is an already JSON-encoded result; it is spliced
+    into the body as-is instead of encoding `result`.
+    """
+    ctrl = _controller(dest)
+    if ctrl is None:
+        # Never reroute a result to a controller (or identity) that did not issue the job.
+        log(f"[agent] result job_id={job_id} dropped: controller {dest!r} is not configured", "post_unrouted",
+            every=0.0)
+        _JOBS.forget(_job_key(dest, job_id))
+        return
     payload: Dict[str, Any] = {
-        "agent": AGENT_NAME,
+        "agent": _IDENTS[ctrl.agent].name,
         "job_id": job_id,
         "ok": ok,
         "result": result,
@@ -227,72 +511,516 @@ def post_result(job_id: str, ok: bool, result: Any = None, error: str = "", meta
     if meta:
         payload["meta"] = meta
     try:
-        r = _post_json(url, payload)
-        r.raise_for_status()
+        if result_json is not None:
+            del payload["result"]
+            rest = json.dumps(payload).encode("utf-8")
+            body = b"".join((b'{"result": ', result_json, b", ", rest[1:]))
+        else:
+            body = json.dumps(payload).encode("utf-8")
     except Exception as e:
+        log(f"[agent] post_result encode error job_id={job_id}: {e}", "post_err", every=2.0)
+        _JOBS.forget(_job_key(dest, job_id))
+        return
+
+    if ok:
+        owned = _JOBS.finish(_job_key(dest, job_id), body)
+    else:
+        # A failure may be transient; a re-lease runs the job again instead of getting the error re-sent.
+        owned = _JOBS.forget(_job_key(dest, job_id))
+    if not owned:
+        # Handed back on leave; the controller has leased it to someone else.
+        log(f"[agent] result job_id={job_id} dropped: released on leave", "post_released", every=0.0)
+        return
+    _TASK_STATS.record((meta or {}).get("ms", 0.0), ok)
+    _submit_result(job_id, body, dest)
+
+
+def _submit_result(job_id: str, body: bytes, dest: str = "") -> None:
+    """Journal (when enabled) and upload an encoded result body to controller `dest`."""
+    seq = None
+    if _JOURNAL is not None and not _JOURNAL.closed:
+        try:
+            seq = _JOURNAL.append(body, dest)
+        except Exception as e:
+            log(f"[agent] journal append error job_id={job_id}: {e}", "journal_err", every=5.0)
+        if seq is not None and _JOURNAL.backlog(dest):
+            # Older results are still waiting for this controller; keep upload order.
+            _JOURNAL.release(seq)
+            _replay_wakeup.set()
+            return
+
+    try:
+        _send_result(body, dest)
+        if seq is not None:
+            _JOURNAL.ack(seq)
+    except ResultRejected as e:
+        # Retrying cannot help, and a kept record would block every later result for `dest`.
+        if seq is not None:
+            _JOURNAL.ack(seq)
+        _JOBS.forget(_job_key(dest, job_id))
+        log(f"[agent] result job_id={job_id} dropped: {e}", "post_rejected", every=0.0)
+    except Exception as e:
+        if seq is not None:
+            _JOURNAL.release(seq)
+            _replay_wakeup.set()
         log(f"[agent] post_result error job_id={job_id}: {e}", "post_err", every=2.0)
 
 
-def _run_op(op_name: str, payload: Any) -> Any:
-    fn = OPS.get(op_name)
-    if not fn:
-        raise RuntimeError(f"unknown op: {op_name}")
-    return fn(payload)
+class ResultRejected(Exception):
+    """The controller refused a result for good (4xx other than 408 / 429)."""
 
 
-def execute_task(task: Dict[str, Any]) -> None:
-    global _inflight
+class ResultUnrouted(Exception):
+    """The result's controller is not configured any more."""
+
+
+def _send_result(body: bytes, dest: str = "") -> None:
+    """
+    Upload one result body. Raises ResultRejected when the controller refuses
+    it for good, ResultUnrouted when `dest` is not configured; any other
+    exception (connection error, timeout, 5xx, 408, 429) means the upload may
+    succeed later.
+
+    Only transport errors, timeouts and 5xx count against the controller's
+    health: a 4xx is about this one result, not about the controller.
+    """
+    ctrl = _controller(dest)
+    if ctrl is None:
+        raise ResultUnrouted(f"controller {dest!r} is not configured")
+    if not ctrl.healthy():
+        # Do not wait out a timeout per result; the journal keeps it until the controller is back.
+        raise RuntimeError(f"controller {ctrl.base_url} unavailable")
+    t0 = time.time()
+    try:
+        r = _post_body(ctrl.url("/result"), body)
+    except Exception:
+        ctrl.fail()
+        raise
+    ms = (time.time() - t0) * 1000.0
+    if r.status_code >= 500 or r.status_code == 408:
+        ctrl.fail()
+        r.raise_for_status()
+    ctrl.ok(ms)
+    if r.status_code == 429:
+        r.raise_for_status()
+    if r.status_code >= 400:
+        raise ResultRejected(f"HTTP {r.status_code} from {ctrl.base_url}: {r.text[:200]}")
+
+
+def journal_replay_loop() -> None:
+    """Upload journaled results in order whenever the controller is reachable."""
+    while not stop_event.is_set():
+        _replay_wakeup.wait(JOURNAL_REPLAY_SEC)
+        _replay_wakeup.clear()
+
+        sent = 0
+        failed = set()  # destinations that are down this round; their results wait, others go on
+        parked = set()  # destinations no longer configured; kept on disk in case they come back
+        while not stop_event.is_set():
+            item = _JOURNAL.claim_next(skip=failed | parked)
+            if item is None:
+                break
+            seq, body, dest = item
+            try:
+                _send_result(body, dest)
+                _JOURNAL.ack(seq)
+                sent += 1
+            except ResultRejected as e:
+                _JOURNAL.ack(seq)
+                log(f"[agent] journaled result seq={seq} dropped: {e}", "replay_rejected", every=0.0)
+            except ResultUnrouted as e:
+                _JOURNAL.release(seq)
+                parked.add(dest)
+                log(f"[agent] journaled results parked ({_JOURNAL.backlog(dest)} pending): {e}",
+                    f"replay_parked{dest}", every=600.0)
+            except Exception as e:
+                _JOURNAL.release(seq)
+                log(f"[agent] journal replay error: {e}", "replay_err", every=5.0)
+                failed.add(dest)
+
+        if sent:
+            log(f"[agent] journal replayed {sent} results (pending={_JOURNAL.stats()['pending']})",
+                "replay", every=5.0)
+        if failed:
+            # Pace retries while the controller is down, whatever wakes us.
+            stop_event.wait(JOURNAL_REPLAY_SEC)
+
+
+def _task_fields(task: Dict[str, Any]) -> Optional[tuple]:
+    """
+    Validate a leased task; returns (job_id, op, payload, dest) or None if it
+    was answered/dropped. `dest` is the controller that issued it.
+    """
     job_id = str(task.get("job_id") or task.get("id") or "")
     op = str(task.get("op") or "")
-    payload = task.get("payload")
+    dest = str(task.get("_controller") or "")
 
     if not job_id:
         log("[agent] malformed task missing job_id", "malformed", every=1.0)
-        return
+        return None
     if not op:
-        post_result(job_id, False, result=None, error="malformed task: missing op")
+        post_result(job_id, False, result=None, error="malformed task: missing op", dest=dest)
+        return None
+    if op not in _identity_ops(_identity(dest)) and not (PIPELINES and op == PIPELINE_OP):
+        post_result(job_id, False, result=None, error=f"unknown op: {op}", meta={"op": op, "ms": 0.0}, dest=dest)
+        return None
+
+    state, body = _JOBS.begin(_job_key(dest, job_id))
+    if state == job_dedupe.RUNNING:
+        log(f"[agent] duplicate lease job_id={job_id}: attached to running execution", "dup_run", every=1.0)
+        return None
+    if state == job_dedupe.DONE:
+        log(f"[agent] duplicate lease job_id={job_id}: re-sending stored result", "dup_done", every=1.0)
+        _submit_result(job_id, body, dest)
+        return None
+    return job_id, op, task.get("payload"), dest
+
+
+def _is_batch_op(op: str) -> bool:
+    lazy = OPS.get(op)
+    return bool(lazy and lazy.batch)
+
+
+def execute_task(task: Dict[str, Any]) -> None:
+    global _inflight
+    fields = _task_fields(task)
+    if fields is None:
         return
+    job_id, op, payload, dest = fields
 
     t0 = time.time()
     with _worker_lock:
         _inflight += 1
 
     try:
+        if op == PIPELINE_OP:
+            _execute_pipeline(job_id, payload, t0, dest)
+            return
+        if _SHM_POOL is not None:
+            _execute_shm(job_id, op, task, payload, t0, dest)
+            return
         # Default: run in CPU pool (safe for CPU bound).
-        future = _CPU_POOL.submit(_run_op, op, payload)
-        out = future.result(timeout=TASK_EXEC_TIMEOUT_SEC)
+        future = _submit(measured, run_op, op, payload)
+        out, usage = future.result(timeout=TASK_EXEC_TIMEOUT_SEC)
         dt = (time.time() - t0) * 1000.0
-        post_result(job_id, True, result=out, error="", meta={"op": op, "ms": dt})
+        _SCHED.record(op, usage["run_ms"])
+        _COSTS.record(op, usage, wall_ms=dt)
+        post_result(job_id, True, result=out, error="", meta={"op": op, "ms": dt, "usage": usage}, dest=dest)
     except FuturesTimeoutError:
         dt = (time.time() - t0) * 1000.0
-        post_result(job_id, False, result=None, error=f"timeout after {TASK_EXEC_TIMEOUT_SEC}s", meta={"op": op, "ms": dt})
+        _SCHED.record(op, dt)
+        post_result(job_id, False, result=None, error=f"timeout after {TASK_EXEC_TIMEOUT_SEC}s", meta={"op": op, "ms": dt},
+                    dest=dest)
     except Exception as e:
         dt = (time.time() - t0) * 1000.0
-        post_result(job_id, False, result=None, error=str(e), meta={"op": op, "ms": dt})
+        post_result(job_id, False, result=None, error=str(e), meta={"op": op, "ms": dt}, dest=dest)
     finally:
         with _worker_lock:
             _inflight = max(0, _inflight - 1)
 
 
-def worker_loop(worker_id: int) -> None:
+def _execute_pipeline(job_id: str, payload: Any, t0: float, dest: str) -> None:
+    """
+    Run a pipeline task in one pool process and post its final output, with
+    per-stage timings in meta["stages"]. Stage ops must be ones this agent serves.
+    """
+    try:
+        planned = pipeline.plan(payload, allowed=_identity_ops(_identity(dest)))
+    except ValueError as e:
+        post_result(job_id, False, result=None, error=f"bad pipeline: {e}", meta={"op": PIPELINE_OP, "ms": 0.0},
+                    dest=dest)
+        return
+    future = _submit(measured, run_pipeline, planned)
+    (ok, out, stages), usage = future.result(timeout=TASK_EXEC_TIMEOUT_SEC)
+    dt = (time.time() - t0) * 1000.0
+    _SCHED.record(PIPELINE_OP, usage["run_ms"])
+    _COSTS.record(PIPELINE_OP, usage, wall_ms=dt)
+    meta = {"op": PIPELINE_OP, "ms": dt, "usage": usage, "stages": stages}
+    if ok:
+        post_result(job_id, True, result=out, error="", meta=meta, dest=dest)
+    else:
+        post_result(job_id, False, result=None, error=out, meta=meta, dest=dest)
+
+
+def _execute_shm(job_id: str, op: str, task: Dict[str, Any], payload: Any, t0: float, dest: str) -> None:
+    """
+    Run one task over the shared-memory transport and post its result.
+
+    The pool process JSON-encodes the result once; large tasks/results travel
+    through segments, small ones as plain bytes. Segments go back to the pool once the result is posted; on timeout or
+    error they are discarded, since the pool process may still write to them.
+    """
+    segs = []
+    ok = False
+    try:
+        task_ref = None
+        raw = task.get("_raw")
+        if raw is not None:
+            seg, task_ref = _SHM_POOL.write(raw)
+            segs.append(seg)
+            payload = None
+
+        result_ref = None
+        hint = _result_size_hint.get(op, 0)
+        if hint >= SHM_MIN_BYTES:
+            seg = _SHM_POOL.acquire(hint)
+            segs.append(seg)
+            result_ref = ShmRef(seg.name, seg.size)
+
+        future = _submit(measured, run_op_shm, op, payload, task_ref, result_ref)
+        (kind, value), usage = future.result(timeout=TASK_EXEC_TIMEOUT_SEC)
+        dt = (time.time() - t0) * 1000.0
+        _SCHED.record(op, usage["run_ms"])
+        _COSTS.record(op, usage, wall_ms=dt)
+        meta = {"op": op, "ms": dt, "usage": usage, "transport": "shm" if kind == "shm" or task_ref else "json"}
+        if kind == "shm":
+            nbytes = value
+            post_result(job_id, True, error="", meta=meta, result_json=segs[-1].buf[:nbytes], dest=dest)
+        else:
+            nbytes = len(value)
+            post_result(job_id, True, error="", meta=meta, result_json=value, dest=dest)
+        _result_size_hint[op] = nbytes
+        ok = True
+    finally:
+        for seg in segs:
+            if ok:
+                _SHM_POOL.release(seg)
+            else:
+                _SHM_POOL.discard(seg)
+
+
+def execute_batch(op: str, tasks: List[Dict[str, Any]]) -> None:
+    """Run same-op tasks through the op's batch handler in one pool call."""
+    global _inflight
+    jobs = []
+    for task in tasks:
+        fields = _task_fields(task)
+        if fields is not None:
+            jobs.append(fields)
+    if not jobs:
+        return
+
+    t0 = time.time()
+    n = len(jobs)
+    with _worker_lock:
+        _inflight += n
+
+    # The items run one after another as far as the deadline is concerned.
+    timeout = TASK_EXEC_TIMEOUT_SEC * n
+    try:
+        future = _submit(measured, run_batch, op, [payload for _, _, payload, _ in jobs])
+        outs, usage = future.result(timeout=timeout)
+        dt = (time.time() - t0) * 1000.0
+        _SCHED.record(op, usage["run_ms"] / n)
+        _COSTS.record(op, usage, tasks=n, wall_ms=dt)
+        run_total = sum(ms for _, _, ms in outs) or 1.0
+        for (job_id, _, _, dest), (ok, out, ms) in zip(jobs, outs):
+            # ms is the agent-side wall time of the whole call; usage is this item's share of it.
+            share = ms / run_total
+            item = {"run_ms": round(ms, 3), "cpu_ms": round(usage.get("cpu_ms", 0.0) * share, 3)}
+            meta = {"op": op, "ms": dt, "usage": item, "batch": {"size": n, "usage": usage}}
+            if ok:
+                post_result(job_id, True, result=out, error="", meta=meta, dest=dest)
+            else:
+                post_result(job_id, False, result=None, error=str(out), meta=meta, dest=dest)
+    except FuturesTimeoutError:
+        dt = (time.time() - t0) * 1000.0
+        _SCHED.record(op, dt / n)
+        for job_id, _, _, dest in jobs:
+            post_result(job_id, False, result=None, error=f"timeout after {timeout}s",
+                        meta={"op": op, "ms": dt, "batch": {"size": n}}, dest=dest)
+    except Exception as e:
+        dt = (time.time() - t0) * 1000.0
+        for job_id, _, _, dest in jobs:
+            post_result(job_id, False, result=None, error=str(e), meta={"op": op, "ms": dt, "batch": {"size": n}},
+                        dest=dest)
+    finally:
+        with _worker_lock:
+            _inflight = max(0, _inflight - n)
+
+
+def _batch_cap() -> int:
+    """
+    Largest batch a worker should take now: an even slice of the local queue
+    per free pool process, so a burst is spread over the pool instead of
+    running in one process while the others idle. A full BATCH_MAX_SIZE when
+    no other pool process is free.
+    """
+    with _worker_lock:
+        busy = _busy_workers
+    free = min(_CPU_WORKERS, _current_workers) - busy
+    if free <= 1:
+        return BATCH_MAX_SIZE
+    return max(1, min(BATCH_MAX_SIZE, -(-len(_SCHED) // free)))
+
+
+def _fill_batch(op: str, tasks: List[Dict[str, Any]], cap: int) -> None:
+    """
+    Top up a batch to `cap` tasks with non-blocking leases for up to BATCH_WINDOW_MS.
+
+    Tasks for other ops go to the local scheduler; stops on the first miss.
+    """
+    deadline = time.time() + BATCH_WINDOW_MS / 1000.0
+    while len(tasks) < cap and time.time() < deadline and not drain_event.is_set():
+        task = _lease_any()
+        if not task:
+            return
+        if str(task.get("op") or "") == op:
+            tasks.append(task)
+        else:
+            _SCHED.put(task)
+
+
+def _dispatch(tasks: List[Dict[str, Any]], cap: int) -> None:
+    op = str(tasks[0].get("op") or "")
+    if not _is_batch_op(op):
+        for task in tasks:
+            execute_task(task)
+        return
+    if len(tasks) < cap and BATCH_WINDOW_MS > 0:
+        _fill_batch(op, tasks, cap)
+    execute_batch(op, tasks)
+
+
+def _lease_any() -> Optional[Dict[str, Any]]:
+    """
+    One non-blocking lease from the controllers that had work on their last
+    lease, tried in weighted random order (hit rate / latency). None when none
+    of them has anything; those are then left to their lease pollers.
+    """
     global _hits, _misses
-    log(f"[agent] worker-{worker_id} start", f"wstart{worker_id}", every=0.0)
+    # Identities with a full local queue wait their turn instead of leasing more.
+    hot = [c for c in _CTRLS.ready()
+           if c.cadence.hot() and _SCHED.identity_depth(c.agent) < _queue_cap(_IDENTS[c.agent])]
+    for ctrl in _CTRLS.by_weight(hot):
+        task = lease_task(ctrl, wait_ms=0)
+        if task:
+            ctrl.cadence.hit()
+            _hits += 1
+            return task
+        ctrl.cadence.cool()
+        _misses += 1
+    return None
 
-    while not stop_event.is_set():
-        task = lease_task()
+
+def _prefetch() -> None:
+    """
+    While leases keep hitting, top the local queue up to SCHED_PREFETCH tasks per
+    identity so the scheduler has a window to reorder. Stops at the first miss
+    (no idle polling).
+    """
+    while len(_SCHED) < _queue_cap() and not drain_event.is_set():
+        task = _lease_any()
+        if not task:
+            return
+        _SCHED.put(task)
+        _wake_workers()
+
+
+def _wake_workers() -> None:
+    with _work_cond:
+        _work_cond.notify_all()
+
+
+def lease_poller_loop(ctrl: Controller) -> None:
+    """
+    Long-poll one controller whenever the local queue has room. The long-poll
+    duration and the pause after a miss grow while the controller has nothing
+    and reset on a hit, which wakes the workers. Polls go through the
+    poller's own session so a drain can cut them off.
+    """
+    global _hits, _misses
+    session = _poll_sessions[ctrl.key]
+    while not stop_event.is_set() and not drain_event.is_set():
+        if not ctrl.registered or not ctrl.healthy():
+            stop_event.wait(LEASE_IDLE_MAX_SEC)
+            continue
+        if _SCHED.identity_depth(ctrl.agent) >= _queue_cap(_IDENTS[ctrl.agent]):
+            stop_event.wait(LEASE_IDLE_SEC)
+            continue
+        task = lease_task(ctrl, wait_ms=ctrl.cadence.wait_ms(), session=session)
         if task:
+            ctrl.cadence.hit()
             _hits += 1
-            execute_task(task)
+            _SCHED.put(task)
+            _wake_workers()
             continue
-
+        if session.aborted:
+            break
+        ctrl.cadence.miss()
         _misses += 1
-        # Idle wait with a touch of jitter to avoid herd behavior.
-        idle = LEASE_IDLE_SEC * (0.5 + random.random())
-        stop_event.wait(idle)
+        stop_event.wait(ctrl.cadence.idle_sec())
+
+
+def worker_loop(worker_id: int) -> None:
+    global _busy_workers
+    log(f"[agent] worker-{worker_id} start", f"wstart{worker_id}", every=0.0)
+
+    while not stop_event.is_set() and not drain_event.is_set():
+        if 0 < len(_SCHED) < _queue_cap():
+            _prefetch()
+        cap = _batch_cap()
+        tasks = _SCHED.take(_is_batch_op, cap)
+        if tasks:
+            with _worker_lock:
+                _busy_workers += 1
+            try:
+                _dispatch(tasks, cap)
+            finally:
+                with _worker_lock:
+                    _busy_workers -= 1
+            continue
+
+        # While work is flowing every worker leases for itself (non-blocking).
+        task = _lease_any()
+        if task:
+            _SCHED.put(task)
+            _wake_workers()
+            continue
+
+        # No controller has work right now: sleep until a lease poller finds some.
+        with _work_cond:
+            if not len(_SCHED) and not drain_event.is_set():
+                _work_cond.wait(LEASE_IDLE_MAX_SEC)
 
     log(f"[agent] worker-{worker_id} stop", f"wstop{worker_id}", every=0.0)
 
 
+def _stats_snapshot() -> Dict[str, Any]:
+    """What monitors see; only changes are pushed, so keep it free of timestamps."""
+    with _worker_lock:
+        inflight = _inflight
+    tasks = _TASK_STATS.summary()
+    queued = len(_SCHED)
+    registered = sum(1 for c in _CTRLS if c.registered)
+    if drain_event.is_set():
+        status = "draining"
+    elif not registered:
+        status = "disconnected"
+    elif inflight or queued or tasks["rate_10s"] > 0:
+        status = "working"
+    else:
+        status = "idle"
+    snap: Dict[str, Any] = {
+        "agents": [ident.name for ident in IDENTITIES],
+        "status": status,
+        "controllers": {"registered": registered, "total": len(_CTRLS)},
+        "workers": _current_workers,
+        "pool_workers": _CPU_WORKERS,
+        "inflight": inflight,
+        "queue": queued,
+        "journal_pending": _JOURNAL.stats()["pending"] if _JOURNAL is not None else 0,
+    }
+    snap.update(tasks)
+    return snap
+
+
+def stats_loop() -> None:
+    while not stop_event.is_set():
+        _FEED.publish(_stats_snapshot())
+        stop_event.wait(STATS_TICK_SEC)
+
+
 def _cpu_util() -> float:
     if psutil is None:
         return 0.0
@@ -303,17 +1031,15 @@ def _cpu_util() -> float:
 
 
 def scale_loop() -> None:
-    global _current_workers
-
-    while not stop_event.is_set():
+    while not stop_event.is_set() and not drain_event.is_set():
         cpu = _cpu_util()
         with _worker_lock:
             inflight = _inflight
         # Target inflight workers based on usable cores and pipeline factor
-        desired = max(CPU_MIN_WORKERS, int(max(1, USABLE_CORES) * CPU_PIPELINE_FACTOR))
+        desired = max(CPU_MIN_WORKERS, int(_CPU_WORKERS * CPU_PIPELINE_FACTOR))
         # If CPU is too hot, reduce pressure
         if cpu >= TARGET_CPU_UTIL_PCT:
-            desired = max(CPU_MIN_WORKERS, min(desired, max(1, USABLE_CORES)))
+            desired = max(CPU_MIN_WORKERS, min(desired, _CPU_WORKERS))
 
         # If we're missing a lot, reduce (idle)
         misses = _misses
@@ -343,6 +1069,8 @@ def scale_loop() -> None:
 
 
 _worker_threads: Dict[int, threading.Thread] = {}
+_poller_threads: List[threading.Thread] = []
+_poll_sessions: Dict[str, AbortableSession] = {}  # controller key -> its poller's session
 _worker_stop_flags: Dict[int, threading.Event] = {}
 
 
@@ -366,33 +1094,397 @@ def set_worker_count(n: int) -> None:
     # (If you want “true” shrink, do per-thread stop flags; for now we keep it simple.)
 
 
+def _pool_context() -> Any:
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context(POOL_START_METHOD if POOL_START_METHOD in methods else None)
+    if ctx.get_start_method() == "forkserver":
+        # The forkserver inherits our environment when it starts (on first pool process).
+        os.environ["OPS_PRELOAD"] = ",".join(OPS)
+        ctx.set_forkserver_preload(["ops_preload"])
+    return ctx
+
+
+def _start_cpu_pool(workers: int) -> ProcessPoolExecutor:
+    """Create the CPU pool and spawn + initialize every process before returning."""
+    ctx = _pool_context()
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=init_worker,
+        initargs=(list(OPS),),
+    )
+
+    pids = set()
+    deadline = time.time() + POOL_WARM_TIMEOUT_SEC
+    while len(pids) < workers and time.time() < deadline:
+        futures = [pool.submit(warm_worker, 0.05) for _ in range(workers)]
+        for f in futures:
+            pids.add(f.result(timeout=max(0.1, deadline - time.time())))
+
+    # Batch capability and load errors come from a pool process, which has the op modules imported already.
+    for name, info in pool.submit(describe_ops, list(OPS)).result(timeout=POOL_WARM_TIMEOUT_SEC).items():
+        if name not in OPS:
+            continue
+        if info["error"]:
+            # Not served (nor advertised at registration) rather than failing every task.
+            del OPS[name]
+            FAILED_OPS[name] = info["error"].strip().splitlines()[-1]
+            log(f"[agent] ERROR: op {name} failed to load, not serving it:\n{info['error'].rstrip()}",
+                f"op_fail{name}", every=0.0)
+            continue
+        OPS[name].batch = info["batch"]
+
+    log(f"[agent] cpu pool ready: {len(pids)}/{workers} processes (start_method={ctx.get_start_method()}"
+        f" batch_ops={[n for n, o in OPS.items() if o.batch]})",
+        "pool", every=0.0)
+    return pool
+
+
+def _submit(fn: Any, *args: Any) -> Any:
+    """Submit to the current CPU pool (retrying once if it was swapped out by a resize)."""
+    pool = _CPU_POOL
+    try:
+        return pool.submit(fn, *args)
+    except RuntimeError:
+        if _CPU_POOL is pool:
+            raise
+        return _CPU_POOL.submit(fn, *args)
+
+
+def _resize_cpu_pool(workers: int) -> None:
+    """
+    Replace the CPU pool with a warmed one of `workers` processes. New tasks go
+    to the new pool at once; tasks already on the old one finish there before
+    its processes exit.
+    """
+    global _CPU_POOL, _CPU_WORKERS
+
+    workers = max(1, int(workers))
+    with _cpu_pool_lock:
+        if workers == _CPU_WORKERS:
+            return
+        t0 = time.time()
+        new_pool = _start_cpu_pool(workers)
+        old_pool, old_workers = _CPU_POOL, _CPU_WORKERS
+        _CPU_POOL, _CPU_WORKERS = new_pool, workers
+    if old_pool is not None:
+        threading.Thread(target=old_pool.shutdown, kwargs={"wait": True}, daemon=True).start()
+    log(f"[agent] cpu pool resized {old_workers} -> {workers} in {(time.time() - t0) * 1000.0:.0f} ms",
+        "pool_resize", every=0.0)
+
+
+def _startup() -> None:
+    global OPS, _CPU_POOL, _SHM_POOL, _JOURNAL
+
+    t0 = time.time()
+    # One pool for every identity: each op is loaded once.
+    OPS = load_ops([name for ident in IDENTITIES for name in ident.tasks])
+    if RESULT_JOURNAL:
+        _JOURNAL = ResultJournal(RESULT_JOURNAL_PATH, RESULT_JOURNAL_MAX_BYTES, RESULT_JOURNAL_FSYNC_MS)
+        pending = _JOURNAL.stats()["pending"]
+        if pending:
+            log(f"[agent] journal has {pending} unacknowledged results from a previous run", "journal", every=0.0)
+    t1 = time.time()
+    if SHM_TRANSPORT:
+        _SHM_POOL = SegmentPool(SHM_MIN_BYTES, SHM_POOL_MAX_BYTES)
+    _CPU_POOL = _start_cpu_pool(_CPU_WORKERS)
+    t2 = time.time()
+
+    proc_start = t0
+    if psutil is not None:
+        try:
+            proc_start = psutil.Process().create_time()
+        except Exception:
+            pass
+
+    STARTUP.update({
+        "ops": list(OPS),
+        "failed_ops": dict(FAILED_OPS),
+        "pool_workers": _CPU_WORKERS,
+        "load_ops_ms": round((t1 - t0) * 1000.0, 1),
+        "pool_warm_ms": round((t2 - t1) * 1000.0, 1),
+        "total_ms": round((t2 - proc_start) * 1000.0, 1),
+    })
+    log(f"[agent] startup ready in {STARTUP['total_ms']:.0f} ms "
+        f"(load_ops={STARTUP['load_ops_ms']:.0f} ms pool_warm={STARTUP['pool_warm_ms']:.0f} ms ops={list(OPS)})",
+        "startup", every=0.0)
+
+
+def _leave(released: List[Tuple[str, str]]) -> None:
+    """Tell every controller we are leaving, handing back the jobs it issued ((dest, job_id) keys)."""
+    by_dest = _released_by_dest(released)
+    for ctrl in _CTRLS:
+        if not ctrl.registered:
+            continue
+        ids = by_dest.get(ctrl.key, []) + (by_dest.get("", []) if ctrl is _CTRLS.primary else [])
+        payload = {"agent": ctrl.agent, "released": ids, "ts": time.time()}
+        try:
+            r = _post_json(ctrl.url("/agents/leave"), payload)
+            r.raise_for_status()
+        except Exception as e:
+            log(f"[agent] leave error at {ctrl.key}: {e}", f"leave_err{ctrl.key}", every=0.0)
+
+
+def _queued_keys() -> List[Tuple[str, str]]:
+    return [_job_key(str(t.get("_controller") or ""), str(t.get("job_id") or t.get("id")))
+            for t in _SCHED.drain() if t.get("job_id") or t.get("id")]
+
+
+def _drain() -> None:
+    """
+    Zero-loss shutdown: no new leases, finish in-flight tasks until the deadline,
+    flush results, then hand back whatever did not run and leave.
+    """
+    t0 = time.time()
+    log(f"[agent] draining (deadline {DRAIN_DEADLINE_SEC:.0f}s)", "drain", every=0.0)
+
+    # Nothing new starts once drain_event is set; buffered tasks go straight back.
+    released = _queued_keys()
+    _wake_workers()
+    # Cut off held long-polls instead of sitting them out.
+    for session in _poll_sessions.values():
+        session.abort()
+
+    # Worker loops exit after their current task completes, lease pollers once their poll returns.
+    deadline = t0 + DRAIN_DEADLINE_SEC
+    while time.time() < deadline and not stop_event.is_set():
+        threads = list(_worker_threads.values()) + _poller_threads
+        if not any(t.is_alive() for t in threads):
+            break
+        stop_event.wait(0.1)
+    # Leave only once no poll can still hand us a lease the controller would not get back.
+    for t in _poller_threads:
+        t.join(HTTP_TIMEOUT)
+
+    # Leases that landed during the drain, and anything still running past the deadline;
+    # the latter keep running in the pool, but post_result drops their results from here on.
+    released += _queued_keys()
+    released += _JOBS.release_running()
+
+    if _JOURNAL is not None:
+        flush_deadline = time.time() + DRAIN_FLUSH_SEC
+        _replay_wakeup.set()
+        # Results parked for controllers that are no longer configured cannot be flushed; do not wait for them.
+        while (any(_controller(d) is not None for d in _JOURNAL.pending_by_dest())
+               and time.time() < flush_deadline and not stop_event.is_set()):
+            stop_event.wait(0.1)
+        pending = _JOURNAL.stats()["pending"]
+        if pending:
+            log(f"[agent] drain: {pending} results stay in the journal for the next start", "drain_j", every=0.0)
+
+    _leave(released)
+    log(f"[agent] drained in {time.time() - t0:.1f}s (released={len(released)})", "drained", every=0.0)
+
+
+# ---------------- admin socket ----------------
+
+# Settings the admin socket can change at runtime: name -> (type, minimum,
+# maximum or None). The rest of the environment is read once at startup.
+_TUNABLES: Dict[str, Tuple[type, float, Optional[float]]] = {
+    "CPU_POOL_WORKERS": (int, 0, None),  # 0 = one per usable core
+    "CPU_MIN_WORKERS": (int, 1, None),
+    "CPU_PIPELINE_FACTOR": (float, 0.1, None),
+    "TARGET_CPU_UTIL_PCT": (float, 1.0, 100.0),
+    "SCALE_TICK_SEC": (float, 0.1, None),
+    "WAIT_MS": (int, 0, None),
+    "LEASE_WAIT_MAX_MS": (int, 0, None),
+    "LEASE_IDLE_SEC": (float, 0.01, None),
+    "LEASE_IDLE_MAX_SEC": (float, 0.01, None),
+    "HEARTBEAT_SEC": (float, 1.0, None),
+    "HTTP_TIMEOUT": (float, 0.5, None),
+    "TASK_EXEC_TIMEOUT_SEC": (float, 1.0, None),
+    "BATCH_MAX_SIZE": (int, 1, None),
+    "BATCH_WINDOW_MS": (float, 0.0, None),  # 0 = no topping up
+    "SCHED_EWMA_ALPHA": (float, 0.01, 1.0),
+    "SCHED_AGING": (float, 0.0, None),
+    "SCHED_PRIORITY_MS": (float, 0.0, None),
+    "SCHED_PREFETCH": (int, 1, None),
+    "DRAIN_DEADLINE_SEC": (float, 0.0, None),
+    "DRAIN_FLUSH_SEC": (float, 0.0, None),
+}
+_CADENCE_TUNABLES = {"WAIT_MS", "LEASE_WAIT_MAX_MS", "LEASE_IDLE_SEC", "LEASE_IDLE_MAX_SEC"}
+_SCHED_TUNABLES = {"SCHED_EWMA_ALPHA", "SCHED_AGING", "SCHED_PRIORITY_MS"}
+_RUNNING_TTL_TUNABLES = {"TASK_EXEC_TIMEOUT_SEC", "BATCH_MAX_SIZE"}
+
+
+def _tunable_values() -> Dict[str, Any]:
+    return {name: _CPU_WORKERS if name == "CPU_POOL_WORKERS" else globals()[name] for name in _TUNABLES}
+
+
+def _parse_tunables(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Check and convert tunable values; raises ValueError without changing anything."""
+    parsed: Dict[str, Any] = {}
+    for name, raw in values.items():
+        spec = _TUNABLES.get(name)
+        if spec is None:
+            raise ValueError(f"{name} is not a runtime tunable")
+        kind, lo, hi = spec
+        try:
+            value = int(float(raw)) if kind is int else kind(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: expected {kind.__name__}, got {raw!r}")
+        if not math.isfinite(value) or value < lo or (hi is not None and value > hi):
+            limits = f"between {lo} and {hi}" if hi is not None else f">= {lo}"
+            raise ValueError(f"{name} must be {limits}, got {value}")
+        parsed[name] = value
+    if "CPU_POOL_WORKERS" in parsed and (drain_event.is_set() or stop_event.is_set()):
+        raise ValueError("CPU_POOL_WORKERS cannot change while draining")
+    return parsed
+
+
+def _apply_tunables(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply values from _parse_tunables(); returns the tunables now in effect."""
+    parsed = dict(parsed)
+    before = _tunable_values()
+    pool_workers = parsed.pop("CPU_POOL_WORKERS", None)
+    globals().update(parsed)
+    if _CADENCE_TUNABLES & parsed.keys():
+        for ctrl in _CTRLS:
+            ctrl.cadence.tune(WAIT_MS, LEASE_WAIT_MAX_MS, LEASE_IDLE_SEC, LEASE_IDLE_MAX_SEC)
+    if _SCHED_TUNABLES & parsed.keys():
+        _SCHED.tune(SCHED_EWMA_ALPHA, SCHED_AGING, SCHED_PRIORITY_MS)
+    if _RUNNING_TTL_TUNABLES & parsed.keys():
+        _JOBS.running_ttl_sec = _running_ttl_sec()
+    if pool_workers is not None:
+        _resize_cpu_pool(pool_workers or max(1, USABLE_CORES))
+        if CPU_MIN_WORKERS > _current_workers:
+            set_worker_count(CPU_MIN_WORKERS)
+
+    after = _tunable_values()
+    for name, value in after.items():
+        if before[name] != value:
+            log(f"[agent] admin: {name} {before[name]} -> {value}", f"admin_{name}", every=0.0)
+    return after
+
+
+def _set_tunables(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate all of `values`, then apply them; returns the tunables now in effect."""
+    return _apply_tunables(_parse_tunables(values))
+
+
+def _admin_stats() -> Dict[str, Any]:
+    with _worker_lock:
+        inflight = _inflight
+    return {
+        "agents": [ident.name for ident in IDENTITIES],
+        "draining": drain_event.is_set(),
+        "workers": _current_workers,
+        "pool_workers": _CPU_WORKERS,
+        "inflight": inflight,
+        "hits": _hits,
+        "misses": _misses,
+        "cpu_util": _cpu_util(),
+        "queued": _SCHED.depths(),
+        "expected_ms": _SCHED.model(),
+        "shares": _SCHED.shares(),
+        "op_costs": _COSTS.snapshot(),
+        "tasks": _TASK_STATS.summary(),
+        "controllers": _CTRLS.stats(),
+        "dedupe": _JOBS.stats(),
+        "journal": _JOURNAL.stats() if _JOURNAL is not None else None,
+        "shm": _SHM_POOL.stats() if _SHM_POOL is not None else None,
+        "startup": STARTUP,
+    }
+
+
+def _admin(req: Dict[str, Any]) -> Dict[str, Any]:
+    """Admin socket handler; errors raised here are answered as {"ok": false, "error": ...}."""
+    cmd = req.get("cmd")
+    if cmd == "get":
+        return {"ok": True, "values": _tunable_values()}
+    if cmd == "stats":
+        return {"ok": True, "stats": _admin_stats()}
+    if cmd == "set":
+        values = req.get("values")
+        if not isinstance(values, dict) or not values:
+            raise ValueError("set needs a non-empty 'values' object")
+        return {"ok": True, "values": _set_tunables(values)}
+    if cmd == "pool":
+        if "workers" not in req:
+            raise ValueError("pool needs 'workers'")
+        return {"ok": True, "values": _set_tunables({"CPU_POOL_WORKERS": req["workers"]})}
+    if cmd == "reload":
+        import load_env
+
+        values = load_env.read_env()
+        if values is None:
+            raise ValueError(f"{load_env.ENV_FILE} not found")
+        # Same precedence as at startup: variables the agent was started with win.
+        values = load_env.from_file(values)
+        # Validate before anything is written to os.environ; a bad file changes nothing.
+        parsed = _parse_tunables({k: v for k, v in values.items() if k in _TUNABLES})
+        changed = sorted(k for k, v in values.items() if k not in _TUNABLES and os.environ.get(k) != v)
+        load_env.apply_env(values)
+        # Changed non-tunables are in os.environ now but only take effect on restart.
+        return {"ok": True, "values": _apply_tunables(parsed), "restart_required": changed}
+    raise ValueError(f"unknown command {cmd!r} (get, stats, set, pool, reload)")
+
+
 def shutdown(signum: int, frame: Any) -> None:
     log(f"[agent] shutdown signal {signum}", "shutdown", every=0.0)
-    stop_event.set()
+    if drain_event.is_set() or _current_workers == 0:
+        # Second signal, or nothing started yet: stop now.
+        stop_event.set()
+    else:
+        drain_event.set()
 
 
 def main() -> int:
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
 
-    _probe_prefix()
+    _startup()
 
-    # Register (retry loop)
-    while not stop_event.is_set():
+    admin: Optional[AdminServer] = None
+    if ADMIN_SOCKET.strip().lower() not in ("", "0", "off", "false", "no"):
+        admin = AdminServer(ADMIN_SOCKET, _admin)
         try:
-            register()
-            break
+            admin.start()
+            log(f"[agent] admin socket at {ADMIN_SOCKET}", "admin", every=0.0)
         except Exception as e:
-            log(f"[agent] register error: {e}", "reg_err", every=2.0)
-            stop_event.wait(2.0)
+            log(f"[agent] admin socket disabled: {e}", "admin", every=0.0)
+            admin = None
+
+    stats_server: Optional[StatsServer] = None
+    if STATS_HTTP.lower() not in ("", "0", "off", "false", "no"):
+        stats_server = StatsServer(STATS_HTTP, _FEED)
+        try:
+            stats_server.start()
+            threading.Thread(target=stats_loop, daemon=True).start()
+            log(f"[agent] stats feed at http://{STATS_HTTP}/stats", "stats_http", every=0.0)
+        except Exception as e:
+            log(f"[agent] stats feed disabled: {e}", "stats_http", every=0.0)
+            stats_server = None
+
+    # Register (retry loop) until at least one controller accepts us; the
+    # heartbeat loop keeps registering with the rest as they come up.
+    while not stop_event.is_set():
+        if _register_pending():
+            break
+        stop_event.wait(2.0)
 
     if stop_event.is_set():
+        if admin is not None:
+            admin.close()
+        if stats_server is not None:
+            stats_server.close()
         return 1
 
     # Heartbeat
     hb = threading.Thread(target=heartbeat_loop, daemon=True)
     hb.start()
 
+    # One long-poller per controller
+    for ctrl in _CTRLS:
+        _poll_sessions[ctrl.key] = AbortableSession()
+        t = threading.Thread(target=lease_poller_loop, args=(ctrl,), daemon=True)
+        _poller_threads.append(t)
+        t.start()
+
+    if _JOURNAL is not None:
+        threading.Thread(target=journal_replay_loop, daemon=True).start()
+        _replay_wakeup.set()
+
     # Start initial workers
     set_worker_count(1)
 
@@ -401,14 +1493,29 @@ def main() -> int:
     scaler.start()
 
     # Keep main alive
-    while not stop_event.is_set():
+    while not stop_event.is_set() and not drain_event.is_set():
         stop_event.wait(0.5)
 
-    # Shutdown pool
+    if not stop_event.is_set():
+        _drain()
+    stop_event.set()
+    if admin is not None:
+        admin.close()
+    if stats_server is not None:
+        stats_server.close()
+
+    # Shutdown pool; tasks still running past the drain deadline were handed back.
     try:
-        _CPU_POOL.shutdown(wait=False, cancel_futures=True)
+        if _CPU_POOL is not None:
+            _CPU_POOL.shutdown(wait=False, cancel_futures=True)
+            for proc in list((getattr(_CPU_POOL, "_processes", None) or {}).values()):
+                proc.terminate()
     except Exception:
         pass
+    if _SHM_POOL is not None:
+        _SHM_POOL.close()
+    if _JOURNAL is not None:
+        _JOURNAL.close()
 
     return 0
 
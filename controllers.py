@@ -0,0 +1,150 @@
+"""
+controllers.py
+
+The set of controllers an agent serves, with per-endpoint health and load
+statistics.
+
+A Controller is one (agent identity, controller URL) pair: an agent serving
+several identities (identities.py) registers each of them separately, even
+with the same controller. Its `key` tags the tasks it issued so results,
+journal entries and drain hand-backs go to the same pair.
+
+Each Controller keeps:
+
+- its probed API prefix and whether its identity is registered there;
+- its own LeaseCadence (long-poll / idle backoff state);
+- a circuit breaker: consecutive request errors take it out of rotation for
+  an exponentially growing interval (half-open again once it elapses);
+- EWMAs of request latency and lease hit rate, which weight how often the
+  workers' non-blocking leases go to it.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from lease_cadence import LeaseCadence
+
+_EWMA_ALPHA = 0.2
+
+
+class Controller:
+    def __init__(self, base_url: str, api_prefix: str, cadence: LeaseCadence,
+                 fail_backoff_sec: float, fail_backoff_max_sec: float, agent: str = ""):
+        self.base_url = base_url.rstrip("/")
+        self.agent = agent
+        self.key = f"{agent}@{self.base_url}" if agent else self.base_url
+        self.api_prefix = api_prefix
+        self.cadence = cadence
+        self.registered = False
+        self.fail_backoff_sec = max(0.1, float(fail_backoff_sec))
+        self.fail_backoff_max_sec = max(self.fail_backoff_sec, float(fail_backoff_max_sec))
+
+        self._lock = threading.Lock()
+        self._failures = 0  # consecutive
+        self._down_until = 0.0
+        self.latency_ms: Optional[float] = None
+        self.hit_rate = 0.5
+        self.errors = 0
+
+    def url(self, path: str) -> str:
+        if not path.startswith("/"):
+            path = "/" + path
+        return f"{self.base_url}{self.api_prefix}{path}"
+
+    # ---------------- health ----------------
+
+    def healthy(self) -> bool:
+        with self._lock:
+            return time.time() >= self._down_until
+
+    def ok(self, ms: Optional[float] = None) -> None:
+        """A request succeeded; `ms` is its latency when it was not a held long-poll."""
+        with self._lock:
+            self._failures = 0
+            self._down_until = 0.0
+            if ms is not None:
+                prev = self.latency_ms
+                self.latency_ms = ms if prev is None else prev + _EWMA_ALPHA * (ms - prev)
+
+    def fail(self) -> float:
+        """A request failed; returns how long the controller is now out of rotation."""
+        with self._lock:
+            self._failures += 1
+            self.errors += 1
+            backoff = min(self.fail_backoff_max_sec, self.fail_backoff_sec * (1 << min(self._failures - 1, 20)))
+            self._down_until = time.time() + backoff
+            return backoff
+
+    def lease_outcome(self, hit: bool) -> None:
+        with self._lock:
+            self.hit_rate += _EWMA_ALPHA * ((1.0 if hit else 0.0) - self.hit_rate)
+
+    # ---------------- load spreading ----------------
+
+    def weight(self) -> float:
+        """Share of non-blocking leases: higher hit rate and lower latency attract more."""
+        with self._lock:
+            latency = self.latency_ms if self.latency_ms is not None else 10.0
+            return (self.hit_rate + 0.05) / (latency + 1.0)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            out: Dict[str, object] = {
+                "url": self.base_url,
+                "agent": self.agent,
+                "registered": self.registered,
+                "healthy": time.time() >= self._down_until,
+                "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 2),
+                "hit_rate": round(self.hit_rate, 3),
+                "errors": self.errors,
+            }
+        out["cadence"] = self.cadence.stats()
+        return out
+
+
+class ControllerSet:
+    def __init__(self, endpoints: List[Tuple[str, str]], api_prefix: str, make_cadence: Callable[[], LeaseCadence],
+                 fail_backoff_sec: float, fail_backoff_max_sec: float):
+        """`endpoints` are (agent name, controller URL) pairs; the first one is the primary."""
+        seen: List[Tuple[str, str]] = []
+        for agent, u in endpoints:
+            u = u.strip().rstrip("/")
+            if u and (agent, u) not in seen:
+                seen.append((agent, u))
+        if not seen:
+            raise ValueError("no controller URL configured")
+        self._ctrls = [Controller(u, api_prefix, make_cadence(), fail_backoff_sec, fail_backoff_max_sec, agent)
+                       for agent, u in seen]
+        self._by_key = {c.key: c for c in self._ctrls}
+
+    def __iter__(self) -> Iterator[Controller]:
+        return iter(self._ctrls)
+
+    def __len__(self) -> int:
+        return len(self._ctrls)
+
+    @property
+    def primary(self) -> Controller:
+        return self._ctrls[0]
+
+    def get(self, key: str) -> Optional[Controller]:
+        """Controller by key, or None if no configured controller has it."""
+        return self._by_key.get(key)
+
+    def ready(self) -> List[Controller]:
+        """Registered, healthy controllers."""
+        return [c for c in self._ctrls if c.registered and c.healthy()]
+
+    @staticmethod
+    def by_weight(ctrls: List[Controller]) -> List[Controller]:
+        """Weighted random order (Efraimidis-Spirakis): heavier controllers tend to come first."""
+        if len(ctrls) < 2:
+            return list(ctrls)
+        keyed = [(random.random() ** (1.0 / max(1e-9, c.weight())), c) for c in ctrls]
+        keyed.sort(key=lambda kc: kc[0], reverse=True)
+        return [c for _, c in keyed]
+
+    def stats(self) -> List[Dict[str, object]]:
+        return [c.stats() for c in self._ctrls]
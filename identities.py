@@ -0,0 +1,129 @@
+"""
+identities.py
+
+Agent identities served by one agent process.
+
+Every identity registers with its own controllers under its own agent name,
+task list and labels. All identities share the agent's single CPU pool (one
+set of processes, one import of each op) and its local scheduler, which
+splits pool time between them in proportion to their `share`.
+
+AGENT_IDENTITIES is a JSON list (or "@/path/to/file.json"):
+
+    [{"name": "gpu-box-etl", "tasks": "csv_shard,map_summarize", "share": 2},
+     {"name": "gpu-box-nlp", "tasks": ["map_classify"], "labels": {"team": "nlp"},
+      "controllers": "http://nlp-controller:8080"}]
+
+Fields other than `name` default to the agent's own TASKS, AGENT_LABELS and
+CONTROLLER_URLS, and share 1. Without AGENT_IDENTITIES the agent serves one
+identity built from AGENT_NAME and those settings.
+"""
+
+import json
+from typing import Any, Dict, List
+
+
+def _split(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    out: List[str] = []
+    for v in value or []:
+        v = str(v).strip()
+        if v and v not in out:
+            out.append(v)
+    return out
+
+
+def parse_labels(raw: Any) -> Dict[str, Any]:
+    """Labels as a JSON object, or simple "k=v,k2=v2"."""
+    if isinstance(raw, dict):
+        return dict(raw)
+    raw = str(raw or "").strip()
+    if not raw:
+        return {}
+    try:
+        labels = json.loads(raw)
+        if isinstance(labels, dict):
+            return labels
+    except Exception:
+        pass
+    out: Dict[str, Any] = {}
+    for part in raw.split(","):
+        part = part.strip()
+        if not part or "=" not in part:
+            continue
+        k, v = part.split("=", 1)
+        out[k.strip()] = v.strip()
+    return out
+
+
+def check_name(name: str) -> str:
+    """An agent name is sent in URLs and keys: printable, no whitespace. Raises ValueError."""
+    if not name:
+        raise ValueError("empty agent name")
+    bad = [c for c in name if c.isspace() or not c.isprintable()]
+    if bad:
+        raise ValueError(f"agent name {name!r} contains whitespace or control characters")
+    return name
+
+
+class Identity:
+    def __init__(self, name: str, tasks: List[str], labels: Dict[str, Any], controllers: List[str],
+                 share: float = 1.0):
+        self.name = name
+        self.tasks = tasks
+        self.labels = labels
+        self.controllers = [u.rstrip("/") for u in controllers]
+        self.share = share
+
+    def __repr__(self) -> str:
+        return f"<Identity {self.name} tasks={self.tasks} share={self.share}>"
+
+
+def load_identities(raw: str, name: str, tasks: List[str], labels: Dict[str, Any],
+                    controllers: List[str]) -> List[Identity]:
+    """
+    Parse AGENT_IDENTITIES; the other arguments are the agent-wide defaults.
+
+    Raises ValueError on a malformed list, a missing, duplicate or invalid
+    name (see check_name()), an identity without tasks or controllers, or a
+    share that is not positive.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return [Identity(check_name(name), list(tasks), dict(labels), list(controllers))]
+    if raw.startswith("@"):
+        with open(raw[1:], "r", encoding="utf-8") as f:
+            raw = f.read()
+    try:
+        entries = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"AGENT_IDENTITIES is not valid JSON: {e}")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("AGENT_IDENTITIES must be a non-empty JSON list")
+
+    out: List[Identity] = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"AGENT_IDENTITIES[{i}] is not an object")
+        ident_name = str(entry.get("name") or "").strip()
+        if not ident_name:
+            raise ValueError(f"AGENT_IDENTITIES[{i}] has no name")
+        check_name(ident_name)
+        if any(o.name == ident_name for o in out):
+            raise ValueError(f"duplicate identity name {ident_name!r}")
+        ident_tasks = _split(entry["tasks"]) if "tasks" in entry else list(tasks)
+        ident_ctrls = _split(entry["controllers"]) if "controllers" in entry else list(controllers)
+        if not ident_tasks:
+            raise ValueError(f"identity {ident_name!r} has no tasks")
+        if not ident_ctrls:
+            raise ValueError(f"identity {ident_name!r} has no controllers")
+        try:
+            share = float(entry.get("share", 1.0))
+        except (TypeError, ValueError):
+            share = 0.0
+        if share <= 0:
+            raise ValueError(f"identity {ident_name!r}: share must be a positive number")
+        ident_labels = parse_labels(entry["labels"]) if "labels" in entry else dict(labels)
+        out.append(Identity(ident_name, ident_tasks, ident_labels, ident_ctrls, share))
+    return out
@@ -0,0 +1,172 @@
+"""
+job_dedupe.py
+
+Bounded, time-windowed index of recently seen job_ids.
+
+The controller re-leases a job when a heartbeat or result post is late. The
+agent records every job_id it starts here:
+
+- a duplicate lease of a job that is still running attaches to the running
+  execution (its single result post answers both leases);
+- a duplicate lease of a successfully finished job gets the stored result
+  body re-sent instead of recomputing it. Failed jobs are forgotten, so a
+  re-lease runs them again.
+
+Finished entries expire after a TTL and are evicted oldest-first when the
+stored result bodies exceed a byte cap or the entry count exceeds its cap.
+Running entries are never evicted by the caps; they only expire after
+`running_ttl_sec` in case a finish was somehow missed.
+
+On leave, release_running() hands the still-running jobs back: their entries
+are marked released, and finish()/forget() report that their result must not
+be posted, since the controller leases them to someone else.
+
+Keys can be any hashable; the agent uses (controller key, job_id) pairs since
+job_ids are only unique per controller.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+NEW = "new"
+RUNNING = "running"
+DONE = "done"
+RELEASED = "released"
+
+
+class _Entry:
+    __slots__ = ("state", "ts", "body", "attached")
+
+    def __init__(self, state: str, ts: float):
+        self.state = state
+        self.ts = ts
+        self.body: Optional[bytes] = None
+        self.attached = 0
+
+
+class JobIndex:
+    def __init__(self, ttl_sec: float, max_bytes: int, max_entries: int, running_ttl_sec: float):
+        self.ttl_sec = max(0.0, float(ttl_sec))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        self.running_ttl_sec = max(self.ttl_sec, float(running_ttl_sec))
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()  # oldest first
+        self._running: "OrderedDict[Hashable, None]" = OrderedDict()  # running/released, in begin order
+        self._bytes = 0
+        self.attached = 0
+        self.resent = 0
+
+    def begin(self, job_id: Hashable) -> Tuple[str, Optional[bytes]]:
+        """
+        Record a lease of `job_id`.
+
+        Returns (NEW, None) when the job should run, (RUNNING, None) when it is
+        already running here, or (DONE, body) with the stored result body.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(job_id)
+            if entry is None:
+                self._entries[job_id] = _Entry(RUNNING, now)
+                self._running[job_id] = None
+                self._evict()
+                return NEW, None
+            if entry.state != DONE:
+                entry.attached += 1
+                self.attached += 1
+                return RUNNING, None
+            self.resent += 1
+            return DONE, entry.body
+
+    def finish(self, job_id: Hashable, body: bytes) -> bool:
+        """Store the result body of a job started with begin(). False if the job was released."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is not None and entry.state == RELEASED:
+                return False
+            if entry is None or entry.state != RUNNING:
+                return True
+            entry.state = DONE
+            entry.ts = now
+            del self._running[job_id]
+            entry.body = bytes(body)
+            self._bytes += len(entry.body)
+            self._entries.move_to_end(job_id)
+            self._evict()
+            return True
+
+    def forget(self, job_id: Hashable) -> bool:
+        """Drop a job (e.g. it never produced a result) so a re-lease runs it again. False if it was released."""
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                return True
+            if entry.state == RELEASED:
+                return False
+            self._drop(job_id)
+            return True
+
+    def running_ids(self) -> List[Hashable]:
+        """job_ids started but not finished yet."""
+        with self._lock:
+            return [k for k, e in self._entries.items() if e.state == RUNNING]
+
+    def release_running(self) -> List[Hashable]:
+        """Mark every running job as handed back and return their job_ids."""
+        with self._lock:
+            released = [k for k, e in self._entries.items() if e.state == RUNNING]
+            for job_id in released:
+                self._entries[job_id].state = RELEASED
+            return released
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            running = sum(1 for e in self._entries.values() if e.state == RUNNING)
+            released = sum(1 for e in self._entries.values() if e.state == RELEASED)
+            return {
+                "entries": len(self._entries),
+                "running": running,
+                "released": released,
+                "bytes": self._bytes,
+                "attached": self.attached,
+                "resent": self.resent,
+            }
+
+    # ---------------- eviction (called with _lock held) ----------------
+
+    def _drop(self, job_id: Hashable) -> None:
+        entry = self._entries.pop(job_id)
+        self._running.pop(job_id, None)
+        if entry.body is not None:
+            self._bytes -= len(entry.body)
+
+    def _expire(self, now: float) -> None:
+        # Running and released entries, oldest begin first, each with running_ttl_sec.
+        while self._running:
+            job_id = next(iter(self._running))
+            if now - self._entries[job_id].ts < self.running_ttl_sec:
+                break
+            self._drop(job_id)
+        # Done entries are ordered by finish time (finish moves them to the end).
+        expired = []
+        for job_id, entry in self._entries.items():
+            if entry.state != DONE:
+                continue
+            if now - entry.ts < self.ttl_sec:
+                break
+            expired.append(job_id)
+        for job_id in expired:
+            self._drop(job_id)
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            victim = next((k for k, e in self._entries.items() if e.state == DONE), None)
+            if victim is None:
+                return
+            self._drop(victim)
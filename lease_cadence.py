@@ -0,0 +1,82 @@
+"""
+lease_cadence.py
+
+Adaptive lease cadence for the idle poller.
+
+Each consecutive empty lease doubles both the long-poll duration sent to the
+controller (`wait_ms`) and the pause before the next poll, up to their caps;
+the first hit resets both to the base values. A long-poll returns as soon as
+the controller has work, so a longer `wait_ms` costs no pickup latency; it
+only means fewer requests while the fleet is idle. The pause between polls
+is kept short (capped) because work that arrives during it waits for it.
+"""
+
+import random
+import threading
+from typing import Dict
+
+
+class LeaseCadence:
+    def __init__(self, base_wait_ms: int, max_wait_ms: int, base_idle_sec: float, max_idle_sec: float):
+        self._lock = threading.Lock()
+        self.tune(base_wait_ms, max_wait_ms, base_idle_sec, max_idle_sec)
+        self._misses = 0  # consecutive
+        self.polls = 0
+        self.hits = 0
+
+    def tune(self, base_wait_ms: int, max_wait_ms: int, base_idle_sec: float, max_idle_sec: float) -> None:
+        """(Re)set the cadence limits; the current idle streak is kept."""
+        with self._lock:
+            self.base_wait_ms = max(0, int(base_wait_ms))
+            self.max_wait_ms = max(self.base_wait_ms, int(max_wait_ms))
+            self.base_idle_sec = max(0.0, float(base_idle_sec))
+            self.max_idle_sec = max(self.base_idle_sec, float(max_idle_sec))
+
+    @staticmethod
+    def _grow(base: float, cap: float, steps: int) -> float:
+        # base * 2**steps, without overflowing for long idle stretches
+        return min(cap, base * (1 << min(max(0, steps), 20)))
+
+    def wait_ms(self) -> int:
+        """Long-poll duration for the next lease."""
+        with self._lock:
+            if not self.base_wait_ms:
+                return 0
+            return int(self._grow(self.base_wait_ms, self.max_wait_ms, self._misses))
+
+    def idle_sec(self) -> float:
+        """
+        Pause after a miss, with jitter so a fleet does not poll in lockstep.
+        Jitter only shortens the pause, and never below the base interval.
+        """
+        with self._lock:
+            # Called after miss(): the first miss pauses for the base interval.
+            pause = self._grow(self.base_idle_sec, self.max_idle_sec, self._misses - 1)
+            floor = max(self.base_idle_sec, pause / 2)
+        return floor + (pause - floor) * random.random()
+
+    def hit(self) -> None:
+        with self._lock:
+            self._misses = 0
+            self.polls += 1
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self._misses += 1
+            self.polls += 1
+
+    def cool(self) -> None:
+        """A non-blocking lease missed: the controller is idle, but do not grow the backoff for it."""
+        with self._lock:
+            self._misses = max(self._misses, 1)
+            self.polls += 1
+
+    def hot(self) -> bool:
+        """True while the last lease got a task (the controller has work)."""
+        with self._lock:
+            return self._misses == 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"polls": self.polls, "hits": self.hits, "idle_streak": self._misses}
@@ -5,31 +5,65 @@ Reads agent.env if it exists, otherwise uses system environment variables
 
 import os
 from pathlib import Path
+from typing import Dict, Optional
 
+ENV_FILE = Path(__file__).parent / "agent.env"
 
-def load_env():
-    """Load configuration from agent.env file if it exists"""
-    env_file = Path(__file__).parent / "agent.env"
-    
-    if env_file.exists():
-        print(f"[config] Loading configuration from {env_file}")
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                    
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    # Only set if not already in environment
-                    if key not in os.environ:
-                        os.environ[key] = value
-                        print(f"[config] Set {key}={value}")
-    else:
+# Variables the process was started with; these win over agent.env, also on reload.
+_PROCESS_ENV = frozenset(os.environ)
+
+
+def read_env() -> Optional[Dict[str, str]]:
+    """Parse agent.env into a dict without touching the environment; None if there is no file."""
+    env_file = ENV_FILE
+    if not env_file.exists():
+        return None
+
+    values: Dict[str, str] = {}
+    with open(env_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            if '=' in line:
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip()
+    return values
+
+
+def from_file(values: Dict[str, str]) -> Dict[str, str]:
+    """The entries of `values` that agent.env may set: those not in the process's own environment."""
+    return {key: value for key, value in values.items() if key not in _PROCESS_ENV}
+
+
+def apply_env(values: Dict[str, str], override: bool = False) -> None:
+    """
+    Copy `values` into os.environ. Unless `override`, variables the process
+    was started with win, so a reload keeps the startup precedence.
+    """
+    if not override:
+        values = from_file(values)
+    for key, value in values.items():
+        if os.environ.get(key) != value:
+            os.environ[key] = value
+            print(f"[config] Set {key}={value}")
+
+
+def load_env(override: bool = False) -> Dict[str, str]:
+    """
+    Load configuration from agent.env file if it exists.
+
+    By default variables already in the environment win; with override=True
+    the file's values replace them. Returns the values read.
+    """
+    values = read_env()
+    if values is None:
         print(f"[config] No agent.env found, using system environment variables")
+        return {}
+    print(f"[config] Loading configuration from {ENV_FILE}")
+    apply_env(values, override)
+    return values
 
 
 # Load on import
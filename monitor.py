@@ -2,23 +2,45 @@ import pystray
 from pystray import MenuItem as item
 from PIL import Image, ImageDraw
 import requests
+import json
+import os
 import time
 import threading
 
 # Configuration
-CONTROLLER_URL = "http://localhost:8080/stats"
-REFRESH_RATE = 2.0  # Seconds
+# Agent-local stats feed (STATS_HTTP in app.py); a controller /stats URL works too.
+STATS_URL = os.getenv("MONITOR_URL", "http://127.0.0.1:8099/stats")
+# auto: SSE (STATS_URL + "/stream"), else long-poll, else conditional polling
+MODE = os.getenv("MONITOR_MODE", "auto").strip().lower()
+REFRESH_RATE = float(os.getenv("MONITOR_REFRESH_SEC", "2.0"))  # conditional polling only
+LONG_POLL_SEC = 25
+RETRY_MAX_SEC = 30.0
+
+COLORS = {
+    "working": "cyan",
+    "idle": "lime",
+    "draining": "orange",
+    "disconnected": "red",
+}
 
 # Global State
 state = {
     "agents": 0,
     "queue": 0,
     "rate": 0.0,
+    "latency": None,
     "status": "disconnected"
 }
 
+session = requests.Session()
+
+
+class Unsupported(Exception):
+    """The stats endpoint does not speak this mode."""
+
+
 def create_image(color):
-    """Generates a simple colored dot icon on the fly."""
+    """Draws a simple colored dot icon."""
     width = 64
     height = 64
     image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
@@ -26,57 +48,148 @@ def create_image(color):
     dc.ellipse((8, 8, 56, 56), fill=color)
     return image
 
-def get_stats():
-    """Polls the swarm controller."""
-    try:
-        response = requests.get(CONTROLLER_URL, timeout=1)
-        data = response.json()
-        
-        state["agents"] = data.get("agents_online", 0)
-        state["queue"] = data.get("queue_len", 0)
-        state["rate"] = data.get("rate_60s", 0.0)
-        
-        # Determine Status Color
-        if state["queue"] > 0 or state["rate"] > 1.0:
-            state["status"] = "working" # Blue
-        else:
-            state["status"] = "idle"    # Green
-            
-    except:
-        state["status"] = "error"       # Red
+# Pre-rendered once; the icon only changes when the status does.
+ICONS = {status: create_image(color) for status, color in COLORS.items()}
+
+
+def apply_stats(data):
+    """Update state from an agent snapshot (or a controller's /stats); returns True if it changed."""
+    agents = data.get("agents", data.get("agents_online", 0))
+    new = {
+        "agents": len(agents) if isinstance(agents, list) else agents,
+        "queue": data.get("queue", data.get("queue_len", 0)),
+        "rate": data.get("rate_10s", data.get("rate_60s", 0.0)),
+        "latency": data.get("latency_ms"),
+        "status": data.get("status"),
+    }
+    if new["status"] not in COLORS:
+        new["status"] = "working" if new["queue"] > 0 or new["rate"] > 1.0 else "idle"
+    if new == state:
+        return False
+    state.update(new)
+    return True
+
+
+def set_disconnected():
+    if state["status"] == "disconnected":
+        return False
+    state["status"] = "disconnected"
+    return True
+
+
+def refresh(icon):
+    icon.icon = ICONS[state["status"]]
+    icon.title = f"Neurofabric: {state['agents']} Agents | Q: {state['queue']} | {state['rate']:.1f} t/s"
+    icon.update_menu()
+
+
+def watch_sse(icon):
+    """Follow the SSE stream until it ends."""
+    with session.get(STATS_URL.rstrip("/") + "/stream", stream=True,
+                     headers={"Accept": "text/event-stream"}, timeout=(3, 60)) as r:
+        if r.status_code != 200 or not r.headers.get("Content-Type", "").startswith("text/event-stream"):
+            raise Unsupported()
+        data = []
+        buf = ""
+        # chunk_size=None: hand over each chunk (event) as it arrives instead of waiting for 512 bytes
+        for chunk in r.iter_content(chunk_size=None, decode_unicode=True):
+            if not icon.visible:
+                return
+            buf += chunk
+            *lines, buf = buf.split("\n")
+            for line in lines:
+                line = line.rstrip("\r")
+                if line:
+                    if line.startswith("data:"):
+                        data.append(line[5:].strip())
+                    continue
+                if data and apply_stats(json.loads("\n".join(data))):
+                    refresh(icon)
+                data = []
+
+
+def watch_long_poll(icon):
+    """Long-poll with If-None-Match; the server answers when the stats change."""
+    etag = None
+    while icon.visible:
+        headers = {"If-None-Match": etag} if etag else {}
+        r = session.get(STATS_URL, params={"wait": LONG_POLL_SEC}, headers=headers, timeout=(3, LONG_POLL_SEC + 10))
+        if r.status_code == 304:
+            continue
+        r.raise_for_status()
+        if not r.headers.get("ETag"):
+            # No conditional requests here: long-polling would spin.
+            if apply_stats(r.json()):
+                refresh(icon)
+            raise Unsupported()
+        etag = r.headers["ETag"]
+        if apply_stats(r.json()):
+            refresh(icon)
+
+
+def watch_poll(icon):
+    """Conditional polling: unchanged stats cost a 304 and nothing else."""
+    etag = None
+    while icon.visible:
+        headers = {"If-None-Match": etag} if etag else {}
+        r = session.get(STATS_URL, headers=headers, timeout=3)
+        if r.status_code != 304:
+            r.raise_for_status()
+            etag = r.headers.get("ETag")
+            if apply_stats(r.json()):
+                refresh(icon)
+        time.sleep(REFRESH_RATE)
+
 
 def update_loop(icon):
-    """Background thread to keep stats fresh."""
+    """Background thread: subscribe to the best feed the endpoint offers, reconnect with backoff."""
     icon.visible = True
+    modes = [watch_sse, watch_long_poll, watch_poll]
+    if MODE == "longpoll":
+        modes = modes[1:]
+    elif MODE == "poll":
+        modes = modes[2:]
+    retry = 1.0
     while icon.visible:
-        get_stats()
-        
-        # Update Icon Color based on status
-        if state["status"] == "working":
-            icon.icon = create_image("cyan")
-        elif state["status"] == "idle":
-            icon.icon = create_image("lime")
-        else:
-            icon.icon = create_image("red")
-            
-        # Update Tooltip (Hover text)
-        icon.title = f"Neurofabric: {state['agents']} Agents | Q: {state['queue']}"
-        
-        time.sleep(REFRESH_RATE)
+        try:
+            modes[0](icon)
+            retry = 1.0
+        except Unsupported:
+            if len(modes) > 1:
+                modes = modes[1:]
+            else:
+                time.sleep(REFRESH_RATE)
+        except Exception:
+            if set_disconnected():
+                refresh(icon)
+            time.sleep(retry)
+            retry = min(RETRY_MAX_SEC, retry * 2)
+
+
+def latency_text():
+    lat = state["latency"]
+    if not lat:
+        return "Latency:       -"
+    return f"Latency:       p50 {lat['p50']:.0f} / p90 {lat['p90']:.0f} / p99 {lat['p99']:.0f} ms"
+
 
 def on_exit(icon, item):
+    icon.visible = False
     icon.stop()
 
 # Build the Menu
 menu = (
-    item(lambda text: f"Agents Online: {state['agents']}", lambda i, t: None),
+    item(lambda text: f"Status:        {state['status']}", lambda i, t: None),
+    item(lambda text: f"Agents:        {state['agents']}", lambda i, t: None),
     item(lambda text: f"Queue Depth:   {state['queue']}", lambda i, t: None),
-    item(lambda text: f"Speed (1m):    {state['rate']:.1f} t/s", lambda i, t: None),
+    item(lambda text: f"Throughput:    {state['rate']:.1f} t/s", lambda i, t: None),
+    item(lambda text: latency_text(), lambda i, t: None),
     pystray.Menu.SEPARATOR,
     item('Exit', on_exit)
 )
 
-# Start the System Tray App
-icon = pystray.Icon("Neurofabric", create_image("red"), "Initializing...", menu)
-threading.Thread(target=update_loop, args=(icon,), daemon=True).start()
-icon.run()
+if __name__ == "__main__":
+    # Start the System Tray App
+    icon = pystray.Icon("Neurofabric", ICONS["disconnected"], "Connecting...", menu)
+    threading.Thread(target=update_loop, args=(icon,), daemon=True).start()
+    icon.run()
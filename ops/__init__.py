@@ -2,24 +2,44 @@
 Basic op registry for Base Agent v2.
 
 This file defines a simple registry that other modules can use to
-register operation handlers. For now we also eagerly register the
-built-in ops like map_classify and map_summarize.
+register operation handlers. Built-in ops like map_classify and
+map_summarize are imported lazily, the first time they are looked up,
+so an agent only pays for the ops it actually serves.
 """
 
-from typing import Any, Callable, Dict, Optional
+import importlib
+from typing import Any, Callable, Dict, List, Optional
 
-# op name -> handler(task: dict) -> dict
+# op name -> handler(payload: dict) -> dict
 OPS_REGISTRY: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
 
+# op name -> batch handler(payloads: list) -> list of results (same order/length)
+OPS_BATCH_REGISTRY: Dict[str, Callable[[List[Any]], List[Any]]] = {}
+
+# op name -> module under ops/ that provides it
+BUILTIN_OPS: Dict[str, str] = {
+    "echo": "echo",
+    "map_classify": "map_classify",
+    "map_summarize": "map_summarize",
+    "csv_shard": "csv_shard",
+    "read_csv_shard": "csv_shard",
+    "fibonacci": "fibonacci",
+    "prime_factor": "prime_factor",
+}
+
+# op name -> import error message for built-ins that failed to load
+LOAD_ERRORS: Dict[str, str] = {}
+
 
 def register_op(
     name: str,
-    handler: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    handler: Optional[Callable[..., Any]] = None,
+    batch: bool = False,
 ):
     """
     Register an op handler.
 
-    Supports two usage styles:
+    Handlers receive the task payload. Supports two usage styles:
 
       1) Direct registration (what older code used):
          register_op("map_classify", handler_fn)
@@ -30,72 +50,105 @@ def register_op(
              ...
 
     In both cases, OPS_REGISTRY[name] will point to the handler.
+
+    With batch=True the handler takes a list of payloads and returns a list
+    of results in the same order, so it can vectorize across tasks:
+
+         @register_op("map_summarize", batch=True)
+         def handle_batch(payloads: list) -> list:
+             ...
+
+    An Exception instance in place of a result fails only that item.
+    Batch handlers go to OPS_BATCH_REGISTRY. An op may register both forms;
+    the agent groups queued tasks of a batch op into one call.
     """
+    registry: Dict[str, Callable[..., Any]] = OPS_BATCH_REGISTRY if batch else OPS_REGISTRY
 
     # Direct call: register_op("name", handler_fn)
     if handler is not None:
-        OPS_REGISTRY[name] = handler
+        registry[name] = handler
         return handler
 
     # Decorator usage: @register_op("name")
-    def decorator(fn: Callable[[Dict[str, Any]], Dict[str, Any]]):
-        OPS_REGISTRY[name] = fn
+    def decorator(fn: Callable[..., Any]):
+        registry[name] = fn
         return fn
 
     return decorator
 
 
-def get_op(name: str):
-    """Get a handler by op name, or None if not registered."""
-    return OPS_REGISTRY.get(name)
+def module_for(name: str) -> Optional[str]:
+    """Return the fully qualified module name providing a built-in op, or None."""
+    mod = BUILTIN_OPS.get(name)
+    return f"{__name__}.{mod}" if mod else None
 
 
-def list_ops():
-    """Return a list of registered op names."""
-    return list(OPS_REGISTRY.keys())
+def _import_builtin(name: str) -> None:
+    """
+    Import the built-in module for an op (if any).
 
+    We support:
+      - Decorator style: module calls register_op(...) at import time
+      - New style: module has OP_NAME + handle(task: dict)
+      - Old style: module has <op>(task)
 
-# ------------------------------------------------------------------
-# Built-in ops
-# ------------------------------------------------------------------
+    Import failures are recorded in LOAD_ERRORS instead of being raised,
+    so one broken op never kills the agent.
+    """
+    if name in OPS_REGISTRY or name in OPS_BATCH_REGISTRY:
+        return
+
+    module_name = module_for(name)
+    if not module_name:
+        return
+
+    try:
+        mod = importlib.import_module(module_name)
+    except Exception as e:
+        LOAD_ERRORS[name] = f"{type(e).__name__}: {e}"
+        return
+
+    if name not in OPS_REGISTRY and name not in OPS_BATCH_REGISTRY:
+        if getattr(mod, "OP_NAME", None) == name and hasattr(mod, "handle"):
+            register_op(name, getattr(mod, "handle"))
+        elif hasattr(mod, name):
+            # old-style function name matches the op name
+            register_op(name, getattr(mod, name))
 
 
-def _safe_register_builtins():
+def load_op(name: str):
     """
-    Try to register built-ins in a backward-compatible way.
+    Import the built-in module for an op (if any) and return its single-task handler.
 
-    We support:
-      - New style: module has OP_NAME + handle(task: dict)
-      - Old style: module has <op>(task)
+    Ops that only registered a batch handler get a one-item adapter.
     """
+    _import_builtin(name)
+    fn = OPS_REGISTRY.get(name)
+    if fn is None and name in OPS_BATCH_REGISTRY:
+        batch_fn = OPS_BATCH_REGISTRY[name]
 
-    def _try_register(module_name: str, default_op_name: str):
-        """
-        Attempt to import a module and register its handler.
-        - New style: OP_NAME + handle
-        - Old style: function named like default_op_name
-        """
-        try:
-            mod = __import__(f"{__name__}.{module_name}", fromlist=[module_name])
-            if hasattr(mod, "OP_NAME") and hasattr(mod, "handle"):
-                register_op(getattr(mod, "OP_NAME"), getattr(mod, "handle"))
-                return
-            # old-style function name matches the op name
-            if hasattr(mod, default_op_name):
-                register_op(default_op_name, getattr(mod, default_op_name))
-                return
-        except Exception:
-            # Don't kill the agent just because one op is broken.
-            pass
+        def fn(payload: Any) -> Any:
+            return batch_fn([payload])[0]
 
-    # Existing lite ops
-    _try_register("map_classify", "map_classify")
-    _try_register("map_summarize", "map_summarize")
+    return fn
 
-    # Added lite-safe ops
-    _try_register("csv_shard", "csv_shard")
-    _try_register("fibonacci", "fibonacci")
-    _try_register("prime_factor", "prime_factor")
 
+def get_op(name: str):
+    """Get a handler by op name (importing built-ins on demand), or None."""
+    return load_op(name)
 
-_safe_register_builtins()
+
+def get_batch_op(name: str):
+    """Get a batch handler by op name (importing built-ins on demand), or None."""
+    _import_builtin(name)
+    return OPS_BATCH_REGISTRY.get(name)
+
+
+def is_batch_op(name: str) -> bool:
+    """True if the op registered a batch handler."""
+    return get_batch_op(name) is not None
+
+
+def list_ops() -> List[str]:
+    """Return a list of registered op names."""
+    return list(dict.fromkeys([*OPS_REGISTRY, *OPS_BATCH_REGISTRY]))
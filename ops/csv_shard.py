@@ -3,6 +3,8 @@ import csv
 import os
 from typing import Any, Dict, List, Optional
 
+from . import register_op
+
 
 def _read_csv_shard(source_uri: str, start_row: int, shard_size: int) -> List[Dict[str, Any]]:
     """
@@ -98,3 +100,7 @@ def op_read_csv_shard(task_or_payload: Optional[Dict[str, Any]]) -> Dict[str, An
         "row_count": len(rows),
         "rows": rows,
     }
+
+
+register_op("read_csv_shard", op_read_csv_shard)
+register_op("csv_shard", op_read_csv_shard)
@@ -0,0 +1,12 @@
+# ops/echo.py
+from __future__ import annotations
+
+from typing import Any
+
+from . import register_op
+
+
+@register_op("echo")
+def map_echo(payload: Any) -> Any:
+    """Return the payload unchanged (connectivity / latency probe)."""
+    return payload
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from . import register_op
 
@@ -17,9 +17,7 @@ def _fib_iter(n: int) -> int:
     return b
 
 
-@register_op("fibonacci")
-def map_fibonacci(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Calculate Fibonacci number at position n."""
+def _parse_n(payload: Dict[str, Any]) -> int:
     n_raw = payload.get("n", 30)
     try:
         n = int(n_raw)
@@ -33,6 +31,14 @@ def map_fibonacci(payload: Dict[str, Any]) -> Dict[str, Any]:
     if n > 50000:
         raise ValueError("payload.n too large (max 50000)")
 
+    return n
+
+
+@register_op("fibonacci")
+def map_fibonacci(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Calculate Fibonacci number at position n."""
+    n = _parse_n(payload)
+
     start = time.time()
     result = _fib_iter(n)
     elapsed_ms = (time.time() - start) * 1000.0
@@ -42,3 +48,30 @@ def map_fibonacci(payload: Dict[str, Any]) -> Dict[str, Any]:
         "result": result,
         "compute_time_ms": elapsed_ms,
     }
+
+
+@register_op("fibonacci", batch=True)
+def map_fibonacci_batch(payloads: List[Dict[str, Any]]) -> List[Any]:
+    """Calculate Fibonacci numbers for many payloads in one pass up to the largest n."""
+    ns: List[Any] = []
+    for payload in payloads:
+        try:
+            ns.append(_parse_n(payload))
+        except Exception as e:
+            ns.append(e)
+
+    wanted = {n for n in ns if isinstance(n, int)}
+    values: Dict[int, int] = {}
+    start = time.time()
+    if wanted:
+        a, b = 0, 1
+        for i in range(max(wanted) + 1):
+            if i in wanted:
+                values[i] = a
+            a, b = b, a + b
+    elapsed_ms = (time.time() - start) * 1000.0
+
+    return [
+        n if isinstance(n, Exception) else {"n": n, "result": values[n], "compute_time_ms": elapsed_ms}
+        for n in ns
+    ]
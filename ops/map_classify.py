@@ -0,0 +1,422 @@
+"""
+ops/map_classify.py
+
+Hashing-vectorizer + linear-model text classifier.
+
+Text is lowercased and tokenized; unigrams and bigrams are hashed (crc32,
+signed) into N feature slots and the vector is L2-normalized. Class scores
+are bias + x . W, turned into probabilities with a softmax.
+
+The weights live in a binary model file that every pool process memory-maps
+read-only, so the matrix is loaded once per process and its pages are shared
+through the page cache instead of being copied per process:
+
+    b"MCLF" | uint32 header_len | header JSON | pad to 16 bytes
+    float32 bias[n_classes] | float32 W[n_features][n_classes] (row-major)
+
+    header: {"classes": [...], "n_features": N, "ngram": 1|2}
+    floats are little-endian (the byte order of every host the agent targets)
+
+MAP_CLASSIFY_MODEL points at the file. Without it, a small built-in
+sentiment model (negative / neutral / positive, from a seed lexicon) is
+written to models/map_classify.bin on first use. write_model() produces the
+same format from per-term weights trained elsewhere.
+A missing, truncated or corrupt file raises ValueError naming the file,
+which fails the task with that message.
+
+Inputs are held to the agent's advertised limits: text larger than
+LITE_MAX_PAYLOAD_BYTES is rejected, and only the first LITE_MAX_TOKENS
+tokens are scored.
+
+Benchmark:  python -m ops.map_classify --bench [--docs N]
+"""
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # optional: vectorized batch scoring
+except Exception:
+    np = None
+
+from . import register_op
+
+# New-style registration: OP_NAME + handle()
+OP_NAME = "map_classify"
+
+_MAGIC = b"MCLF"
+_ALIGN = 16
+DEFAULT_FEATURES = 1 << 18
+
+MODEL_PATH = os.getenv("MAP_CLASSIFY_MODEL", "").strip()
+_SEED_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "models", "map_classify.bin")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Same env vars (and defaults) the worker profile advertises to the controller.
+MAX_PAYLOAD_BYTES = _env_int("LITE_MAX_PAYLOAD_BYTES", 4096)
+MAX_TOKENS = _env_int("LITE_MAX_TOKENS", 1024)
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+# ---------------- features ----------------
+
+
+def _tokens(text: str) -> Tuple[List[str], bool]:
+    toks = _WORD_RE.findall(text.lower())
+    if len(toks) > MAX_TOKENS:
+        return toks[:MAX_TOKENS], True
+    return toks, False
+
+
+# gram -> (index, sign); natural text repeats most grams, so hashing is mostly a dict hit.
+_HASH_CACHE_MAX = 1 << 17
+_hash_cache: Dict[str, Tuple[int, float]] = {}
+_hash_cache_features = 0  # the n_features the cached indices were taken modulo
+
+
+def _features(tokens: Sequence[str], n_features: int, ngram: int) -> Dict[int, float]:
+    """Signed hashed counts of unigrams (+ bigrams), L2-normalized; {index: value}."""
+    global _hash_cache_features
+    vec: Dict[int, float] = {}
+    grams: List[str] = list(tokens)
+    if ngram >= 2:
+        grams += [a + " " + b for a, b in zip(tokens, tokens[1:])]
+    cache = _hash_cache
+    if n_features != _hash_cache_features:
+        cache.clear()
+        _hash_cache_features = n_features
+    for g in grams:
+        hit = cache.get(g)
+        if hit is None:
+            if len(cache) >= _HASH_CACHE_MAX:
+                cache.clear()
+            h = zlib.crc32(g.encode("utf-8"))
+            hit = cache[g] = (h % n_features, -1.0 if h & 0x80000000 else 1.0)
+        idx, sign = hit
+        vec[idx] = vec.get(idx, 0.0) + sign
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    if norm:
+        for k in vec:
+            vec[k] /= norm
+    return vec
+
+
+# ---------------- model file ----------------
+
+
+class _Model:
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:  # ValueError: empty file
+            raise ValueError(f"{path}: cannot map model file ({e})") from None
+        try:
+            self._load()
+        except Exception:
+            self._mm.close()
+            raise
+
+    def _load(self) -> None:
+        path = self.path
+        if len(self._mm) < 8 or self._mm[:4] != _MAGIC:
+            raise ValueError(f"{path}: not a map_classify model file")
+        (hlen,) = struct.unpack_from("<I", self._mm, 4)
+        if 8 + hlen > len(self._mm):
+            raise ValueError(f"{path}: bad model header (length {hlen} past end of file)")
+        try:
+            header = json.loads(self._mm[8:8 + hlen].decode("utf-8"))
+            self.classes: List[str] = [str(c) for c in header["classes"]]
+            self.n_features = int(header["n_features"])
+            self.ngram = int(header.get("ngram", 2))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"{path}: bad model header ({type(e).__name__}: {e})") from None
+        if not self.classes or self.n_features <= 0:
+            raise ValueError(f"{path}: bad model header (no classes or features)")
+
+        nc = len(self.classes)
+        offset = _data_offset(hlen)
+        need = offset + 4 * nc * (1 + self.n_features)
+        if len(self._mm) < need:
+            raise ValueError(f"{path}: truncated model file ({len(self._mm)} < {need} bytes)")
+
+        # Zero-copy views into the mapping.
+        floats = memoryview(self._mm)[offset:need].cast("f")
+        self.bias = floats[:nc]
+        self.weights = floats[nc:]
+        if np is not None:
+            arr = np.frombuffer(self._mm, dtype="<f4", count=nc * (1 + self.n_features), offset=offset)
+            self.np_bias = arr[:nc]
+            self.np_weights = arr[nc:].reshape(self.n_features, nc)
+
+    def scores(self, vec: Dict[int, float]) -> List[float]:
+        nc = len(self.classes)
+        out = list(self.bias)
+        w = self.weights
+        for idx, v in vec.items():
+            base = idx * nc
+            for c in range(nc):
+                out[c] += v * w[base + c]
+        return out
+
+
+def _data_offset(header_len: int) -> int:
+    end = 8 + header_len
+    return (end + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write_model(path: str, classes: Sequence[str], term_weights: Dict[str, Dict[str, float]],
+                bias: Optional[Dict[str, float]] = None, n_features: int = DEFAULT_FEATURES, ngram: int = 2) -> None:
+    """
+    Write a model file from per-term class weights ({"term" or "w1 w2": {class: weight}}).
+
+    Terms are hashed exactly like input features, so hash collisions add up.
+    The file is written next to `path` and renamed into place.
+    """
+    from array import array
+
+    classes = [str(c) for c in classes]
+    nc = len(classes)
+    col = {c: i for i, c in enumerate(classes)}
+    data = array("f", [0.0]) * (nc * (1 + n_features))
+    for c, b in (bias or {}).items():
+        data[col[c]] = float(b)
+    for term, per_class in term_weights.items():
+        h = zlib.crc32(term.encode("utf-8"))
+        sign = -1.0 if h & 0x80000000 else 1.0
+        base = nc + (h % n_features) * nc
+        for c, wgt in per_class.items():
+            data[base + col[c]] += sign * float(wgt)
+
+    header = json.dumps({"classes": classes, "n_features": n_features, "ngram": ngram}).encode("utf-8")
+    pad = _data_offset(len(header)) - 8 - len(header)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC + struct.pack("<I", len(header)) + header + b"\0" * pad)
+        data.tofile(f)
+    os.replace(tmp, path)
+
+
+_POSITIVE = """good great excellent amazing awesome love loved loving like liked nice happy glad pleased
+fantastic wonderful best better perfect fast reliable stable easy helpful recommend recommended works
+working fixed enjoy enjoyed smooth clean brilliant superb impressive solid thanks success successful""".split()
+_NEGATIVE = """bad terrible awful horrible hate hated poor worst worse broken bug buggy crash crashed crashes
+slow fail failed failing failure error errors wrong useless annoying disappointing disappointed
+problem problems issue issues unstable hard difficult confusing refund never slowly lag laggy""".split()
+_NEGATIONS = ("not", "no", "never", "don't", "doesn't", "didn't", "isn't", "wasn't", "can't", "won't")
+
+
+def _build_seed_model(path: str) -> None:
+    terms: Dict[str, Dict[str, float]] = {}
+    for w in _POSITIVE:
+        terms[w] = {"positive": 2.0, "negative": -1.0}
+    for w in _NEGATIVE:
+        terms[w] = {"negative": 2.0, "positive": -1.0}
+    for neg in _NEGATIONS:
+        for w in _POSITIVE:
+            terms[f"{neg} {w}"] = {"negative": 3.0, "positive": -3.0}
+        for w in _NEGATIVE:
+            terms[f"{neg} {w}"] = {"positive": 1.5, "negative": -3.0}
+    write_model(path, ["negative", "neutral", "positive"], terms, bias={"neutral": 0.25})
+
+
+_model: Optional[_Model] = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> _Model:
+    """The process-wide model (mapped on first use)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                path = MODEL_PATH or _SEED_MODEL_PATH
+                if not MODEL_PATH and not os.path.exists(path):
+                    _build_seed_model(path)
+                _model = _Model(path)
+    return _model
+
+
+# ---------------- scoring ----------------
+
+
+def _softmax(scores: Sequence[float]) -> List[float]:
+    m = max(scores)
+    exps = [math.exp(s - m) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def _prepare(task: Any) -> Tuple[Optional[Dict[int, float]], Dict[str, Any]]:
+    """Validate one payload; returns (features, result stub) or (None, error result)."""
+    if not isinstance(task, dict):
+        return None, {"ok": False, "error": "payload must be an object"}
+    text = task.get("text") or task.get("document") or task.get("body")
+    if not text or not isinstance(text, str):
+        return None, {"ok": False, "error": "No text string provided in 'text'/'document'/'body'."}
+    size = len(text.encode("utf-8"))
+    if size > MAX_PAYLOAD_BYTES:
+        return None, {"ok": False, "error": f"text is {size} bytes (LITE_MAX_PAYLOAD_BYTES={MAX_PAYLOAD_BYTES})"}
+    model = get_model()
+    toks, truncated = _tokens(text)
+    stub: Dict[str, Any] = {"ok": True, "tokens": len(toks)}
+    if truncated:
+        stub["truncated"] = True
+    return _features(toks, model.n_features, model.ngram), stub
+
+
+def _finish(model: _Model, scores: Sequence[float], stub: Dict[str, Any]) -> Dict[str, Any]:
+    # Label from the reported (rounded) scores, ties to the first class, so the
+    # single and batch paths agree despite summing in a different order.
+    probs = [round(p, 6) for p in _softmax(scores)]
+    best = probs.index(max(probs))
+    stub["label"] = model.classes[best]
+    stub["scores"] = dict(zip(model.classes, probs))
+    return stub
+
+
+@register_op(OP_NAME)
+def handle(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Classify one text.
+
+    Expects task["text"] (or "document" / "body").
+
+    Returns:
+      {
+        "ok": True/False,
+        "label": str, "scores": {class: probability} (when ok=True),
+        "tokens": int scored tokens, "truncated": True if cut at LITE_MAX_TOKENS,
+        "error": str (when ok=False),
+      }
+    """
+    vec, stub = _prepare(task)
+    if vec is None:
+        return stub
+    model = get_model()
+    return _finish(model, model.scores(vec), stub)
+
+
+@register_op(OP_NAME, batch=True)
+def handle_batch(tasks: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Classify many texts in one call.
+
+    With numpy, all texts are scored together: one gather of the weight rows
+    for every feature of every text, then a segmented sum per text.
+    """
+    model = get_model()
+    out: List[Any] = []
+    vecs: List[Tuple[int, Dict[int, float]]] = []
+    for task in tasks:
+        try:
+            vec, stub = _prepare(task)
+        except Exception as e:
+            out.append(e)
+            continue
+        out.append(stub)
+        if vec is not None:
+            vecs.append((len(out) - 1, vec))
+    if not vecs:
+        return out
+
+    if np is None:
+        for pos, vec in vecs:
+            out[pos] = _finish(model, model.scores(vec), out[pos])
+        return out
+
+    idx = np.fromiter((i for _, v in vecs for i in v.keys()), dtype=np.intp)
+    val = np.fromiter((x for _, v in vecs for x in v.values()), dtype=np.float64)
+    lengths = np.fromiter((len(v) for _, v in vecs), dtype=np.intp, count=len(vecs))
+    scores = np.tile(model.np_bias.astype(np.float64), (len(vecs), 1))
+    if idx.size:
+        contrib = model.np_weights[idx] * val[:, None]
+        nonempty = lengths > 0
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+        scores[nonempty] += np.add.reduceat(contrib, starts, axis=0)
+    for (pos, _), row in zip(vecs, scores.tolist()):
+        out[pos] = _finish(model, row, out[pos])
+    return out
+
+
+def warmup() -> None:
+    # Map the model (building the seed model if needed) before the first task.
+    handle({"text": "warm up the classifier"})
+
+
+# ---------------- benchmark ----------------
+
+
+def _bench_corpus(n_docs: int, seed: int = 11) -> List[Dict[str, Any]]:
+    """Texts as large as the limits allow: up to LITE_MAX_TOKENS tokens within LITE_MAX_PAYLOAD_BYTES."""
+    import random
+
+    rnd = random.Random(seed)
+    vocab = _POSITIVE + _NEGATIVE + list(_NEGATIONS) + """the agent task result queue worker pool
+controller latency throughput memory node cluster shard batch cache lease""".split()
+    docs = []
+    for _ in range(n_docs):
+        words: List[str] = []
+        size = -1
+        while len(words) < MAX_TOKENS:
+            w = rnd.choice(vocab)
+            if size + 1 + len(w) > MAX_PAYLOAD_BYTES:
+                break
+            words.append(w)
+            size += 1 + len(w)
+        docs.append({"text": " ".join(words)})
+    return docs
+
+
+def _bench(n_docs: int) -> None:
+    import time
+
+    docs = _bench_corpus(n_docs)
+    warmup()
+    tokens = sum(len(_tokens(d["text"])[0]) for d in docs)
+    nbytes = sum(len(d["text"]) for d in docs)
+    print(f"map_classify: {n_docs} docs, {tokens / n_docs:.0f} tokens / {nbytes / n_docs:.0f} bytes each "
+          f"(LITE_MAX_TOKENS={MAX_TOKENS} LITE_MAX_PAYLOAD_BYTES={MAX_PAYLOAD_BYTES}, "
+          f"numpy={'yes' if np is not None else 'no'})")
+    for mode in ("single", "batch"):
+        t0 = time.perf_counter()
+        if mode == "batch":
+            handle_batch(docs)
+        else:
+            for d in docs:
+                handle(d)
+        dt = time.perf_counter() - t0
+        print(f"  {mode:6s}: {n_docs / dt:8.0f} docs/sec  {tokens / dt / 1e6:6.2f} M tokens/sec  "
+              f"{nbytes / dt / 1e6:6.2f} MB/sec")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="map_classify throughput benchmark")
+    ap.add_argument("--bench", action="store_true", help="run the benchmark")
+    ap.add_argument("--docs", type=int, default=2000)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.docs)
+    else:
+        ap.print_help()
@@ -1,47 +1,468 @@
-from typing import Dict, Any
+"""
+ops/map_summarize.py
+
+CPU-only extractive summarizer.
+
+The text is split into sentences, tokenized (lowercase words minus
+stopwords), and every sentence is scored; the top `sentences` are returned
+in their original order. Two scorers:
+
+  - "textrank" (default): PageRank over the sentence-similarity graph
+    (cosine similarity of term-count vectors). Vectorized with numpy when it
+    is installed, pure Python otherwise.
+  - "tf": sum of document term frequencies of the sentence's terms,
+    normalized by sentence length. Linear time; used automatically for
+    documents with more than TEXTRANK_MAX_SENTENCES sentences.
+
+The batch handler summarizes many documents in one call. With numpy, the
+documents' sentence-term matrices are stacked (padded to the largest
+document of a chunk) and scored together: one batched similarity product and
+one PageRank iteration over the whole chunk for TextRank, one pass for tf.
+Without numpy it scores the documents one by one.
+
+The regexes and stopword list are built once at import, i.e. once per pool
+process (in the forkserver when the op is preloaded).
+
+Benchmark:  python -m ops.map_summarize --bench [--docs N] [--batch]
+"""
+
+import math
+import re
+from collections import Counter
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # optional: vectorized TextRank and batch scoring
+except Exception:
+    np = None
+
 from . import register_op
 
 # New-style registration: OP_NAME + handle()
 OP_NAME = "map_summarize"
 
+DEFAULT_SENTENCES = 3
+MAX_SENTENCES = 50
+TEXTRANK_MAX_SENTENCES = 400  # similarity matrix is n^2
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERS = 30
+TEXTRANK_TOL = 1e-5
+BATCH_MAX_CELLS = 1 << 22  # docs x sentences x max(terms, sentences) per numpy chunk (float64: 32 MB)
+METHODS = ("textrank", "tf")
+
+# Sentence ends at . ! ? (plus closing quotes/brackets) followed by whitespace,
+# or at a blank line / bullet break.
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n|\n\s*(?=[-*•]\s)")
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are aren't as at be because been before being
+below between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down
+during each either else etc even ever every few for from further get gets got had hadn't has hasn't have
+haven't having he he'd he'll he's her here here's hers herself him himself his how how's however i i'd
+i'll i'm i've if in into is isn't it it's its itself just let's like made make many may me might more
+most much must mustn't my myself neither no nor not now of off often on once one only or other ought our
+ours ourselves out over own per rather really said same say says shall shan't she she'd she'll she's
+should shouldn't since so some still such than that that's the their theirs them themselves then there
+there's these they they'd they'll they're they've this those though through thus to too under until up
+upon us use used using very via was wasn't we we'd we'll we're we've were weren't what what's when
+when's where where's whether which while who who's whom whose why why's will with within without won't
+would wouldn't yet you you'd you'll you're you've your yours yourself yourselves
+""".split())
+
+
+def _split_sentences(text: str) -> List[str]:
+    out = []
+    for part in _SENT_SPLIT_RE.split(text):
+        part = " ".join(part.split())
+        if part:
+            out.append(part)
+    return out
+
+
+def _terms(sentence: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(sentence.lower()) if len(w) > 1 and w not in _STOPWORDS]
+
+
+# ---------------- scorers ----------------
+
+
+def _score_tf(terms: Sequence[List[str]]) -> List[float]:
+    doc_tf = Counter(t for ts in terms for t in ts)
+    if not doc_tf:
+        return [0.0] * len(terms)
+    top = max(doc_tf.values())
+    scores = []
+    for ts in terms:
+        if not ts:
+            scores.append(0.0)
+            continue
+        scores.append(sum(doc_tf[t] for t in set(ts)) / top / math.sqrt(len(ts)))
+    return scores
+
+
+def _pagerank(weights: List[List[float]]) -> List[float]:
+    n = len(weights)
+    out_sum = [sum(row) for row in weights]
+    rank = [1.0 / n] * n
+    base = (1.0 - TEXTRANK_DAMPING) / n
+    for _ in range(TEXTRANK_ITERS):
+        # Dangling sentences (no similar neighbours) spread their rank uniformly.
+        dangling = sum(rank[j] for j in range(n) if not out_sum[j]) / n
+        new = []
+        for i in range(n):
+            s = 0.0
+            for j in range(n):
+                w = weights[j][i]
+                if w:
+                    s += rank[j] * w / out_sum[j]
+            new.append(base + TEXTRANK_DAMPING * (s + dangling))
+        delta = sum(abs(a - b) for a, b in zip(new, rank))
+        rank = new
+        if delta < TEXTRANK_TOL:
+            break
+    return rank
+
+
+def _score_textrank_py(terms: Sequence[List[str]]) -> List[float]:
+    vecs = [Counter(ts) for ts in terms]
+    norms = [math.sqrt(sum(c * c for c in v.values())) for v in vecs]
+    n = len(vecs)
+    weights = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        if not norms[i]:
+            continue
+        vi = vecs[i]
+        for j in range(i + 1, n):
+            if not norms[j]:
+                continue
+            vj = vecs[j]
+            small, large = (vi, vj) if len(vi) <= len(vj) else (vj, vi)
+            dot = sum(c * large.get(t, 0) for t, c in small.items())
+            if dot:
+                weights[i][j] = weights[j][i] = dot / (norms[i] * norms[j])
+    return _pagerank(weights)
+
+
+def _score_textrank_np(terms: Sequence[List[str]]) -> List[float]:
+    vocab: Dict[str, int] = {}
+    rows, cols = [], []
+    for i, ts in enumerate(terms):
+        for t in ts:
+            rows.append(i)
+            cols.append(vocab.setdefault(t, len(vocab)))
+    n = len(terms)
+    m = np.zeros((n, max(1, len(vocab))), dtype=np.float64)
+    np.add.at(m, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), 1.0)
+    norms = np.linalg.norm(m, axis=1)
+    norms[norms == 0] = 1.0
+    m /= norms[:, None]
+    sim = m @ m.T
+    np.fill_diagonal(sim, 0.0)
+
+    out_sum = sim.sum(axis=1)
+    dangling = out_sum == 0
+    trans = np.divide(sim, out_sum[:, None], out=np.zeros_like(sim), where=~dangling[:, None])
+    rank = np.full(n, 1.0 / n, dtype=np.float64)
+    base = (1.0 - TEXTRANK_DAMPING) / n
+    for _ in range(TEXTRANK_ITERS):
+        new = base + TEXTRANK_DAMPING * (rank @ trans + rank[dangling].sum() / n)
+        delta = np.abs(new - rank).sum()
+        rank = new
+        if delta < TEXTRANK_TOL:
+            break
+    return rank.tolist()
+
+
+def _score_textrank(terms: Sequence[List[str]]) -> List[float]:
+    if np is not None:
+        return _score_textrank_np(terms)
+    return _score_textrank_py(terms)
+
+
+# ---------------- batch scorers (numpy) ----------------
+
+
+def _encode(sents: List[str]) -> Tuple[Any, Any, int]:
+    """
+    A document's kept words as term ids (its own vocabulary), the sentence of
+    each, and the vocabulary size. Stopword filtering is decided once per
+    distinct word rather than per occurrence.
+    """
+    words = [_WORD_RE.findall(s.lower()) for s in sents]
+    ids: Dict[str, int] = {}
+    n_terms = 0
+    for w in dict.fromkeys(chain.from_iterable(words)):
+        if len(w) > 1 and w not in _STOPWORDS:
+            ids[w] = n_terms
+            n_terms += 1
+        else:
+            ids[w] = -1
+    term = np.fromiter(map(ids.__getitem__, chain.from_iterable(words)), dtype=np.intp)
+    sent = np.repeat(np.arange(len(sents)), [len(ws) for ws in words])
+    keep = term >= 0
+    return term[keep], sent[keep], n_terms
+
+
+def _stack(docs: Sequence[Tuple[Any, Any, int]], n: Any) -> Any:
+    """Term counts of encoded documents as one (docs, sentences, terms) array, zero-padded."""
+    shape = (len(docs), int(n.max()), max(1, max(k for _, _, k in docs)))
+    doc = np.repeat(np.arange(len(docs)), [len(term) for term, _, _ in docs])
+    sent = np.concatenate([s for _, s, _ in docs])
+    term = np.concatenate([t for t, _, _ in docs])
+    flat = (doc * shape[1] + sent) * shape[2] + term
+    return np.bincount(flat, minlength=shape[0] * shape[1] * shape[2]).astype(np.float64).reshape(shape)
+
+
+def _score_tf_batch(m: Any, n: Any) -> Any:
+    doc_tf = m.sum(axis=1)  # (docs, terms)
+    top = doc_tf.max(axis=1)
+    top[top == 0] = 1.0
+    hits = (m > 0) @ doc_tf[:, :, None]  # each sentence's distinct terms, weighted by document tf
+    lengths = m.sum(axis=2)
+    return np.divide(hits[:, :, 0] / top[:, None], np.sqrt(lengths), out=np.zeros_like(lengths),
+                     where=lengths > 0)
+
+
+def _score_textrank_batch(m: Any, n: Any) -> Any:
+    norms = np.linalg.norm(m, axis=2)
+    norms[norms == 0] = 1.0
+    m /= norms[:, :, None]
+    sim = m @ m.transpose(0, 2, 1)
+    diag = np.arange(sim.shape[1])
+    sim[:, diag, diag] = 0.0
+
+    real = diag[None, :] < n[:, None]  # padding rows are not sentences
+    out_sum = sim.sum(axis=2)
+    dangling = out_sum == 0
+    trans = np.divide(sim, out_sum[:, :, None], out=np.zeros_like(sim), where=~dangling[:, :, None])
+    dangling &= real
+    size = n[:, None].astype(np.float64)
+    rank = np.where(real, 1.0 / size, 0.0)
+    base = (1.0 - TEXTRANK_DAMPING) / size
+    # Same iteration as _score_textrank_np, per document: a converged document stops changing.
+    active = np.ones(len(n), dtype=bool)
+    for _ in range(TEXTRANK_ITERS):
+        spread = (rank * dangling).sum(axis=1, keepdims=True) / size
+        new = np.where(real, base + TEXTRANK_DAMPING * ((rank[:, None, :] @ trans)[:, 0, :] + spread), 0.0)
+        delta = np.abs(new - rank).sum(axis=1)
+        rank[active] = new[active]
+        active &= delta >= TEXTRANK_TOL
+        if not active.any():
+            break
+    return rank
+
+
+def _score_batch_np(docs: Sequence[List[str]], method: str) -> List[List[float]]:
+    """
+    Score many documents (as sentence lists) with one scorer, stacked in chunks
+    of similar-sized documents of at most BATCH_MAX_CELLS cells.
+    """
+    scorer = _score_textrank_batch if method == "textrank" else _score_tf_batch
+    encoded = [_encode(sents) for sents in docs]
+    out: List[List[float]] = [[] for _ in docs]
+
+    def run(chunk: List[int]) -> None:
+        n = np.fromiter((len(docs[i]) for i in chunk), dtype=np.intp, count=len(chunk))
+        scores = scorer(_stack([encoded[i] for i in chunk], n), n)
+        for i, row, k in zip(chunk, scores.tolist(), n.tolist()):
+            out[i] = row[:k]
+
+    chunk: List[int] = []
+    width = 1
+    for i in sorted(range(len(docs)), key=lambda i: len(docs[i])):
+        # Sorted by sentences, so the newest document is the tallest in the chunk.
+        w = max(width, len(docs[i]), encoded[i][2])
+        if chunk and (len(chunk) + 1) * len(docs[i]) * w > BATCH_MAX_CELLS:
+            run(chunk)
+            chunk, w = [], max(1, len(docs[i]), encoded[i][2])
+        chunk.append(i)
+        width = w
+    if chunk:
+        run(chunk)
+    return out
+
+
+# ---------------- op ----------------
+
+
+def _parse(task: Any) -> Tuple[str, int, str]:
+    """Validate one payload; returns (text, sentences, method) or raises ValueError."""
+    if not isinstance(task, dict):
+        raise ValueError("payload must be an object")
+    text = (
+        task.get("text")
+        or task.get("document")
+        or task.get("body")
+    )
+    if not text or not isinstance(text, str):
+        raise ValueError("No text string provided in 'text'/'document'/'body'.")
+    k = task.get("sentences")
+    if k is None:
+        k = DEFAULT_SENTENCES
+    elif isinstance(k, str) and k.strip().isdigit():
+        k = int(k)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_SENTENCES:
+        raise ValueError(f"'sentences' must be an integer from 1 to {MAX_SENTENCES}, got {k!r}")
+    method = task.get("method")
+    if method is None:
+        method = "textrank"
+    if method not in METHODS:
+        raise ValueError(f"'method' must be one of {', '.join(METHODS)}, got {method!r}")
+    return text, k, method
+
+
+def _pick(sents: List[str], scores: Sequence[float], sentences: int, method: str) -> Dict[str, Any]:
+    # Ties go to the earlier sentence. Rounded so that equal sentences tie whichever
+    # scorer (single or batched, with its float rounding) produced the scores.
+    top = sorted(sorted(range(len(sents)), key=lambda i: (-round(scores[i], 9), i))[:sentences])
+    return {"summary": " ".join(sents[i] for i in top), "sentences": top, "method": method}
+
+
+def _all(sents: List[str]) -> Dict[str, Any]:
+    return {"summary": " ".join(sents), "sentences": list(range(len(sents))), "method": "all"}
+
+
+def _method_for(method: str, n_sents: int) -> str:
+    return method if method == "textrank" and n_sents <= TEXTRANK_MAX_SENTENCES else "tf"
+
+
+def summarize(text: str, sentences: int = DEFAULT_SENTENCES, method: str = "textrank") -> Dict[str, Any]:
+    """Pick the `sentences` highest-scoring sentences of `text`, in document order."""
+    sents = _split_sentences(text)
+    if len(sents) <= sentences:
+        return _all(sents)
+
+    terms = [_terms(s) for s in sents]
+    method = _method_for(method, len(sents))
+    scores = _score_textrank(terms) if method == "textrank" else _score_tf(terms)
+    return _pick(sents, scores, sentences, method)
+
 
 @register_op(OP_NAME)
 def handle(task: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Very simple CPU-only summarizer used for the swarm demo.
+    Extractive summary of one document.
 
     Expects a single text field in the task:
       - task["text"]      (preferred)
       - or task["document"]
       - or task["body"]
 
+    Optional:
+      - task["sentences"]  number of sentences to keep, 1 to 50 (default 3)
+      - task["method"]     "textrank" (default) or "tf"
+
+    Invalid values give an error result.
+
     Returns:
       {
         "ok": True/False,
         "summary": str (when ok=True),
+        "sentences": [int] indexes of the kept sentences (when ok=True),
+        "method": str scorer actually used (when ok=True),
         "error": str (when ok=False),
       }
     """
-    text = (
-        task.get("text")
-        or task.get("document")
-        or task.get("body")
-    )
+    try:
+        text, k, method = _parse(task)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    out = summarize(text, k, method)
+    out["ok"] = True
+    return out
 
-    if not text or not isinstance(text, str):
-        return {
-            "ok": False,
-            "error": "No text string provided in 'text'/'document'/'body'.",
-        }
-
-    # Dumb but safe "summary": truncate to ~200 chars
-    max_len = 200
-    if len(text) > max_len:
-        summary = text[:max_len].rstrip() + "..."
+
+@register_op(OP_NAME, batch=True)
+def handle_batch(tasks: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Summarize many documents in one call; each item gets the same result as
+    handle() would give it.
+
+    With numpy, documents are scored together per scorer (see _score_batch_np).
+    """
+    out: List[Any] = []
+    todo: Dict[str, List[Tuple[int, List[str], int]]] = {m: [] for m in METHODS}
+    for task in tasks:
+        try:
+            text, k, method = _parse(task)
+        except ValueError as e:
+            out.append({"ok": False, "error": str(e)})
+            continue
+        sents = _split_sentences(text)
+        if len(sents) <= k:
+            out.append(dict(_all(sents), ok=True))
+            continue
+        out.append(None)
+        todo[_method_for(method, len(sents))].append((len(out) - 1, sents, k))
+
+    for method, docs in todo.items():
+        if not docs:
+            continue
+        if np is not None:
+            scores = _score_batch_np([sents for _, sents, _ in docs], method)
+        else:
+            scorer = _score_textrank if method == "textrank" else _score_tf
+            scores = [scorer([_terms(x) for x in sents]) for _, sents, _ in docs]
+        for (pos, sents, k), doc_scores in zip(docs, scores):
+            out[pos] = dict(_pick(sents, doc_scores, k, method), ok=True)
+    return out
+
+
+def warmup() -> None:
+    # Touch the regexes and the numpy path once so the first real task does not pay for it.
+    summarize("Warm up. The pool process. Before tasks arrive. Then run.", 1)
+
+
+# ---------------- benchmark ----------------
+
+
+def _bench_corpus(n_docs: int, n_sents: int = 30, seed: int = 7) -> List[Dict[str, Any]]:
+    import random
+
+    rnd = random.Random(seed)
+    words = ("agent controller task worker result queue latency throughput memory process pool "
+             "cluster node shard batch cache schedule lease retry deadline metric signal").split()
+    docs = []
+    for _ in range(n_docs):
+        sents = []
+        for _ in range(n_sents):
+            body = " ".join(rnd.choice(words) for _ in range(rnd.randint(8, 24)))
+            sents.append(body.capitalize() + ".")
+        docs.append({"text": " ".join(sents)})
+    return docs
+
+
+def _bench(n_docs: int, batch: bool, method: str) -> None:
+    import time
+
+    docs = _bench_corpus(n_docs)
+    for d in docs:
+        d["method"] = method
+    warmup()
+    t0 = time.perf_counter()
+    if batch:
+        handle_batch(docs)
     else:
-        summary = text
+        for d in docs:
+            handle(d)
+    dt = time.perf_counter() - t0
+    mode = "batch" if batch else "single"
+    print(f"map_summarize {method} {mode}: {n_docs} docs x 30 sentences in {dt:.3f}s "
+          f"= {n_docs / dt:.0f} docs/sec (numpy={'yes' if np is not None else 'no'})")
+
 
-    return {
-        "ok": True,
-        "summary": summary,
-    }
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="map_summarize throughput benchmark")
+    ap.add_argument("--bench", action="store_true", help="run the benchmark")
+    ap.add_argument("--docs", type=int, default=500)
+    ap.add_argument("--batch", action="store_true", help="use the batch handler")
+    ap.add_argument("--method", default="textrank", choices=METHODS)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.docs, args.batch, args.method)
+    else:
+        ap.print_help()
@@ -1,25 +1,63 @@
 # ops/prime_factor.py
 from __future__ import annotations
 
+import itertools
 import math
+import os
 import time
-from typing import Any, Dict, List
+from array import array
+from typing import Any, Dict, List, Optional
 
 from . import register_op
 
+# Primes up to sqrt(max n) let trial division skip every composite divisor.
+# Built once per process by warmup(); with a forkserver pool it is built in the
+# forkserver and shared copy-on-write by every pool process.
+TABLE_LIMIT = int(os.getenv("PRIME_FACTOR_TABLE_LIMIT", str(10**7)))
+
+_SMALL_PRIMES: Optional[array] = None
+
+
+def _sieve(limit: int) -> array:
+    if limit < 2:
+        return array("I")
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for i in range(2, math.isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit + 1, i)))
+    return array("I", itertools.compress(range(limit + 1), sieve))
+
+
+def warmup() -> None:
+    """Precompute the small-prime table (idempotent)."""
+    global _SMALL_PRIMES
+    if _SMALL_PRIMES is None:
+        _SMALL_PRIMES = _sieve(TABLE_LIMIT)
+
 
 def _prime_factors(n: int) -> List[int]:
     factors: List[int] = []
     if n <= 1:
         return factors
 
-    # factor out 2s
-    while n % 2 == 0:
+    warmup()
+    limit = int(math.isqrt(n))
+    for p in _SMALL_PRIMES:
+        if p > limit or n == 1:
+            break
+        if n % p == 0:
+            while n % p == 0:
+                factors.append(p)
+                n //= p
+            limit = int(math.isqrt(n))
+
+    # table exhausted (or disabled): fall back to trial division
+    while n % 2 == 0 and n > 1:
         factors.append(2)
         n //= 2
 
-    # odd factors
-    f = 3
+    f = max(3, (TABLE_LIMIT + 1) | 1)
     limit = int(math.isqrt(n))
     while f <= limit and n > 1:
         while n % f == 0:
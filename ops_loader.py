@@ -0,0 +1,213 @@
+"""
+ops_loader.py
+
+Op loading for the agent and its CPU pool processes.
+
+The agent only serves the ops listed in TASKS:
+- In the parent, load_ops() resolves each name to a LazyOp without importing
+  the op module; the import happens on first call (if the parent ever runs
+  the op inline).
+- In the CPU pool, preload_ops() imports the op modules and runs their
+  optional warmup() hook (precomputed tables, compiled regexes, ...). With a
+  forkserver pool this happens once in the forkserver (see ops_preload.py)
+  and every pool process inherits the result; init_worker() repeats it as a
+  cheap no-op, or does the real work for spawn/fork pools.
+- describe_ops() reports back from a pool process which ops failed to
+  import or warm up (with tracebacks), so the agent can stop serving them.
+"""
+
+import importlib
+import importlib.util
+import os
+import signal
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import ops
+
+
+def _split(tasks: Any) -> List[str]:
+    if isinstance(tasks, str):
+        tasks = tasks.split(",")
+    return [str(t).strip() for t in tasks or [] if str(t).strip()]
+
+
+class LazyOp:
+    """Callable stand-in for an op handler that imports its module on first use."""
+
+    def __init__(self, name: str):
+        self.name = name
+        # Set from the pool's describe_ops() so the parent never imports the module to find out.
+        self.batch = False
+        self._fn: Optional[Callable[[Any], Any]] = None
+
+    def resolve(self) -> Callable[[Any], Any]:
+        if self._fn is None:
+            fn = ops.get_op(self.name)
+            if fn is None:
+                err = ops.LOAD_ERRORS.get(self.name, "not registered")
+                raise RuntimeError(f"unknown op: {self.name} ({err})")
+            self._fn = fn
+        return self._fn
+
+    def __call__(self, payload: Any) -> Any:
+        return self.resolve()(payload)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._fn is not None else "lazy"
+        return f"<LazyOp {self.name} {state}>"
+
+
+def _op_available(name: str) -> bool:
+    if name in ops.OPS_REGISTRY:
+        return True
+    module_name = ops.module_for(name)
+    if not module_name:
+        return False
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except Exception:
+        return False
+
+
+def load_ops(tasks: Iterable[str]) -> Dict[str, LazyOp]:
+    """
+    Resolve the op names listed in TASKS without importing their modules.
+
+    Unknown ops are reported (not silently dropped) and left out of the map.
+    This only checks that a module exists; whether it imports and warms up
+    is found out in the pool (describe_ops()).
+    """
+    out: Dict[str, LazyOp] = {}
+    for name in _split(tasks):
+        if _op_available(name):
+            out[name] = LazyOp(name)
+        else:
+            print(f"[ops] WARNING: op '{name}' listed in TASKS but no module provides it", flush=True)
+    return out
+
+
+def preload_modules(tasks: Iterable[str]) -> List[str]:
+    """Module names to import ahead of time for the given op names."""
+    mods: List[str] = []
+    for name in _split(tasks):
+        module_name = ops.module_for(name)
+        if module_name and module_name not in mods:
+            mods.append(module_name)
+    return mods
+
+
+# Per process: op name -> traceback of its failed import / registration / warmup,
+# and the modules already warmed (or their traceback). Inherited from the forkserver.
+_PRELOAD_ERRORS: Dict[str, str] = {}
+_WARMED: Dict[str, Optional[str]] = {}
+
+
+def _warm_module(module_name: str) -> Optional[str]:
+    """Import a module and run its warmup() once per process; returns a traceback on failure."""
+    if module_name not in _WARMED:
+        try:
+            mod = importlib.import_module(module_name)
+            warm = getattr(mod, "warmup", None)
+            if callable(warm):
+                warm()
+            _WARMED[module_name] = None
+        except Exception:
+            _WARMED[module_name] = traceback.format_exc()
+    return _WARMED[module_name]
+
+
+def preload_ops(tasks: Iterable[str]) -> Dict[str, str]:
+    """
+    Import the op modules for `tasks` and run their warmup() hooks.
+
+    Returns {op_name: traceback} for ops that failed to import, register or
+    warm up; safe to call repeatedly (each module is tried once per process).
+    """
+    errors: Dict[str, str] = {}
+    for name in _split(tasks):
+        if name not in _PRELOAD_ERRORS:
+            module_name = ops.module_for(name)
+            err = _warm_module(module_name) if module_name else None
+            if err is None and ops.get_op(name) is None:
+                err = f"RuntimeError: op {name} not registered ({ops.LOAD_ERRORS.get(name, 'no handler')})"
+            if err is None:
+                continue
+            _PRELOAD_ERRORS[name] = err
+        errors[name] = _PRELOAD_ERRORS[name]
+    return errors
+
+
+# ---------------- pool process entry points ----------------
+
+
+def init_worker(tasks: List[str]) -> None:
+    """ProcessPoolExecutor initializer: make sure the served ops are ready."""
+    # Ctrl-C reaches the whole process group; the parent decides how to drain.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    preload_ops(tasks)
+
+
+def warm_worker(hold_sec: float = 0.0) -> int:
+    """
+    No-op used to spawn and initialize pool processes before registering.
+
+    Holding briefly keeps one process busy so concurrent warm calls land on
+    distinct processes instead of being absorbed by the first idle one.
+    """
+    if hold_sec > 0:
+        time.sleep(hold_sec)
+    return os.getpid()
+
+
+def describe_ops(tasks: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Return {op_name: {"batch": has_batch_handler, "error": traceback or None}}
+    as seen from inside a pool process, where the ops were preloaded.
+    """
+    errors = preload_ops(tasks)
+    return {name: {"batch": name not in errors and ops.is_batch_op(name), "error": errors.get(name)}
+            for name in _split(tasks)}
+
+
+def run_op(op_name: str, payload: Any) -> Any:
+    fn = ops.get_op(op_name)
+    if not fn:
+        raise RuntimeError(f"unknown op: {op_name}")
+    return fn(payload)
+
+
+def run_batch(op_name: str, payloads: List[Any]) -> List[Tuple[bool, Any, float]]:
+    """
+    Run many payloads of one op in a single call.
+
+    Returns one (ok, result_or_error, ms) triple per payload. Batch handlers
+    get the whole list at once and may return an Exception in place of a
+    result to fail just that item; their run time is split evenly over the
+    items. Legacy ops fall back to per-item calls, timed one by one, so one
+    bad payload only fails its own task.
+    """
+    batch_fn = ops.get_batch_op(op_name)
+    if batch_fn is not None:
+        t0 = time.perf_counter()
+        results = batch_fn(list(payloads))
+        if not isinstance(results, list) or len(results) != len(payloads):
+            raise RuntimeError(
+                f"batch op {op_name} returned {type(results).__name__} "
+                f"of length {len(results) if hasattr(results, '__len__') else '?'} for {len(payloads)} payloads"
+            )
+        ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(results))
+        return [(False, str(r), ms) if isinstance(r, Exception) else (True, r, ms) for r in results]
+
+    fn = ops.get_op(op_name)
+    if not fn:
+        raise RuntimeError(f"unknown op: {op_name}")
+    out: List[Tuple[bool, Any, float]] = []
+    for payload in payloads:
+        t0 = time.perf_counter()
+        try:
+            out.append((True, fn(payload), (time.perf_counter() - t0) * 1000.0))
+        except Exception as e:
+            out.append((False, str(e), (time.perf_counter() - t0) * 1000.0))
+    return out
@@ -0,0 +1,17 @@
+"""
+ops_preload.py
+
+Forkserver preload hook.
+
+app.py lists this module in set_forkserver_preload(), so it is imported once
+inside the multiprocessing forkserver. It imports and warms the ops named in
+OPS_PRELOAD (set by app.py from TASKS before the pool starts); every pool
+process forked afterwards inherits those modules and their tables, and the
+errors of ops that failed, which describe_ops() reports to the agent.
+"""
+
+import os
+
+from ops_loader import preload_ops
+
+preload_ops(os.getenv("OPS_PRELOAD", ""))
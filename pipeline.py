@@ -0,0 +1,194 @@
+"""
+pipeline.py
+
+Local multi-op pipelines.
+
+A task with op "pipeline" carries a small DAG of registered ops that the
+agent runs inside one pool process. Intermediate outputs stay Python objects
+in that process and are handed to the next stage by reference; only the
+final output is JSON-encoded and posted. Per-stage timings go into meta.
+
+    {"op": "pipeline", "payload": {
+        "stages": [
+            {"id": "rows", "op": "csv_shard", "payload": {"source_uri": "/data/tickets.csv", "shard_size": 1}},
+            {"id": "summary", "op": "map_summarize", "inputs": {"text": "rows.rows.0.body"},
+             "payload": {"sentences": 2}},
+            {"id": "label", "op": "map_classify", "inputs": {"text": "summary.summary"}}
+        ],
+        "output": "label"
+    }}
+
+Stage fields:
+  id       unique name (default "s<index>")
+  op       op name; must be one this agent serves
+  payload  literal payload
+  input    ref whose value *is* the payload (not combined with payload/inputs)
+  inputs   {field: ref} set into a copy of `payload` (a dict)
+
+A stage with none of payload/input/inputs takes the previous stage's output.
+A ref is "<stage id>" or "<stage id>.<key or list index>...". Stages run in
+dependency order (listed order among independent stages); `output` defaults
+to the last stage.
+
+A stage fails the pipeline when its op raises or returns {"ok": False, ...}
+(the convention of the built-in ops).
+
+Stage ops receive upstream objects themselves, not copies: an op that
+mutates its payload changes what later stages of the same pipeline see.
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import ops
+
+PIPELINE_OP = "pipeline"
+MAX_STAGES = 32
+
+
+def _ref_stage(ref: Any) -> str:
+    if not isinstance(ref, str) or not ref:
+        raise ValueError(f"bad ref {ref!r}: expected '<stage id>[.path]'")
+    return ref.split(".", 1)[0]
+
+
+def plan(payload: Any, allowed: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Validate a pipeline payload and order its stages.
+
+    Raises ValueError with a message fit for the task's error field. Ops are
+    checked against `allowed` (when given) without importing anything, so the
+    agent can reject a bad pipeline before it reaches the pool.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("stages"), list):
+        raise ValueError("pipeline payload needs a 'stages' list")
+    raw = payload["stages"]
+    if not raw:
+        raise ValueError("pipeline has no stages")
+    if len(raw) > MAX_STAGES:
+        raise ValueError(f"pipeline has {len(raw)} stages (max {MAX_STAGES})")
+    allowed_set = set(allowed) if allowed is not None else None
+
+    stages: List[Dict[str, Any]] = []
+    ids: Dict[str, int] = {}
+    for i, st in enumerate(raw):
+        if not isinstance(st, dict):
+            raise ValueError(f"stage {i} is not an object")
+        sid = str(st.get("id") or f"s{i}")
+        op = str(st.get("op") or "")
+        if sid in ids:
+            raise ValueError(f"duplicate stage id {sid!r}")
+        if not op:
+            raise ValueError(f"stage {sid!r} has no op")
+        if op == PIPELINE_OP:
+            raise ValueError(f"stage {sid!r}: pipelines cannot nest")
+        if allowed_set is not None and op not in allowed_set:
+            raise ValueError(f"stage {sid!r}: op {op!r} is not served by this agent")
+
+        stage: Dict[str, Any] = {"id": sid, "op": op}
+        if "input" in st:
+            if "payload" in st or "inputs" in st:
+                raise ValueError(f"stage {sid!r}: 'input' cannot be combined with 'payload'/'inputs'")
+            stage["input"] = st["input"]
+        elif "inputs" in st:
+            if not isinstance(st["inputs"], dict):
+                raise ValueError(f"stage {sid!r}: 'inputs' must map fields to refs")
+            base = st.get("payload", {})
+            if not isinstance(base, dict):
+                raise ValueError(f"stage {sid!r}: 'payload' must be an object when 'inputs' is used")
+            stage["payload"] = base
+            stage["inputs"] = dict(st["inputs"])
+        elif "payload" in st:
+            stage["payload"] = st["payload"]
+        elif stages:
+            stage["input"] = stages[-1]["id"]
+        else:
+            raise ValueError(f"stage {sid!r}: first stage needs a payload")
+
+        refs = [stage["input"]] if "input" in stage else list(stage.get("inputs", {}).values())
+        stage["deps"] = sorted({_ref_stage(r) for r in refs})
+        ids[sid] = i
+        stages.append(stage)
+
+    for stage in stages:
+        for dep in stage["deps"]:
+            if dep not in ids:
+                raise ValueError(f"stage {stage['id']!r} refers to unknown stage {dep!r}")
+            if dep == stage["id"]:
+                raise ValueError(f"stage {dep!r} refers to itself")
+
+    # Kahn's algorithm; among ready stages keep the listed order.
+    done: set = set()
+    order: List[Dict[str, Any]] = []
+    pending = list(stages)
+    while pending:
+        ready = [s for s in pending if all(d in done for d in s["deps"])]
+        if not ready:
+            raise ValueError("pipeline stages form a cycle: " + ", ".join(s["id"] for s in pending))
+        st = ready[0]
+        pending.remove(st)
+        done.add(st["id"])
+        order.append(st)
+
+    output = str(payload.get("output") or stages[-1]["id"])
+    if output not in ids:
+        raise ValueError(f"pipeline output {output!r} is not a stage")
+    return {"stages": order, "output": output}
+
+
+def _resolve(ref: str, outputs: Dict[str, Any]) -> Any:
+    sid, _, path = ref.partition(".")
+    value = outputs[sid]
+    if not path:
+        return value
+    for key in path.split("."):
+        if isinstance(value, list):
+            try:
+                value = value[int(key)]
+            except (ValueError, IndexError):
+                raise ValueError(f"ref {ref!r}: no index {key!r}")
+        elif isinstance(value, dict):
+            if key not in value:
+                raise ValueError(f"ref {ref!r}: no key {key!r}")
+            value = value[key]
+        else:
+            raise ValueError(f"ref {ref!r}: cannot index {type(value).__name__} with {key!r}")
+    return value
+
+
+def run_pipeline(planned: Dict[str, Any]) -> Tuple[bool, Any, List[Dict[str, Any]]]:
+    """
+    Pool entry point: run a plan() result in this process.
+
+    Returns (True, final_output, timings) or (False, error, timings), where
+    timings lists {"id", "op", "ms", "cpu_ms"} for every stage that ran.
+    """
+    outputs: Dict[str, Any] = {}
+    timings: List[Dict[str, Any]] = []
+    for stage in planned["stages"]:
+        sid, op = stage["id"], stage["op"]
+        t0 = time.perf_counter()
+        c0 = time.process_time()
+        try:
+            if "input" in stage:
+                payload = _resolve(stage["input"], outputs)
+            elif "inputs" in stage:
+                payload = dict(stage["payload"])
+                for field, ref in stage["inputs"].items():
+                    payload[field] = _resolve(ref, outputs)
+            else:
+                payload = stage["payload"]
+            fn = ops.get_op(op)
+            if not fn:
+                raise RuntimeError(f"unknown op: {op}")
+            out = fn(payload)
+            if isinstance(out, dict) and out.get("ok") is False:
+                raise RuntimeError(str(out.get("error") or "op reported failure"))
+            outputs[sid] = out
+        except Exception as e:
+            timings.append({"id": sid, "op": op, "ms": (time.perf_counter() - t0) * 1000.0,
+                            "cpu_ms": (time.process_time() - c0) * 1000.0, "error": str(e)})
+            return False, f"stage {sid!r} ({op}): {e}", timings
+        timings.append({"id": sid, "op": op, "ms": (time.perf_counter() - t0) * 1000.0,
+                        "cpu_ms": (time.process_time() - c0) * 1000.0})
+    return True, outputs[planned["output"]], timings
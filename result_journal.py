@@ -0,0 +1,291 @@
+"""
+result_journal.py
+
+Durable, append-only journal of result POST bodies.
+
+Every completed result is appended (and fsync'd, group-committed across
+concurrent writers) before the agent tries to upload it, so a controller
+outage or an agent restart never throws a finished computation away.
+
+Record format (binary, one file):
+
+    R <seq> <len> <dlen>\n<dest><body>\n   result body (JSON bytes) and the
+                                          controller it goes to, `dlen` bytes
+                                          (empty for the primary controller)
+    A <seq>\n                             upload acknowledged
+
+The destination is length-prefixed, so any key can be stored.
+
+On open the file is scanned to rebuild the set of unacknowledged results; a
+torn record at the tail (crash mid-write) is cut off, and a corrupt record
+elsewhere is skipped (with a warning) without losing the ones after it. Once everything is
+acknowledged the file is truncated; otherwise it is rewritten with only the
+live records when acknowledged records dominate it. Disk use is capped: when
+a new record would not fit even after compaction, the oldest unacknowledged
+results are dropped.
+
+Callers claim a record while they upload it (append() returns it claimed) so
+the replay loop never posts the same record concurrently. Upload order is
+kept per destination, so one unreachable controller does not hold back
+results for the others.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Collection, Dict, Optional, Set, Tuple
+
+# Rewrite the file once it is at least this big and mostly acknowledged records.
+_COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+
+class ResultJournal:
+    def __init__(self, path: str, max_bytes: int, fsync_delay_ms: float = 2.0):
+        self.path = path
+        self.max_bytes = max(64 * 1024, int(max_bytes))
+        self.fsync_delay = max(0.0, fsync_delay_ms) / 1000.0
+
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[int, Tuple[int, int, str]]" = OrderedDict()  # seq -> (offset, length, dest)
+        self._claimed: Set[int] = set()
+        self._next_seq = 1
+        self._live_bytes = 0
+        self.dropped = 0
+
+        self._sync_cond = threading.Condition()
+        self._syncing = False
+        self._written_seq = 0
+        self._synced_seq = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._recover()
+        self._f = open(self.path, "ab")
+        self._rf = open(self.path, "rb")
+
+    # ---------------- recovery ----------------
+
+    def _recover(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        good_end = 0
+        corrupt = 0
+        with open(self.path, "rb") as f:
+            while True:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # torn tail (or end of file)
+                parts = line.split()
+                try:
+                    if parts[0] == b"R" and len(parts) == 4:
+                        seq, length, dlen = int(parts[1]), int(parts[2]), int(parts[3])
+                        if min(seq, length, dlen) < 0:
+                            raise ValueError("negative field")
+                        offset = f.tell()
+                        record = f.read(dlen + length + 1)
+                        if len(record) != dlen + length + 1:
+                            break  # torn tail
+                        if not record.endswith(b"\n"):
+                            raise ValueError("record length mismatch")
+                        dest = record[:dlen].decode("utf-8")
+                        self._pending[seq] = (offset + dlen, length, dest)
+                        self._live_bytes += length
+                    elif parts[0] == b"A" and len(parts) == 2:
+                        seq = int(parts[1])
+                        entry = self._pending.pop(seq, None)
+                        if entry:
+                            self._live_bytes -= entry[1]
+                    else:
+                        raise ValueError("unknown record")
+                except (IndexError, ValueError):
+                    # Resynchronise on the next line; bodies are single-line JSON.
+                    corrupt += 1
+                    f.seek(good_end)
+                    f.readline()
+                    good_end = f.tell()
+                    continue
+                self._next_seq = max(self._next_seq, seq + 1)
+                good_end = f.tell()
+        if good_end < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+        if corrupt:
+            print(f"[journal] WARNING: skipped {corrupt} corrupt records in {self.path}", flush=True)
+        self._written_seq = self._synced_seq = self._next_seq - 1
+
+    # ---------------- writes ----------------
+
+    def append(self, body: bytes, dest: str = "") -> int:
+        """
+        Durably record a result body bound for controller `dest` ("" = primary);
+        returns its seq, already claimed by the caller.
+        """
+        body = bytes(body)
+        with self._lock:
+            self._make_room(len(body) + len(dest))
+            seq = self._next_seq
+            self._next_seq += 1
+            header = _header(seq, len(body), dest)
+            offset = self._f.tell() + len(header)
+            self._f.write(header)
+            self._f.write(body)
+            self._f.write(b"\n")
+            self._pending[seq] = (offset, len(body), dest)
+            self._claimed.add(seq)
+            self._live_bytes += len(body)
+            self._written_seq = seq
+        self._wait_durable(seq)
+        return seq
+
+    def ack(self, seq: int) -> None:
+        """Mark a result as uploaded; compacts the file when that pays off."""
+        with self._lock:
+            self._claimed.discard(seq)
+            entry = self._pending.pop(seq, None)
+            if entry is None:
+                return
+            self._live_bytes -= entry[1]
+            self._f.write(b"A %d\n" % seq)
+            if not self._pending:
+                self._truncate()
+            elif self._f.tell() >= _COMPACT_MIN_BYTES and self._live_bytes * 2 < self._f.tell():
+                self._compact()
+
+    def release(self, seq: int) -> None:
+        """Give a claimed record back to the replay queue (upload failed)."""
+        with self._lock:
+            self._claimed.discard(seq)
+
+    def _wait_durable(self, seq: int) -> None:
+        # Group commit: one writer fsyncs for everyone that appended meanwhile.
+        with self._sync_cond:
+            while self._synced_seq < seq:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._sync_cond.wait()
+            else:
+                return
+        target = seq
+        try:
+            if self.fsync_delay:
+                time.sleep(self.fsync_delay)
+            with self._lock:
+                target = self._written_seq
+                self._f.flush()
+                os.fsync(self._f.fileno())
+        finally:
+            with self._sync_cond:
+                self._syncing = False
+                self._synced_seq = max(self._synced_seq, target)
+                self._sync_cond.notify_all()
+
+    # ---------------- replay ----------------
+
+    def claim_next(self, skip: Collection[str] = ()) -> Optional[Tuple[int, bytes, str]]:
+        """
+        Claim the oldest unclaimed record whose destination is not in `skip`;
+        returns (seq, body, dest) or None.
+        """
+        with self._lock:
+            for seq, (offset, length, dest) in self._pending.items():
+                if seq in self._claimed or dest in skip:
+                    continue
+                self._f.flush()
+                self._rf.seek(offset)
+                body = self._rf.read(length)
+                self._claimed.add(seq)
+                return seq, body, dest
+        return None
+
+    def backlog(self, dest: Optional[str] = None) -> int:
+        """Number of unacknowledged records nobody is uploading right now (for `dest`, if given)."""
+        with self._lock:
+            if dest is None:
+                return len(self._pending) - len(self._claimed)
+            return sum(1 for seq, entry in self._pending.items() if entry[2] == dest and seq not in self._claimed)
+
+    def pending_by_dest(self) -> Dict[str, int]:
+        """Unacknowledged records per destination, claimed or not."""
+        out: Dict[str, int] = {}
+        with self._lock:
+            for _, _, dest in self._pending.values():
+                out[dest] = out.get(dest, 0) + 1
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "live_bytes": self._live_bytes,
+                "file_bytes": self._f.tell(),
+                "dropped": self.dropped,
+            }
+
+    # ---------------- space management (called with _lock held) ----------------
+
+    def _truncate(self) -> None:
+        self._f.flush()
+        self._f.truncate(0)
+        self._f.seek(0)
+        self._live_bytes = 0
+
+    def _make_room(self, nbytes: int) -> None:
+        need = nbytes + 64
+        if self._f.tell() + need <= self.max_bytes:
+            return
+        # Free down to 3/4 of the cap so we do not compact again on the very next append.
+        target = self.max_bytes * 3 // 4
+        dropped = 0
+        while self._pending and self._live_bytes + need + 64 * len(self._pending) > target:
+            seq, (_, length, _) = self._pending.popitem(last=False)
+            self._claimed.discard(seq)
+            self._live_bytes -= length
+            dropped += 1
+        if dropped:
+            self.dropped += dropped
+            print(f"[journal] WARNING: disk cap {self.max_bytes} bytes reached; dropped {dropped} oldest results",
+                  flush=True)
+        self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only unacknowledged records (atomic rename)."""
+        self._f.flush()
+        tmp = self.path + ".tmp"
+        moved: "OrderedDict[int, Tuple[int, int, str]]" = OrderedDict()
+        with open(tmp, "wb") as out:
+            for seq, (offset, length, dest) in self._pending.items():
+                self._rf.seek(offset)
+                body = self._rf.read(length)
+                out.write(_header(seq, length, dest))
+                moved[seq] = (out.tell(), length, dest)
+                out.write(body)
+                out.write(b"\n")
+            out.flush()
+            os.fsync(out.fileno())
+        self._f.close()
+        self._rf.close()
+        os.replace(tmp, self.path)
+        self._pending = moved
+        self._f = open(self.path, "ab")
+        self._rf = open(self.path, "rb")
+
+    @property
+    def closed(self) -> bool:
+        return self._f.closed
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._f.flush()
+                os.fsync(self._f.fileno())
+            except Exception:
+                pass
+            self._f.close()
+            self._rf.close()
+
+
+def _header(seq: int, length: int, dest: str) -> bytes:
+    """Everything of a result record that precedes its body."""
+    d = dest.encode("utf-8")
+    return b"R %d %d %d\n%s" % (seq, length, len(d), d)
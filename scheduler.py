@@ -0,0 +1,202 @@
+"""
+scheduler.py
+
+Local scheduler between leasing and execution.
+
+Worker loops put leased tasks here and take work back out. Tasks wait in
+per-op queues and the next unit of work is the one with the lowest score:
+
+    score_ms = expected_ms(op)                 per-op EWMA of measured run time
+             - aging * waited_ms               nothing starves: waiting lowers the score
+             - priority_ms * task["priority"]  optional, higher runs sooner
+    score_ms = min(score_ms, slack_ms)         optional task["deadline"] (unix seconds):
+                                               slack = time left minus expected run time
+
+So short ops overtake long ones (shortest-expected-job-first), while a long
+task waits at most about its own expected run time / aging. Ops without a
+measurement yet count as instant so they get measured early. When the chosen
+task belongs to a batch op, other queued tasks of that op are taken with it
+(up to a size cap) so the pool can run them in one vectorized call.
+
+Fair share: tasks carry the agent identity they were leased for
+(task["_agent"]). Each identity is charged the expected run time of what it
+is handed, divided by its share; among identities with queued tasks the one
+with the least charge goes next, and scoring picks within its tasks. An
+identity that was idle starts again level with the busy ones instead of
+cashing in the time it did not use.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# (enqueued_at, task)
+_Entry = Tuple[float, Dict[str, Any]]
+
+
+class LocalScheduler:
+    def __init__(self, ewma_alpha: float = 0.2, aging: float = 0.5, priority_ms: float = 1000.0):
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Entry]] = {}
+        self._count = 0
+        self._ewma_ms: Dict[str, float] = {}
+        # fair share: identity -> share, queued tasks, charged ms / share
+        self._shares: Dict[str, float] = {}
+        self._depth: Dict[str, int] = {}
+        self._charged: Dict[str, float] = {}
+        self.tune(ewma_alpha, aging, priority_ms)
+
+    def tune(self, ewma_alpha: float, aging: float, priority_ms: float) -> None:
+        """(Re)set the scoring parameters; queued tasks and the runtime model are kept."""
+        with self._lock:
+            self.ewma_alpha = min(1.0, max(0.01, float(ewma_alpha)))
+            self.aging = max(0.0, float(aging))
+            self.priority_ms = float(priority_ms)
+
+    # ---------------- runtime model ----------------
+
+    def record(self, op: str, ms: float) -> None:
+        """Feed a measured per-task execution time (ms) into the op's EWMA."""
+        with self._lock:
+            prev = self._ewma_ms.get(op)
+            self._ewma_ms[op] = ms if prev is None else prev + self.ewma_alpha * (ms - prev)
+
+    def expected_ms(self, op: str) -> float:
+        with self._lock:
+            return self._expected_locked(op)
+
+    def _expected_locked(self, op: str) -> float:
+        # Unknown ops are treated as instant, so they run (and get measured) early.
+        return self._ewma_ms.get(op, 0.0)
+
+    def _score(self, op: str, entry: _Entry, now: float) -> float:
+        enq, task = entry
+        expected = self._expected_locked(op)
+        score = expected - self.aging * (now - enq) * 1000.0
+        try:
+            score -= self.priority_ms * float(task.get("priority") or 0)
+        except (TypeError, ValueError):
+            pass
+        deadline = task.get("deadline")
+        if deadline is not None:
+            try:
+                slack_ms = (float(deadline) - now) * 1000.0 - expected
+                score = min(score, slack_ms)
+            except (TypeError, ValueError):
+                pass
+        return score
+
+    # ---------------- fair share ----------------
+
+    def set_share(self, identity: str, share: float) -> None:
+        with self._lock:
+            self._shares[identity] = max(1e-6, float(share))
+
+    def _charge_locked(self, identity: str, op: str) -> None:
+        # Floor of 1 ms so ops without a measurement are not free.
+        cost = max(1.0, self._expected_locked(op))
+        self._charged[identity] = self._charged.get(identity, 0.0) + cost / self._shares.get(identity, 1.0)
+
+    def _next_identity_locked(self) -> Optional[str]:
+        busy = [i for i, n in self._depth.items() if n > 0]
+        if len(busy) < 2:
+            return None
+        return min(busy, key=lambda i: self._charged.get(i, 0.0))
+
+    # ---------------- queueing ----------------
+
+    def put(self, task: Dict[str, Any]) -> None:
+        op = str(task.get("op") or "")
+        ident = str(task.get("_agent") or "")
+        with self._lock:
+            if not self._depth.get(ident):
+                # Back from idle: no credit for the time nothing was queued.
+                busy = [self._charged.get(i, 0.0) for i, n in self._depth.items() if n > 0]
+                if busy:
+                    self._charged[ident] = max(self._charged.get(ident, 0.0), min(busy))
+            self._depth[ident] = self._depth.get(ident, 0) + 1
+            self._queues.setdefault(op, deque()).append((time.time(), task))
+            self._count += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def take(self, is_batch: Callable[[str], bool], max_batch: int) -> List[Dict[str, Any]]:
+        """
+        Pop the next unit of work: the lowest-score task of the identity whose
+        turn it is, plus queued tasks of the same op when it is a batch op.
+        Returns [] when nothing is queued.
+        """
+        now = time.time()
+        with self._lock:
+            ident = self._next_identity_locked()
+            best: Optional[Tuple[float, str, int]] = None
+            for op, q in self._queues.items():
+                for i, entry in enumerate(q):
+                    if ident is not None and str(entry[1].get("_agent") or "") != ident:
+                        continue
+                    score = self._score(op, entry, now)
+                    if best is None or score < best[0]:
+                        best = (score, op, i)
+            if best is None:
+                return []
+
+            _, op, i = best
+            q = self._queues[op]
+            _, head = q[i]
+            del q[i]
+            group = [head]
+            if op and max_batch > 1 and is_batch(op):
+                if ident is None:
+                    while q and len(group) < max_batch:
+                        group.append(q.popleft()[1])
+                else:
+                    # Only the chosen identity's tasks ride along.
+                    rest: Deque[_Entry] = deque()
+                    for entry in q:
+                        if len(group) < max_batch and str(entry[1].get("_agent") or "") == ident:
+                            group.append(entry[1])
+                        else:
+                            rest.append(entry)
+                    q = self._queues[op] = rest
+            if not q:
+                del self._queues[op]
+            self._count -= len(group)
+            for task in group:
+                ident = str(task.get("_agent") or "")
+                self._depth[ident] -= 1
+                self._charge_locked(ident, op)
+            return group
+
+    def identity_depth(self, identity: str) -> int:
+        """Queued task count of one identity."""
+        with self._lock:
+            return self._depth.get(identity, 0)
+
+    def depths(self) -> Dict[str, int]:
+        """Queued task count per op."""
+        with self._lock:
+            return {op: len(q) for op, q in self._queues.items()}
+
+    def model(self) -> Dict[str, float]:
+        """Current per-op expected run time (ms)."""
+        with self._lock:
+            return dict(self._ewma_ms)
+
+    def shares(self) -> Dict[str, Dict[str, float]]:
+        """Per identity: share, queued tasks, and charged ms (divided by share)."""
+        with self._lock:
+            idents = set(self._shares) | set(self._depth)
+            return {i: {"share": self._shares.get(i, 1.0), "queued": self._depth.get(i, 0),
+                        "charged_ms": round(self._charged.get(i, 0.0), 3)} for i in idents}
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Remove and return everything still queued."""
+        with self._lock:
+            out = [task for q in self._queues.values() for _, task in q]
+            self._queues.clear()
+            self._count = 0
+            self._depth.clear()
+            return out
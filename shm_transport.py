@@ -0,0 +1,260 @@
+"""
+shm_transport.py
+
+Opt-in shared-memory transport between the agent and its CPU pool.
+
+Large payloads and results normally cross the process boundary by pickling
+and are then re-encoded into the JSON result body. With SHM_TRANSPORT=1:
+
+- the parent reads only the envelope of a large leased task (job_id, op,
+  ...; see read_envelope) and copies the raw task JSON into a shared-memory
+  segment; the pool process gets only a ShmRef (name + length) and decodes
+  the payload there;
+- the parent also hands over a result segment sized from what the op
+  returned before; the pool process writes the JSON-encoded result straight
+  into it, and the parent splices those bytes into the POST body without
+  decoding or re-encoding them.
+
+All segments are owned by the parent's SegmentPool and recycled by size
+class; pool processes only attach for the duration of one task, so a segment
+the parent discards is not kept mapped by them.
+"""
+
+import json
+import re
+import threading
+from json.decoder import scanstring
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from ops_loader import run_op
+
+
+class ShmRef(NamedTuple):
+    name: str
+    size: int  # bytes used (payload) or capacity (result segment)
+
+
+def _size_class(nbytes: int, min_bytes: int) -> int:
+    size = max(1, min_bytes)
+    while size < nbytes:
+        size <<= 1
+    return size
+
+
+class SegmentPool:
+    """Parent-side pool of recycled shared-memory segments, bucketed by power-of-two size."""
+
+    def __init__(self, min_bytes: int, max_pooled_bytes: int):
+        self.min_bytes = max(4096, int(min_bytes))
+        self.max_pooled_bytes = max(0, int(max_pooled_bytes))
+        self._lock = threading.Lock()
+        self._free: Dict[int, List[shared_memory.SharedMemory]] = {}
+        self._pooled_bytes = 0
+        self._in_use: Dict[str, shared_memory.SharedMemory] = {}
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, nbytes: int) -> shared_memory.SharedMemory:
+        size = _size_class(nbytes, self.min_bytes)
+        with self._lock:
+            bucket = self._free.get(size)
+            if bucket:
+                shm = bucket.pop()
+                self._pooled_bytes -= size
+                self.reused += 1
+                self._in_use[shm.name] = shm
+                return shm
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        with self._lock:
+            self.created += 1
+            self._in_use[shm.name] = shm
+        return shm
+
+    def release(self, shm: shared_memory.SharedMemory) -> None:
+        size = _size_class(shm.size, self.min_bytes)
+        with self._lock:
+            self._in_use.pop(shm.name, None)
+            if self._pooled_bytes + size <= self.max_pooled_bytes:
+                self._free.setdefault(size, []).append(shm)
+                self._pooled_bytes += size
+                return
+        _destroy(shm)
+
+    def discard(self, shm: shared_memory.SharedMemory) -> None:
+        """Drop a segment a pool process may still touch (e.g. after a timeout) instead of recycling it."""
+        with self._lock:
+            self._in_use.pop(shm.name, None)
+        _destroy(shm)
+
+    def write(self, data: bytes) -> Tuple[shared_memory.SharedMemory, ShmRef]:
+        """Copy `data` into a pooled segment; returns the segment and its ref."""
+        shm = self.acquire(len(data))
+        shm.buf[:len(data)] = data
+        return shm, ShmRef(shm.name, len(data))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pooled_bytes": self._pooled_bytes,
+                "in_use": len(self._in_use),
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            segs = [s for bucket in self._free.values() for s in bucket] + list(self._in_use.values())
+            self._free.clear()
+            self._in_use.clear()
+            self._pooled_bytes = 0
+        for shm in segs:
+            _destroy(shm)
+
+
+def _destroy(shm: shared_memory.SharedMemory) -> None:
+    try:
+        shm.close()
+    except Exception:
+        pass
+    try:
+        shm.unlink()
+    except Exception:
+        pass
+
+
+# ---------------- envelope ----------------
+
+_WS_RE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+_SKIP_MAX_TOKENS = 1024
+
+
+def _string_end(text: str, pos: int) -> int:
+    """Offset after the closing quote of the string whose body starts at `pos`."""
+    start = pos
+    for _ in range(_SKIP_MAX_TOKENS):
+        q = text.find('"', pos)
+        if q < 0:
+            raise ValueError("unterminated string")
+        b = q
+        while text[b - 1] == "\\":
+            b -= 1
+        if (q - b) % 2 == 0:  # not escaped
+            return q + 1
+        pos = q + 1
+    return scanstring(text, start)[1]  # many escaped quotes: let the C decoder find the end
+
+
+def _skip_value(text: str, pos: int) -> int:
+    """
+    End offset of the JSON value at `pos`, found with str.find over its quotes
+    and brackets, without decoding it (nor checking it). A value with more
+    than _SKIP_MAX_TOKENS strings and brackets is decoded by the C decoder and
+    dropped instead, which is faster than stepping over its tokens here.
+    """
+    c = text[pos:pos + 1]
+    if c == '"':
+        return _string_end(text, pos + 1)
+    if c not in ("{", "["):
+        return _DECODER.raw_decode(text, pos)[1]  # number / true / false / null
+    start = pos
+    end = len(text)
+    # Next offset of each structural character at or after pos (end = none left, -1 = not looked up yet).
+    nxt = dict.fromkeys('"[]{}', -1)
+    depth = 0
+    for _ in range(_SKIP_MAX_TOKENS):
+        for ch, i in nxt.items():
+            if i < pos:
+                i = text.find(ch, pos)
+                nxt[ch] = end if i < 0 else i
+        ch = min(nxt, key=nxt.__getitem__)
+        pos = nxt[ch] + 1
+        if pos > end:
+            raise ValueError("unterminated value")
+        if ch == '"':
+            pos = _string_end(text, pos)
+        elif ch in ("{", "["):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+    return _DECODER.raw_decode(text, start)[1]
+
+
+def read_envelope(raw: bytes, skip: str = "payload") -> Optional[Dict[str, Any]]:
+    """
+    Decode the top-level fields of a JSON object except `skip`, whose value is
+    stepped over (see _skip_value). None if `raw` is not a JSON object
+    this reader can handle; the caller then decodes it in full.
+    """
+    try:
+        text = raw.decode("utf-8")
+        pos = _WS_RE.match(text).end()
+        if text[pos:pos + 1] != "{":
+            return None
+        pos = _WS_RE.match(text, pos + 1).end()
+        out: Dict[str, Any] = {}
+        if text[pos:pos + 1] == "}":
+            return out
+        while True:
+            if text[pos:pos + 1] != '"':
+                return None
+            key, pos = scanstring(text, pos + 1)
+            pos = _WS_RE.match(text, pos).end()
+            if text[pos:pos + 1] != ":":
+                return None
+            pos = _WS_RE.match(text, pos + 1).end()
+            if key == skip:
+                pos = _skip_value(text, pos)
+            else:
+                out[key], pos = _DECODER.raw_decode(text, pos)
+            pos = _WS_RE.match(text, pos).end()
+            c = text[pos:pos + 1]
+            if c == "}":
+                return out if not text[pos + 1:].strip() else None
+            if c != ",":
+                return None
+            pos = _WS_RE.match(text, pos + 1).end()
+    except ValueError:
+        return None
+
+
+# ---------------- pool process side ----------------
+
+
+def _detach(shm: shared_memory.SharedMemory) -> None:
+    try:
+        shm.close()
+    except Exception:
+        pass
+
+
+def run_op_shm(op_name: str, payload: Any, task_ref: Optional[ShmRef], result_ref: Optional[ShmRef]) -> Tuple[str, Any]:
+    """
+    Pool entry point for the shared-memory transport.
+
+    Reads the task from `task_ref` when given (else uses `payload`). The
+    result is JSON-encoded here, once; returns ("shm", nbytes) when it was
+    written into `result_ref`, or ("json", data) when there was no result
+    segment or it did not fit. Segments are detached before returning.
+    """
+    if task_ref is not None:
+        shm = shared_memory.SharedMemory(name=task_ref.name)
+        try:
+            task = json.loads(bytes(shm.buf[:task_ref.size]))
+        finally:
+            _detach(shm)
+        payload = task.get("payload") if isinstance(task, dict) else None
+
+    out = run_op(op_name, payload)
+    data = json.dumps(out).encode("utf-8")
+    if result_ref is None or len(data) > result_ref.size:
+        return "json", data
+    shm = shared_memory.SharedMemory(name=result_ref.name)
+    try:
+        shm.buf[:len(data)] = data
+    finally:
+        _detach(shm)
+    return "shm", len(data)
@@ -0,0 +1,198 @@
+"""
+stats_feed.py
+
+Agent-local stats feed for monitors (see monitor.py).
+
+The agent publishes a small JSON snapshot (status, throughput, queue depth,
+latency percentiles, ...) about once a second; a snapshot that did not change
+is not a new version, so an idle agent produces no events at all. Clients can:
+
+  GET /stats                          current snapshot; ETag + If-None-Match -> 304
+  GET /stats?wait=SEC                 with If-None-Match: long-poll until the
+                                      snapshot changes (304 after SEC)
+  GET /stats/stream                   Server-Sent Events: one "stats" event per
+                                      change, ": keepalive" comments in between
+
+Served on localhost by default; it is read-only.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+MAX_WAIT_SEC = 60.0
+KEEPALIVE_SEC = 15.0
+
+
+class TaskStats:
+    """Completed tasks over a sliding window: throughput and latency percentiles."""
+
+    def __init__(self, window_sec: float = 60.0, max_samples: int = 8192):
+        self.window_sec = float(window_sec)
+        self._lock = threading.Lock()
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)  # (ts, ms)
+        self.done = 0
+        self.failed = 0
+
+    def record(self, ms: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((time.time(), float(ms)))
+            self.done += 1
+            if not ok:
+                self.failed += 1
+
+    def summary(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            while self._samples and now - self._samples[0][0] > self.window_sec:
+                self._samples.popleft()
+            samples = list(self._samples)
+            done, failed = self.done, self.failed
+        recent = sum(1 for ts, _ in samples if now - ts <= 10.0)
+        out: Dict[str, Any] = {
+            "done": done,
+            "failed": failed,
+            "rate_10s": round(recent / 10.0, 2),
+            "rate_60s": round(len(samples) / self.window_sec, 2),
+            "latency_ms": None,
+        }
+        if samples:
+            ms = sorted(m for _, m in samples)
+            pick = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 1)  # noqa: E731
+            out["latency_ms"] = {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99)}
+        return out
+
+
+class StatsFeed:
+    """Latest snapshot plus a version that only moves when the snapshot changes."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._boot = f"{os.getpid():x}{int(time.time()):x}"
+        self._version = 0
+        self._body = b"{}"
+
+    def publish(self, snapshot: Dict[str, Any]) -> bool:
+        """Set the snapshot; returns True (and wakes waiters) if it changed."""
+        body = json.dumps(snapshot, sort_keys=True).encode("utf-8")
+        with self._cond:
+            if body == self._body:
+                return False
+            self._body = body
+            self._version += 1
+            self._cond.notify_all()
+            return True
+
+    def _etag_locked(self) -> str:
+        return f'"{self._boot}-{self._version}"'
+
+    def current(self) -> Tuple[str, bytes]:
+        with self._cond:
+            return self._etag_locked(), self._body
+
+    def wait(self, etag: Optional[str], timeout: float) -> Tuple[str, bytes]:
+        """Block until the snapshot's ETag differs from `etag` or `timeout` passes."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while etag is not None and self._etag_locked() == etag:
+                left = deadline - time.time()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            return self._etag_locked(), self._body
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    feed: StatsFeed
+    stopping: threading.Event
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _reply(self, code: int, etag: Optional[str] = None, body: bytes = b"") -> None:
+        self.send_response(code)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if code == 200:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        feed = self.server.feed
+        if url.path == "/stats":
+            known = self.headers.get("If-None-Match")
+            try:
+                wait = min(MAX_WAIT_SEC, max(0.0, float(parse_qs(url.query).get("wait", ["0"])[0])))
+            except ValueError:
+                wait = 0.0
+            etag, body = feed.wait(known, wait) if known and wait else feed.current()
+            if known == etag:
+                self._reply(304, etag)
+            else:
+                self._reply(200, etag, body)
+        elif url.path == "/stats/stream":
+            self._stream(feed)
+        else:
+            self._reply(404)
+
+    def _stream(self, feed: StatsFeed) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # One chunk per event, so clients see each event as soon as it is sent.
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        # A reconnecting client that already has the current snapshot gets no replay.
+        last = self.headers.get("Last-Event-ID")
+        try:
+            while not self.server.stopping.is_set():
+                etag, body = feed.wait(last, KEEPALIVE_SEC)
+                if etag == last:
+                    event = b": keepalive\n\n"
+                else:
+                    event = b"event: stats\nid: " + etag.encode("ascii") + b"\ndata: " + body + b"\n\n"
+                    last = etag
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+
+
+class StatsServer:
+    def __init__(self, addr: str, feed: StatsFeed):
+        host, _, port = addr.rpartition(":")
+        self.host = host or "127.0.0.1"
+        self.port = int(port)
+        self.feed = feed
+        self._server: Optional[_Server] = None
+
+    def start(self) -> None:
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.feed = self.feed
+        self._server.stopping = threading.Event()
+        threading.Thread(target=self._server.serve_forever, name="stats-feed", daemon=True).start()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
@@ -0,0 +1,140 @@
+"""
+task_cost.py
+
+Per-task resource accounting measured inside the CPU pool process, plus the
+per-op totals the agent keeps from it.
+
+meta["ms"] is wall time in the agent, so it includes waiting for a free pool
+process. measured() wraps a pool entry point and returns (result, usage):
+
+  run_ms        wall time of the call inside the pool process
+  cpu_ms        CPU time of the call (user + system)
+  cpu_user_ms   user CPU time      (where the resource module exists)
+  cpu_sys_ms    system CPU time    (where the resource module exists)
+  peak_rss_kb   peak resident set size of the pool process during the call
+  rss_delta_kb  peak_rss_kb minus the resident set size when the call started
+
+On Linux the process's peak-RSS counter is reset before each call
+(/proc/self/clear_refs), so peak_rss_kb is the task's own peak. Elsewhere it
+falls back to the getrusage() high-water mark, whose delta only shows growth
+past earlier peaks of the same process. Without the resource module (Windows)
+only run_ms and cpu_ms are reported.
+"""
+
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import resource
+except Exception:
+    resource = None
+
+_PROC_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+# ru_maxrss is in kB on Linux, bytes on macOS
+_MAXRSS_KB = 1.0 / 1024 if sys.platform == "darwin" else 1.0
+
+# Whether this process may reset its peak RSS; probed on first use.
+_can_reset_peak: Optional[bool] = None
+
+
+def _reset_peak_rss() -> bool:
+    global _can_reset_peak
+    if _can_reset_peak is False:
+        return False
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+        _can_reset_peak = True
+    except OSError:
+        _can_reset_peak = False
+    return _can_reset_peak
+
+
+def _proc_rss() -> Optional[Tuple[int, int]]:
+    """(VmHWM, VmRSS) in kB from /proc/self/status, or None."""
+    hwm = None
+    try:
+        with open(_PROC_STATUS, "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    hwm = int(line.split()[1])
+                elif line.startswith(b"VmRSS:"):
+                    return (hwm if hwm is not None else 0), int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def measured(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Dict[str, float]]:
+    """Pool entry point: run fn(*args) and return (its result, usage of this call)."""
+    rss0 = _proc_rss() if _reset_peak_rss() else None
+    ru0 = resource.getrusage(resource.RUSAGE_SELF) if resource is not None else None
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+
+    out = fn(*args)
+
+    run_ms = (time.perf_counter() - t0) * 1000.0
+    usage: Dict[str, float] = {"run_ms": round(run_ms, 3)}
+    if ru0 is not None:
+        ru1 = resource.getrusage(resource.RUSAGE_SELF)
+        user_ms = (ru1.ru_utime - ru0.ru_utime) * 1000.0
+        sys_ms = (ru1.ru_stime - ru0.ru_stime) * 1000.0
+        usage.update(cpu_ms=round(user_ms + sys_ms, 3), cpu_user_ms=round(user_ms, 3), cpu_sys_ms=round(sys_ms, 3))
+    else:
+        usage["cpu_ms"] = round((time.process_time() - cpu0) * 1000.0, 3)
+
+    rss1 = _proc_rss() if rss0 is not None else None
+    if rss0 is not None and rss1 is not None:
+        usage["peak_rss_kb"] = rss1[0]
+        usage["rss_delta_kb"] = max(0, rss1[0] - rss0[1])
+    elif ru0 is not None:
+        usage["peak_rss_kb"] = int(ru1.ru_maxrss * _MAXRSS_KB)
+        usage["rss_delta_kb"] = int(max(0, ru1.ru_maxrss - ru0.ru_maxrss) * _MAXRSS_KB)
+    return out, usage
+
+
+class OpCosts:
+    """Per-op totals of measured usage: a cost model for the controller and for capacity planning."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ops: Dict[str, Dict[str, float]] = {}
+
+    def record(self, op: str, usage: Dict[str, float], tasks: int = 1, wall_ms: Optional[float] = None) -> None:
+        """Add one pool call's usage; a batch call covers `tasks` tasks."""
+        with self._lock:
+            agg = self._ops.get(op)
+            if agg is None:
+                agg = self._ops[op] = {"tasks": 0, "calls": 0, "run_ms": 0.0, "cpu_ms": 0.0, "wall_ms": 0.0,
+                                       "peak_rss_kb": 0, "rss_delta_kb": 0}
+            agg["tasks"] += tasks
+            agg["calls"] += 1
+            agg["run_ms"] += usage.get("run_ms", 0.0)
+            agg["cpu_ms"] += usage.get("cpu_ms", 0.0)
+            agg["wall_ms"] += wall_ms if wall_ms is not None else usage.get("run_ms", 0.0)
+            agg["peak_rss_kb"] = max(agg["peak_rss_kb"], usage.get("peak_rss_kb", 0))
+            agg["rss_delta_kb"] = max(agg["rss_delta_kb"], usage.get("rss_delta_kb", 0))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per op: tasks, mean run_ms / cpu_ms / queue_ms per task, cpu_util
+        (cpu_ms / run_ms), and the largest peak_rss_kb / rss_delta_kb seen.
+        """
+        out: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            for op, agg in self._ops.items():
+                n = max(1, agg["tasks"])
+                out[op] = {
+                    "tasks": agg["tasks"],
+                    "run_ms": round(agg["run_ms"] / n, 3),
+                    "cpu_ms": round(agg["cpu_ms"] / n, 3),
+                    "queue_ms": round(max(0.0, agg["wall_ms"] - agg["run_ms"]) / n, 3),
+                    "cpu_util": round(agg["cpu_ms"] / agg["run_ms"], 3) if agg["run_ms"] > 0 else 0.0,
+                    "peak_rss_kb": agg["peak_rss_kb"],
+                    "rss_delta_kb": agg["rss_delta_kb"],
+                }
+        return out
@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from abortable_session import AbortableSession, SessionAborted
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/hold":
+            self.server.release.wait(10)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class AbortableSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.release = threading.Event()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_abort_cuts_off_held_request(self):
+        session = AbortableSession()
+        self.assertEqual(session.get(self.base + "/now").status_code, 204)  # keep-alive connection gets reused
+
+        outcome = []
+
+        def poll():
+            t0 = time.time()
+            try:
+                session.get(self.base + "/hold", timeout=10)
+                outcome.append(("returned", time.time() - t0))
+            except requests.ConnectionError:
+                outcome.append(("aborted", time.time() - t0))
+
+        t = threading.Thread(target=poll)
+        t.start()
+        time.sleep(0.3)
+        session.abort()
+        t.join(5)
+        self.assertEqual(outcome[0][0], "aborted")
+        self.assertLess(outcome[0][1], 2.0)
+
+    def test_requests_after_abort_fail(self):
+        session = AbortableSession()
+        session.abort()
+        with self.assertRaises(SessionAborted):
+            session.get(self.base + "/now")
+
+
+if __name__ == "__main__":
+    unittest.main()
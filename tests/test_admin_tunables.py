@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import app
+import load_env
+
+
+class SetTunablesTest(unittest.TestCase):
+    def setUp(self):
+        saved = {name: getattr(app, name) for name in app._TUNABLES if name != "CPU_POOL_WORKERS"}
+        self.addCleanup(lambda: [setattr(app, k, v) for k, v in saved.items()])
+        ttl = app._JOBS.running_ttl_sec
+        self.addCleanup(setattr, app._JOBS, "running_ttl_sec", ttl)
+
+    def test_rejects_values_below_floor(self):
+        for name, value in (("HEARTBEAT_SEC", 0), ("HTTP_TIMEOUT", 0.1), ("TASK_EXEC_TIMEOUT_SEC", 0),
+                            ("SCALE_TICK_SEC", 0), ("SCHED_PREFETCH", 0), ("BATCH_MAX_SIZE", 0),
+                            ("SCHED_EWMA_ALPHA", 2), ("HTTP_TIMEOUT", "nan"), ("WAIT_MS", -1)):
+            with self.subTest(name=name, value=value):
+                with self.assertRaises(ValueError):
+                    app._set_tunables({name: value})
+
+    def test_rejected_set_changes_nothing(self):
+        before = app._tunable_values()
+        with self.assertRaises(ValueError):
+            app._set_tunables({"SCHED_AGING": 3, "HEARTBEAT_SEC": 0})
+        self.assertEqual(app._tunable_values(), before)
+
+    def test_exec_timeout_updates_running_ttl(self):
+        with mock.patch.object(app, "DEDUPE_TTL_SEC", 0.0):
+            app._set_tunables({"TASK_EXEC_TIMEOUT_SEC": 100, "BATCH_MAX_SIZE": 3})
+            self.assertEqual(app._JOBS.running_ttl_sec, 600.0)
+            app._set_tunables({"TASK_EXEC_TIMEOUT_SEC": 10})
+            self.assertEqual(app._JOBS.running_ttl_sec, 60.0)
+
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        fd, path = tempfile.mkstemp(suffix=".env")
+        os.close(fd)
+        self.env_file = Path(path)
+        self.addCleanup(self.env_file.unlink)
+        patcher = mock.patch.object(load_env, "ENV_FILE", self.env_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        env = mock.patch.dict(os.environ)
+        env.start()
+        self.addCleanup(env.stop)
+        saved = {name: getattr(app, name) for name in app._TUNABLES if name != "CPU_POOL_WORKERS"}
+        self.addCleanup(lambda: [setattr(app, k, v) for k, v in saved.items()])
+
+    def test_invalid_file_changes_nothing(self):
+        os.environ.pop("RELOAD_TEST_VAR", None)
+        self.env_file.write_text("RELOAD_TEST_VAR=1\nSCHED_AGING=2\nHEARTBEAT_SEC=0\n")
+        before = app._tunable_values()
+        with self.assertRaises(ValueError):
+            app._admin({"cmd": "reload"})
+        self.assertNotIn("RELOAD_TEST_VAR", os.environ)
+        self.assertEqual(app._tunable_values(), before)
+
+    def test_valid_file_is_applied(self):
+        os.environ.pop("RELOAD_TEST_VAR", None)
+        self.env_file.write_text("RELOAD_TEST_VAR=1\nSCHED_AGING=2\n")
+        out = app._admin({"cmd": "reload"})
+        self.assertEqual(os.environ["RELOAD_TEST_VAR"], "1")
+        self.assertEqual(out["values"]["SCHED_AGING"], 2.0)
+        self.assertEqual(out["restart_required"], ["RELOAD_TEST_VAR"])
+
+    def test_process_environment_wins(self):
+        os.environ["RELOAD_TEST_VAR"] = "from-env"
+        os.environ["SCHED_AGING"] = "0.5"
+        app.SCHED_AGING = 0.5
+        self.env_file.write_text("RELOAD_TEST_VAR=from-file\nSCHED_AGING=2\nBATCH_MAX_SIZE=7\n")
+        with mock.patch.object(load_env, "_PROCESS_ENV", frozenset({"RELOAD_TEST_VAR", "SCHED_AGING"})):
+            out = app._admin({"cmd": "reload"})
+        self.assertEqual(os.environ["RELOAD_TEST_VAR"], "from-env")
+        self.assertEqual(os.environ["SCHED_AGING"], "0.5")
+        self.assertEqual(app.SCHED_AGING, 0.5)
+        self.assertEqual(out["restart_required"], [])
+        self.assertEqual(out["values"]["BATCH_MAX_SIZE"], 7)
+
+    def test_values_from_the_file_can_change_again(self):
+        # agent.env values applied at startup are in os.environ too, but a reload replaces them.
+        os.environ["RELOAD_TEST_VAR"] = "old"
+        self.env_file.write_text("RELOAD_TEST_VAR=new\n")
+        with mock.patch.object(load_env, "_PROCESS_ENV", frozenset()):
+            out = app._admin({"cmd": "reload"})
+        self.assertEqual(os.environ["RELOAD_TEST_VAR"], "new")
+        self.assertEqual(out["restart_required"], ["RELOAD_TEST_VAR"])
+
+
+if __name__ == "__main__":
+    unittest.main()
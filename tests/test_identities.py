@@ -0,0 +1,36 @@
+import json
+import unittest
+
+from identities import load_identities
+
+
+class LoadIdentitiesTest(unittest.TestCase):
+    def load(self, raw, name="box"):
+        return load_identities(raw, name, ["echo"], {}, ["http://ctrl:8080"])
+
+    def test_default_identity(self):
+        (ident,) = self.load("")
+        self.assertEqual((ident.name, ident.tasks, ident.controllers), ("box", ["echo"], ["http://ctrl:8080"]))
+
+    def test_fields_fall_back_to_defaults(self):
+        a, b = self.load('[{"name": "a", "share": 2}, {"name": "b", "tasks": "x,y", "controllers": "http://c/"}]')
+        self.assertEqual((a.tasks, a.share), (["echo"], 2.0))
+        self.assertEqual((b.tasks, b.controllers), (["x", "y"], ["http://c"]))
+
+    def test_rejects_bad_names(self):
+        for name in ("etl box", "etl\tbox", "etl\nbox", "etl\x00box", "etl box"):
+            with self.subTest(name=name):
+                with self.assertRaises(ValueError):
+                    self.load('[{"name": %s}]' % json.dumps(name))
+                with self.assertRaises(ValueError):
+                    self.load("", name=name)
+
+    def test_rejects_duplicates_and_bad_shares(self):
+        with self.assertRaises(ValueError):
+            self.load('[{"name": "a"}, {"name": "a"}]')
+        with self.assertRaises(ValueError):
+            self.load('[{"name": "a", "share": 0}]')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+
+import app
+import job_dedupe
+from job_dedupe import JobIndex
+
+
+class JobIndexTest(unittest.TestCase):
+    def test_running_then_done(self):
+        jobs = JobIndex(60, 1 << 20, 100, 60)
+        self.assertEqual(jobs.begin("a 1"), (job_dedupe.NEW, None))
+        self.assertEqual(jobs.begin("a 1"), (job_dedupe.RUNNING, None))
+        self.assertEqual(jobs.running_ids(), ["a 1"])
+        jobs.finish("a 1", b"{}")
+        self.assertEqual(jobs.begin("a 1"), (job_dedupe.DONE, b"{}"))
+        self.assertEqual(jobs.running_ids(), [])
+
+    def test_forget_runs_again(self):
+        jobs = JobIndex(60, 1 << 20, 100, 60)
+        jobs.begin("a 1")
+        jobs.forget("a 1")
+        self.assertEqual(jobs.begin("a 1"), (job_dedupe.NEW, None))
+
+    def test_byte_cap_evicts_oldest_done(self):
+        jobs = JobIndex(60, 10, 100, 60)
+        for key in ("a 1", "a 2"):
+            jobs.begin(key)
+            jobs.finish(key, b"123456")
+        self.assertEqual(jobs.begin("a 1"), (job_dedupe.NEW, None))
+        self.assertEqual(jobs.begin("a 2"), (job_dedupe.DONE, b"123456"))
+
+    def test_released_jobs_are_not_finished(self):
+        jobs = JobIndex(60, 1 << 20, 100, 60)
+        jobs.begin("a 1")
+        jobs.begin("a 2")
+        jobs.finish("a 2", b"{}")
+        self.assertEqual(jobs.release_running(), ["a 1"])
+        self.assertFalse(jobs.finish("a 1", b"{}"))
+        self.assertFalse(jobs.forget("a 1"))
+        self.assertEqual(jobs.stats()["released"], 1)
+
+    def test_entries_expire_by_their_own_ttl(self):
+        now = [1000.0]
+        with mock.patch.object(job_dedupe.time, "time", lambda: now[0]):
+            jobs = JobIndex(10, 1 << 20, 100, 100)
+            jobs.begin("done")
+            jobs.finish("done", b"{}")
+            now[0] -= 150  # clock stepped back: running entries now sit behind a newer done one
+            jobs.begin("stuck")
+            jobs.begin("handed back")
+            jobs.release_running()
+            now[0] += 155  # "done" is still live, the running entries are past running_ttl_sec
+            self.assertEqual(jobs.begin("fresh"), (job_dedupe.NEW, None))
+            self.assertEqual(jobs.running_ids(), ["fresh"])
+            self.assertEqual(jobs.stats()["released"], 0)
+            self.assertEqual(jobs.begin("done"), (job_dedupe.DONE, b"{}"))
+            self.assertEqual(jobs.begin("stuck"), (job_dedupe.NEW, None))
+
+            now[0] += 20
+            jobs.begin("other")
+            self.assertEqual(jobs.stats()["entries"], 3)  # "done" expired; the running ones stay
+
+
+class ReleasedByDestTest(unittest.TestCase):
+    def test_released_keys_keep_job_ids_intact(self):
+        keys = [app._job_key("vm@http://a", "job 1"), app._job_key("", "job 2"), app._job_key("vm@http://a", "3")]
+        self.assertEqual(app._released_by_dest(keys), {"vm@http://a": ["job 1", "3"], "": ["job 2"]})
+
+
+class PostResultDedupeTest(unittest.TestCase):
+    def setUp(self):
+        self.jobs = JobIndex(60, 1 << 20, 100, 60)
+        patches = [
+            mock.patch.object(app, "_JOBS", self.jobs),
+            mock.patch.object(app, "_submit_result"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.key = app._job_key("", "job-1")
+
+    def test_ok_result_is_stored(self):
+        self.jobs.begin(self.key)
+        app.post_result("job-1", True, result={"n": 1})
+        state, body = self.jobs.begin(self.key)
+        self.assertEqual(state, job_dedupe.DONE)
+        self.assertIn(b'"job-1"', body)
+        app._submit_result.assert_called_once()
+
+    def test_failed_result_is_not_stored(self):
+        self.jobs.begin(self.key)
+        app.post_result("job-1", False, error="boom")
+        app._submit_result.assert_called_once()
+        # A re-lease runs the job again instead of getting the failure re-sent.
+        self.assertEqual(self.jobs.begin(self.key), (job_dedupe.NEW, None))
+
+    def test_released_result_is_not_posted(self):
+        self.jobs.begin(self.key)
+        self.jobs.release_running()  # handed back on leave
+        app.post_result("job-1", True, result={"n": 1})
+        app.post_result("job-1", False, error="boom")
+        app._submit_result.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
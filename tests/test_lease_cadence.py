@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+import lease_cadence
+from lease_cadence import LeaseCadence
+
+
+class LeaseCadenceTest(unittest.TestCase):
+    def cadence(self):
+        return LeaseCadence(base_wait_ms=2000, max_wait_ms=15000, base_idle_sec=0.05, max_idle_sec=1.0)
+
+    def test_backs_off_on_empty_leases(self):
+        c = self.cadence()
+        waits = []
+        with mock.patch.object(lease_cadence.random, "random", return_value=1.0):
+            pauses = []
+            for _ in range(8):
+                waits.append(c.wait_ms())
+                c.miss()
+                pauses.append(c.idle_sec())
+        self.assertEqual(waits, [2000, 4000, 8000, 15000, 15000, 15000, 15000, 15000])
+        self.assertEqual(pauses, [0.05, 0.1, 0.2, 0.4, 0.8, 1.0, 1.0, 1.0])
+        self.assertFalse(c.hot())
+
+    def test_hit_resets_to_base(self):
+        c = self.cadence()
+        for _ in range(5):
+            c.miss()
+        c.hit()
+        self.assertTrue(c.hot())
+        self.assertEqual(c.wait_ms(), 2000)
+        c.miss()
+        with mock.patch.object(lease_cadence.random, "random", return_value=1.0):
+            self.assertEqual(c.idle_sec(), 0.05)
+        self.assertEqual(c.stats(), {"polls": 7, "hits": 1, "idle_streak": 1})
+
+    def test_jitter_stays_within_floor_and_ceiling(self):
+        c = self.cadence()
+        for misses in range(1, 40):
+            c.miss()
+            for r in (0.0, 0.5, 0.999):
+                with mock.patch.object(lease_cadence.random, "random", return_value=r):
+                    pause = c.idle_sec()
+                self.assertGreaterEqual(pause, 0.05)
+                self.assertLessEqual(pause, 1.0)
+            self.assertLessEqual(c.wait_ms(), 15000)
+        # Deep into an idle stretch the pause still varies, so a fleet spreads out.
+        with mock.patch.object(lease_cadence.random, "random", return_value=0.0):
+            self.assertEqual(c.idle_sec(), 0.5)
+
+    def test_cool_marks_idle_without_growing(self):
+        c = self.cadence()
+        c.cool()
+        c.cool()
+        self.assertFalse(c.hot())
+        self.assertEqual(c.wait_ms(), 4000)  # one miss, however many non-blocking leases came back empty
+
+    def test_tune_keeps_caps_above_bases(self):
+        c = self.cadence()
+        for _ in range(3):
+            c.miss()
+        c.tune(base_wait_ms=-5, max_wait_ms=-1, base_idle_sec=0.2, max_idle_sec=0.1)
+        self.assertEqual((c.base_wait_ms, c.max_wait_ms, c.base_idle_sec, c.max_idle_sec), (0, 0, 0.2, 0.2))
+        self.assertEqual(c.wait_ms(), 0)  # plain polling, no long-poll
+        with mock.patch.object(lease_cadence.random, "random", return_value=0.0):
+            self.assertEqual(c.idle_sec(), 0.2)
+        self.assertEqual(c.stats()["idle_streak"], 3)  # the streak survives a retune
+
+
+if __name__ == "__main__":
+    unittest.main()
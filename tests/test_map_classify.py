@@ -0,0 +1,124 @@
+import json
+import os
+import random
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from ops import map_classify
+
+
+def _corpus(n_docs, seed=3):
+    # Short texts from a tiny vocabulary, so classes often tie exactly.
+    rnd = random.Random(seed)
+    words = "good bad not great the slow fast lease never worst x".split()
+    docs = [{"text": " ".join(rnd.choice(words) for _ in range(rnd.randint(1, 30)))} for _ in range(n_docs)]
+    docs += map_classify._bench_corpus(20, seed)
+    docs += [{"text": "!!!"}, {"document": "never good"}, {"text": ""}, {"text": "x" * 5000}, "nope"]
+    return docs
+
+
+class ModelFileTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        p = mock.patch.object(map_classify, "_model", None)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def use(self, path):
+        p = mock.patch.object(map_classify, "MODEL_PATH", path)
+        p.start()
+        self.addCleanup(p.stop)
+        map_classify._model = None
+
+    def path(self, name, data=None):
+        path = os.path.join(self.dir, name)
+        if data is not None:
+            with open(path, "wb") as f:
+                f.write(data)
+        return path
+
+
+class BatchMatchesSingleTest(ModelFileTest):
+    def setUp(self):
+        super().setUp()
+        path = self.path("seed.bin")
+        map_classify._build_seed_model(path)
+        self.use(path)
+
+    def check(self):
+        docs = _corpus(2000)
+        self.assertEqual(map_classify.handle_batch(docs), [map_classify.handle(d) for d in docs])
+
+    def test_batch_matches_single(self):
+        self.check()
+
+    def test_without_numpy(self):
+        with mock.patch.object(map_classify, "np", None):
+            self.check()
+
+    def test_tie_goes_to_first_class(self):
+        out = map_classify.handle({"text": "the lease"})
+        self.assertEqual(out["label"], "neutral")
+        tie = map_classify.handle({"text": "good bad"})
+        self.assertEqual(tie["scores"]["negative"], tie["scores"]["positive"])
+        self.assertEqual(tie["label"], "negative")
+
+
+class BadModelFileTest(ModelFileTest):
+    def assert_clean_error(self, path, message):
+        self.use(path)
+        for call in (map_classify.handle, lambda p: map_classify.handle_batch([p])):
+            with self.assertRaises(ValueError) as ctx:
+                call({"text": "good"})
+            self.assertIn(path, str(ctx.exception))
+            self.assertIn(message, str(ctx.exception))
+        self.assertIsNone(map_classify._model)
+
+    def header(self, header, hlen=None):
+        raw = json.dumps(header).encode() if isinstance(header, dict) else header
+        return b"MCLF" + struct.pack("<I", len(raw) if hlen is None else hlen) + raw
+
+    def test_missing_file(self):
+        self.assert_clean_error(self.path("missing.bin"), "cannot map model file")
+
+    def test_empty_file(self):
+        self.assert_clean_error(self.path("empty.bin", b""), "cannot map model file")
+
+    def test_wrong_magic(self):
+        self.assert_clean_error(self.path("magic.bin", b"NOPE" + b"\0" * 64), "not a map_classify model file")
+        self.assert_clean_error(self.path("short.bin", b"MC"), "not a map_classify model file")
+
+    def test_bad_header(self):
+        cases = {
+            "json.bin": self.header(b"{not json"),
+            "utf8.bin": self.header(b"\xff\xfe"),
+            "keys.bin": self.header({"n_features": 4}),
+            "types.bin": self.header({"classes": ["a"], "n_features": "many"}),
+            "list.bin": self.header(b"[1, 2]"),
+            "empty.bin": self.header({"classes": [], "n_features": 4}),
+            "hlen.bin": self.header({"classes": ["a"], "n_features": 4}, hlen=1 << 30),
+        }
+        for name, data in cases.items():
+            with self.subTest(name=name):
+                self.assert_clean_error(self.path(name, data), "bad model header")
+
+    def test_truncated_weights(self):
+        path = self.path("cut.bin")
+        map_classify.write_model(path, ["a", "b"], {"good": {"a": 1.0}}, n_features=64)
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 4)
+        self.assert_clean_error(path, "truncated model file")
+
+    def test_good_model_after_fix(self):
+        path = self.path("model.bin", b"junk")
+        self.assert_clean_error(path, "not a map_classify model file")
+        map_classify.write_model(path, ["a", "b"], {"good": {"b": 3.0}}, n_features=64)
+        self.assertEqual(map_classify.handle({"text": "good"})["label"], "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import random
+import unittest
+from unittest import mock
+
+from ops import map_summarize
+
+
+def _corpus(n_docs, seed=5):
+    # Few distinct words, so sentences repeat and tie often.
+    rnd = random.Random(seed)
+    words = "the a of alpha beta gamma delta cache cache node lease x and is".split()
+    docs = []
+    for _ in range(n_docs):
+        sents = [" ".join(rnd.choice(words) for _ in range(rnd.randint(1, 12))) + "."
+                 for _ in range(rnd.randint(1, 60))]
+        docs.append({"text": " ".join(sents), "sentences": rnd.randint(1, 5), "method": rnd.choice(["tf", "textrank"])})
+    docs.append({"text": "The. A. Of. It is."})  # nothing but stopwords
+    docs.append({"text": "a b. " * 500})  # too long for TextRank
+    return docs
+
+
+class BatchMatchesSingleTest(unittest.TestCase):
+    def check(self):
+        docs = _corpus(150)
+        self.assertEqual(map_summarize.handle_batch(docs), [map_summarize.handle(d) for d in docs])
+
+    def test_batch_matches_single(self):
+        self.check()
+
+    def test_small_chunks(self):
+        with mock.patch.object(map_summarize, "BATCH_MAX_CELLS", 500):
+            self.check()
+
+    def test_without_numpy(self):
+        with mock.patch.object(map_summarize, "np", None):
+            self.check()
+
+    def test_bad_item_fails_alone(self):
+        out = map_summarize.handle_batch([{"text": "One. Two."}, {"text": "x", "method": "lsa"}, 7])
+        self.assertTrue(out[0]["ok"])
+        self.assertEqual([item["ok"] for item in out[1:]], [False, False])
+
+
+class ParseTest(unittest.TestCase):
+    def test_rejects_invalid_values(self):
+        for payload in ({"text": "x", "sentences": 0}, {"text": "x", "sentences": -2},
+                        {"text": "x", "sentences": 51}, {"text": "x", "sentences": 2.5},
+                        {"text": "x", "sentences": True}, {"text": "x", "sentences": "many"},
+                        {"text": "x", "method": "TextRank"}, {"text": "x", "method": ""},
+                        {"text": ""}, {}):
+            with self.subTest(payload=payload):
+                out = map_summarize.handle(payload)
+                self.assertFalse(out["ok"])
+                self.assertTrue(out["error"])
+
+    def test_defaults_and_numeric_strings(self):
+        self.assertEqual(map_summarize._parse({"text": "x"}), ("x", 3, "textrank"))
+        self.assertEqual(map_summarize._parse({"text": "x", "sentences": "5", "method": "tf"}), ("x", 5, "tf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+from unittest import mock
+
+import ops
+from pipeline import plan, run_pipeline
+
+
+def _add(payload):
+    return {"ok": True, "n": payload["n"] + payload.get("by", 1)}
+
+
+def _split(payload):
+    return {"ok": True, "parts": payload["text"].split()}
+
+
+def _fail(payload):
+    return {"ok": False, "error": "no good"}
+
+
+def _boom(payload):
+    raise KeyError("missing")
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def record(payload):
+            self.calls.append(payload)
+            return {"ok": True, "seen": payload}
+
+        p = mock.patch.dict(ops.OPS_REGISTRY, {"add": _add, "split": _split, "fail": _fail, "boom": _boom,
+                                               "record": record})
+        p.start()
+        self.addCleanup(p.stop)
+
+    def run_stages(self, stages, **extra):
+        return run_pipeline(plan(dict(extra, stages=stages)))
+
+
+class PlanTest(PipelineTest):
+    def test_rejects_cycles(self):
+        for stages, message in (
+            ([{"id": "a", "op": "add", "input": "b"}, {"id": "b", "op": "add", "input": "a"}], "cycle: a, b"),
+            ([{"id": "a", "op": "add", "payload": {"n": 1}},
+              {"id": "b", "op": "add", "inputs": {"n": "d.n"}},
+              {"id": "c", "op": "add", "input": "b"},
+              {"id": "d", "op": "add", "input": "c"}], "cycle: b, c, d"),
+            ([{"id": "a", "op": "add", "input": "a.n"}], "refers to itself"),
+        ):
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(ValueError, message):
+                    plan({"stages": stages})
+
+    def test_rejects_unknown_ops_and_stages(self):
+        with self.assertRaisesRegex(ValueError, "op 'nope' is not served"):
+            plan({"stages": [{"op": "add", "payload": {}}, {"op": "nope"}]}, allowed=["add"])
+        with self.assertRaisesRegex(ValueError, "refers to unknown stage 'ghost'"):
+            plan({"stages": [{"op": "add", "inputs": {"n": "ghost.n"}}]})
+        with self.assertRaisesRegex(ValueError, "output 'ghost' is not a stage"):
+            plan({"stages": [{"op": "add", "payload": {}}], "output": "ghost"})
+        # Without an allow-list the op is only looked up when the stage runs.
+        ok, error, timings = self.run_stages([{"id": "x", "op": "nope", "payload": {}}])
+        self.assertFalse(ok)
+        self.assertEqual(error, "stage 'x' (nope): unknown op: nope")
+        self.assertEqual([t["id"] for t in timings], ["x"])
+
+    def test_rejects_malformed_stages(self):
+        for payload, message in (
+            ({}, "needs a 'stages' list"),
+            ({"stages": []}, "no stages"),
+            ({"stages": [{"op": "add"}]}, "first stage needs a payload"),
+            ({"stages": [{"op": "add", "payload": {}}, {"op": "add", "input": "s0", "payload": {}}]},
+             "cannot be combined"),
+            ({"stages": [{"id": "a", "op": "add", "payload": {}}, {"id": "a", "op": "add"}]}, "duplicate stage id"),
+            ({"stages": [{"op": "pipeline", "payload": {}}]}, "cannot nest"),
+        ):
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(ValueError, message):
+                    plan(payload)
+
+    def test_dependency_order_keeps_listed_order(self):
+        planned = plan({"stages": [
+            {"id": "late", "op": "add", "inputs": {"n": "mid.n"}},
+            {"id": "first", "op": "add", "payload": {"n": 1}},
+            {"id": "other", "op": "add", "payload": {"n": 5}},
+            {"id": "mid", "op": "add", "input": "first"},
+        ], "output": "late"})
+        self.assertEqual([s["id"] for s in planned["stages"]], ["first", "other", "mid", "late"])
+        self.assertEqual(planned["output"], "late")
+
+
+class RunPipelineTest(PipelineTest):
+    def test_outputs_thread_through_stages(self):
+        ok, out, timings = self.run_stages([
+            {"id": "words", "op": "split", "payload": {"text": "alpha beta gamma"}},
+            {"id": "start", "op": "add", "payload": {"n": 1}},
+            {"id": "more", "op": "add", "inputs": {"n": "start.n"}, "payload": {"by": 10}},
+            {"op": "record"},  # no payload: takes the previous stage's output
+            {"id": "picked", "op": "record", "inputs": {"word": "words.parts.1", "n": "s3.seen.n"}},
+        ])
+        self.assertTrue(ok)
+        self.assertEqual(out, {"ok": True, "seen": {"word": "beta", "n": 12}})
+        self.assertEqual(self.calls[0], {"ok": True, "n": 12})
+        self.assertEqual([t["id"] for t in timings], ["words", "start", "more", "s3", "picked"])
+        self.assertTrue(all(t["ms"] >= 0 and "error" not in t for t in timings))
+
+    def test_inputs_do_not_modify_the_stage_payload(self):
+        stages = [{"id": "a", "op": "add", "payload": {"n": 1}},
+                  {"id": "b", "op": "record", "inputs": {"x": "a.n"}, "payload": {"keep": True}}]
+        planned = plan({"stages": stages})
+        run_pipeline(planned)
+        self.assertEqual(planned["stages"][1]["payload"], {"keep": True})
+        self.assertEqual(self.calls, [{"keep": True, "x": 2}])
+
+    def test_output_names_an_earlier_stage(self):
+        ok, out, _ = self.run_stages([{"id": "a", "op": "add", "payload": {"n": 1}},
+                                      {"id": "b", "op": "add", "input": "a"}], output="a")
+        self.assertEqual((ok, out), (True, {"ok": True, "n": 2}))
+
+    def test_failing_intermediate_stage_stops_the_pipeline(self):
+        for op, error in (("fail", "no good"), ("boom", "'missing'")):
+            with self.subTest(op=op):
+                self.calls.clear()
+                ok, out, timings = self.run_stages([
+                    {"id": "a", "op": "add", "payload": {"n": 1}},
+                    {"id": "mid", "op": op, "input": "a"},
+                    {"id": "c", "op": "record", "input": "mid"},
+                ])
+                self.assertFalse(ok)
+                self.assertEqual(out, f"stage 'mid' ({op}): {error}")
+                self.assertEqual([t["id"] for t in timings], ["a", "mid"])
+                self.assertEqual(timings[1]["error"], error)
+                self.assertEqual(self.calls, [])
+
+    def test_bad_ref_fails_the_stage(self):
+        ok, out, timings = self.run_stages([
+            {"id": "a", "op": "split", "payload": {"text": "one"}},
+            {"id": "b", "op": "record", "inputs": {"w": "a.parts.3"}},
+        ])
+        self.assertFalse(ok)
+        self.assertEqual(out, "stage 'b' (record): ref 'a.parts.3': no index '3'")
+
+
+if __name__ == "__main__":
+    unittest.main()
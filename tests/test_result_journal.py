@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import result_journal
+from result_journal import ResultJournal
+
+
+class ResultJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "results.journal")
+        self.journals = []
+
+    def tearDown(self):
+        for j in self.journals:
+            if not j.closed:
+                j.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def open(self, max_bytes=1024 * 1024):
+        j = ResultJournal(self.path, max_bytes, fsync_delay_ms=0)
+        self.journals.append(j)
+        return j
+
+    def drain(self, j, skip=()):
+        out = []
+        while True:
+            item = j.claim_next(skip=skip)
+            if item is None:
+                return out
+            out.append(item)
+
+    def test_pending_survives_reopen(self):
+        j = self.open()
+        s1 = j.append(b'{"job_id": "1"}', "a")
+        s2 = j.append(b'{"job_id": "2"}')
+        j.ack(s1)
+        j.release(s2)
+        j.close()
+
+        j = self.open()
+        self.assertEqual(j.stats()["pending"], 1)
+        self.assertEqual(self.drain(j), [(s2, b'{"job_id": "2"}', "")])
+
+    def test_torn_tail_is_cut_off(self):
+        j = self.open()
+        seq = j.append(b'{"job_id": "1"}', "a")
+        j.release(seq)
+        j.close()
+        good_size = os.path.getsize(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b'R 2 100 1\na{"job_id": "2", "res')  # crash mid-write
+
+        j = self.open()
+        self.assertEqual(os.path.getsize(self.path), good_size)
+        self.assertEqual([item[0] for item in self.drain(j)], [seq])
+        # Sequence numbers continue after the surviving records.
+        self.assertEqual(j.append(b"{}", "a"), seq + 1)
+
+    def test_torn_ack_is_cut_off(self):
+        j = self.open()
+        seq = j.append(b"{}", "a")
+        j.release(seq)
+        j.close()
+        with open(self.path, "ab") as f:
+            f.write(b"A 1")  # ack without its newline
+
+        j = self.open()
+        self.assertEqual(j.stats()["pending"], 1)
+
+    def test_any_dest_round_trips(self):
+        j = self.open()
+        dest = "etl box@http://ctrl:8080/a b"
+        seq = j.append(b"{}", dest)
+        j.release(seq)
+        j.close()
+
+        j = self.open()
+        self.assertEqual(self.drain(j), [(seq, b"{}", dest)])
+
+    def test_corrupt_record_is_skipped(self):
+        with open(self.path, "wb") as f:
+            f.write(b'R 1 2 0\n{}\nR 2 x y z\n{"lost": 1}\nR 3 5 1\na{}\nA 9 9\nR 4 2 0\n{}\n')
+        j = self.open()
+        # The records after the bad ones survive; the one with the bad header is lost.
+        self.assertEqual([item[0] for item in self.drain(j)], [1, 4])
+
+    def test_ack_after_replay(self):
+        j = self.open()
+        seq = j.append(b'{"job_id": "1"}', "a")
+        j.release(seq)  # upload failed
+        j.close()
+
+        # Restart: the replay loop claims, uploads and acks it.
+        j = self.open()
+        claimed = j.claim_next()
+        self.assertEqual(claimed, (seq, b'{"job_id": "1"}', "a"))
+        self.assertIsNone(j.claim_next())  # claimed records are not handed out twice
+        j.ack(seq)
+        self.assertEqual(j.stats()["pending"], 0)
+        self.assertEqual(os.path.getsize(self.path), 0)  # fully acknowledged -> truncated
+        j.close()
+
+        j = self.open()
+        self.assertEqual(j.stats()["pending"], 0)
+        self.assertIsNone(j.claim_next())
+
+    def test_per_dest_order(self):
+        j = self.open()
+        seqs = []
+        for dest in ("a", "b", "a", "b"):
+            seq = j.append(b"{}", dest)
+            j.release(seq)
+            seqs.append(seq)
+
+        # Oldest first overall; a destination that is down is skipped, the others go on.
+        self.assertEqual([item[0] for item in self.drain(j, skip={"a"})], [seqs[1], seqs[3]])
+        self.assertEqual([item[0] for item in self.drain(j)], [seqs[0], seqs[2]])
+        self.assertEqual(j.backlog("a"), 0)
+        self.assertEqual(j.pending_by_dest(), {"a": 2, "b": 2})  # claimed records still count
+
+        j.release(seqs[2])
+        j.release(seqs[0])
+        self.assertEqual(j.backlog("a"), 2)
+        self.assertEqual(j.backlog("b"), 0)
+        self.assertEqual(j.claim_next()[0], seqs[0])
+
+    def test_compaction_keeps_live_records(self):
+        with mock.patch.object(result_journal, "_COMPACT_MIN_BYTES", 0):
+            j = self.open()
+            keep = j.append(b'{"keep": true}', "a")
+            j.release(keep)
+            for i in range(50):
+                j.ack(j.append(b'{"filler": "%d"}' % i, "b"))
+            size = os.path.getsize(self.path)
+            self.assertLess(size, 200)  # acknowledged records were rewritten away
+            j.close()
+
+        j = self.open()
+        self.assertEqual(self.drain(j), [(keep, b'{"keep": true}', "a")])
+
+    def test_disk_cap_drops_oldest(self):
+        j = self.open(max_bytes=64 * 1024)
+        body = b"x" * 10000
+        seqs = []
+        for _ in range(10):
+            seq = j.append(body, "a")
+            j.release(seq)
+            seqs.append(seq)
+        stats = j.stats()
+        self.assertGreater(stats["dropped"], 0)
+        self.assertLessEqual(stats["file_bytes"], 64 * 1024)
+        remaining = [item[0] for item in self.drain(j)]
+        self.assertEqual(remaining, seqs[-len(remaining):])  # the newest survive, in order
+
+
+if __name__ == "__main__":
+    unittest.main()
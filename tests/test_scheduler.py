@@ -0,0 +1,146 @@
+import unittest
+from unittest import mock
+
+import scheduler
+from scheduler import LocalScheduler
+
+
+def _task(job_id, op, **fields):
+    return dict(fields, job_id=job_id, op=op)
+
+
+def _not_batch(op):
+    return False
+
+
+class LocalSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        p = mock.patch.object(scheduler.time, "time", lambda: self.now)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def take_ids(self, sched, is_batch=_not_batch, max_batch=1):
+        return [t["job_id"] for t in sched.take(is_batch, max_batch)]
+
+    def test_shortest_expected_job_first(self):
+        sched = LocalScheduler(ewma_alpha=0.5, aging=0.0)
+        sched.record("slow", 500.0)
+        sched.record("fast", 5.0)
+        sched.record("mid", 50.0)
+        for job_id, op in (("s", "slow"), ("m", "mid"), ("f", "fast")):
+            sched.put(_task(job_id, op))
+        self.assertEqual([self.take_ids(sched) for _ in range(3)], [["f"], ["m"], ["s"]])
+        self.assertEqual(sched.take(_not_batch, 1), [])
+
+    def test_estimate_is_an_ewma(self):
+        sched = LocalScheduler(ewma_alpha=0.5)
+        self.assertEqual(sched.expected_ms("new"), 0.0)  # unmeasured ops count as instant
+        sched.record("op", 100.0)
+        sched.record("op", 200.0)
+        self.assertEqual(sched.expected_ms("op"), 150.0)
+
+        # The order follows the moving estimate, not the first measurement.
+        sched.record("other", 120.0)
+        sched.put(_task("a", "op"))
+        sched.put(_task("b", "other"))
+        self.assertEqual(self.take_ids(sched), ["b"])
+
+    def test_aging_promotes_starved_ops(self):
+        sched = LocalScheduler(aging=0.5)
+        sched.record("slow", 1000.0)
+        sched.record("fast", 10.0)
+        sched.put(_task("old-slow", "slow"))
+
+        # Fresh short tasks keep overtaking until the slow one has waited ~expected / aging.
+        self.now += 1.0
+        sched.put(_task("f1", "fast"))
+        self.assertEqual(self.take_ids(sched), ["f1"])
+        self.now += 1.5
+        sched.put(_task("f2", "fast"))
+        self.assertEqual(self.take_ids(sched), ["old-slow"])
+        self.assertEqual(self.take_ids(sched), ["f2"])
+
+    def test_priority_lowers_score(self):
+        sched = LocalScheduler(aging=0.0, priority_ms=1000.0)
+        sched.record("slow", 800.0)
+        sched.put(_task("fast", "fast"))
+        sched.put(_task("urgent", "slow", priority=1))
+        sched.put(_task("junk", "slow", priority="high"))  # ignored, not an error
+        self.assertEqual([self.take_ids(sched) for _ in range(3)], [["urgent"], ["fast"], ["junk"]])
+
+    def test_deadline_runs_before_slack_runs_out(self):
+        sched = LocalScheduler(aging=0.0)
+        sched.record("slow", 2000.0)
+        sched.record("fast", 100.0)
+        sched.put(_task("fast", "fast"))
+        sched.put(_task("relaxed", "slow", deadline=self.now + 60))
+        # 2.5 s left for a 2 s job: 500 ms of slack beats the 2 s estimate but not the 100 ms one.
+        sched.put(_task("due", "slow", deadline=self.now + 2.5))
+        # Already late: negative slack goes first.
+        sched.put(_task("late", "slow", deadline=self.now + 1))
+        sched.put(_task("bad", "slow", deadline="soon"))
+        self.assertEqual([self.take_ids(sched) for _ in range(5)],
+                         [["late"], ["fast"], ["due"], ["relaxed"], ["bad"]])
+
+    def test_batch_ops_take_same_op_tasks_up_to_cap(self):
+        sched = LocalScheduler()
+        for i in range(5):
+            sched.put(_task(f"b{i}", "batchy"))
+        sched.put(_task("x", "other"))
+        sched.record("other", 10.0)
+        group = self.take_ids(sched, is_batch=lambda op: op == "batchy", max_batch=3)
+        self.assertEqual(group, ["b0", "b1", "b2"])
+        self.assertEqual(sched.depths(), {"batchy": 2, "other": 1})
+        self.assertEqual(len(sched), 3)
+
+    def test_fair_share_follows_shares(self):
+        sched = LocalScheduler(aging=0.0)
+        sched.set_share("a", 2.0)
+        sched.set_share("b", 1.0)
+        sched.record("op", 10.0)
+        for i in range(30):
+            sched.put(_task(f"a{i}", "op", _agent="a"))
+            sched.put(_task(f"b{i}", "op", _agent="b"))
+        taken = [sched.take(_not_batch, 1)[0]["_agent"] for _ in range(30)]
+        self.assertEqual((taken.count("a"), taken.count("b")), (20, 10))
+        self.assertEqual((sched.identity_depth("a"), sched.identity_depth("b")), (10, 20))
+
+    def test_fair_share_caps_batches_to_the_identity(self):
+        sched = LocalScheduler(aging=0.0)
+        sched.set_share("a", 1.0)
+        sched.set_share("b", 1.0)
+        for i in range(4):
+            sched.put(_task(f"a{i}", "batchy", _agent="a"))
+            sched.put(_task(f"b{i}", "batchy", _agent="b"))
+        group = sched.take(lambda op: True, 8)
+        self.assertEqual({t["_agent"] for t in group}, {"a"})
+        self.assertEqual(len(group), 4)
+        # a was charged for four tasks, so b goes next.
+        self.assertEqual({t["_agent"] for t in sched.take(lambda op: True, 8)}, {"b"})
+
+    def test_idle_identity_gets_no_credit(self):
+        sched = LocalScheduler(aging=0.0)
+        sched.record("op", 10.0)
+        for i in range(10):
+            sched.put(_task(f"a{i}", "op", _agent="a"))
+        sched.put(_task("b0", "op", _agent="b"))
+        for _ in range(5):
+            sched.take(_not_batch, 1)  # b's one task runs early, then a runs alone and runs up a charge
+        # b comes back from idle level with a, so the two alternate instead of b running ahead.
+        for i in range(1, 4):
+            sched.put(_task(f"b{i}", "op", _agent="b"))
+        taken = [sched.take(_not_batch, 1)[0]["_agent"] for _ in range(6)]
+        self.assertEqual(taken.count("b"), 3)
+        self.assertLessEqual(max(len(run) for run in "".join(taken).split("a")), 2)
+
+    def test_drain_returns_everything(self):
+        sched = LocalScheduler()
+        sched.put(_task("1", "x", _agent="a"))
+        sched.put(_task("2", "y"))
+        self.assertEqual(sorted(t["job_id"] for t in sched.drain()), ["1", "2"])
+        self.assertEqual((len(sched), sched.identity_depth("a")), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import app
+import shm_transport
+from shm_transport import SegmentPool, ShmRef, read_envelope, run_op_shm
+
+
+class ReadEnvelopeTest(unittest.TestCase):
+    def test_matches_full_decode_without_payload(self):
+        bodies = [
+            b'{"job_id": "1", "op": "x", "payload": {"a": [1, {"b": "}]\\"{"}]}, "priority": 2}',
+            b' { "payload" : "ends in \\\\" , "op": "y" } ',
+            b'{"payload": "a\\\\\\"b", "op": "z"}',
+            b'{"payload": -12.5e3, "op": "z"}',
+            b'{"payload": [[[]], {"k": ["]"]}], "job_id": 7, "op": "\\u00e9"}',
+            b'{"op": "x"}',
+            b'{}',
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                full = json.loads(body)
+                full.pop("payload", None)
+                self.assertEqual(read_envelope(body), full)
+
+    def test_long_values_fall_back_to_the_decoder(self):
+        payload = {"rows": [{"a": i, "b": str(i)} for i in range(3000)], "quoted": 'say "hi" ' * 3000}
+        body = json.dumps({"job_id": "j", "payload": payload, "op": "x"}).encode()
+        self.assertEqual(read_envelope(body), {"job_id": "j", "op": "x"})
+
+    def test_unreadable_bodies(self):
+        for body in (b'[1]', b'{"op": "x", "payload": [1, 2', b'{"op": "x"} x', b'{"payload": "open}', b'\xff{}'):
+            with self.subTest(body=body):
+                self.assertIsNone(read_envelope(body))
+
+
+class DecodeTaskTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(app, "SHM_MIN_BYTES", 64),
+            mock.patch.dict(app.OPS, {"echo": SimpleNamespace(batch=False), "batched": SimpleNamespace(batch=True)}),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def body(self, op):
+        return json.dumps({"job_id": "1", "op": op, "payload": {"text": "x" * 100}}).encode()
+
+    def test_large_task_keeps_raw_body_only(self):
+        body = self.body("echo")
+        self.assertEqual(app._decode_task(body), {"job_id": "1", "op": "echo", "_raw": body})
+
+    def test_batch_ops_and_pipelines_are_decoded(self):
+        for op in ("batched", app.PIPELINE_OP):
+            with self.subTest(op=op):
+                self.assertEqual(app._decode_task(self.body(op)), json.loads(self.body(op)))
+
+    def test_small_task_is_decoded(self):
+        body = b'{"job_id": "1", "op": "echo", "payload": 1}'
+        self.assertEqual(app._decode_task(body), json.loads(body))
+
+
+class RunOpShmTest(unittest.TestCase):
+    def test_pool_side_detaches_after_each_task(self):
+        pool = SegmentPool(4096, 1 << 20)
+        self.addCleanup(pool.close)
+        task_seg, task_ref = pool.write(b'{"job_id": "1", "payload": {"n": 1}}')
+        result_seg = pool.acquire(4096)
+
+        attached = []
+
+        class Tracked(shm_transport.shared_memory.SharedMemory):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                attached.append(self)
+                self.closed = False
+
+            def close(self):
+                self.closed = True
+                super().close()
+
+        with mock.patch.object(shm_transport.shared_memory, "SharedMemory", Tracked):
+            kind, n = run_op_shm("echo", None, task_ref, ShmRef(result_seg.name, result_seg.size))
+
+        self.assertEqual(kind, "shm")
+        self.assertEqual(json.loads(bytes(result_seg.buf[:n])), {"n": 1})
+        self.assertEqual(len(attached), 2)
+        self.assertTrue(all(shm.closed for shm in attached))
+
+
+if __name__ == "__main__":
+    unittest.main()
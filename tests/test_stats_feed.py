@@ -0,0 +1,100 @@
+import http.client
+import json
+import threading
+import time
+import unittest
+
+from stats_feed import StatsFeed, StatsServer
+
+
+class StatsFeedTest(unittest.TestCase):
+    def test_version_moves_only_on_change(self):
+        feed = StatsFeed()
+        etag0, _ = feed.current()
+        self.assertTrue(feed.publish({"a": 1, "b": 2}))
+        etag1, body = feed.current()
+        self.assertNotEqual(etag0, etag1)
+        self.assertEqual(json.loads(body), {"a": 1, "b": 2})
+        self.assertFalse(feed.publish({"b": 2, "a": 1}))  # same snapshot, different key order
+        self.assertEqual(feed.current()[0], etag1)
+
+    def test_wait_returns_at_once_for_a_stale_etag(self):
+        feed = StatsFeed()
+        feed.publish({"n": 1})
+        t0 = time.monotonic()
+        self.assertEqual(feed.wait('"old"', 5.0), feed.current())
+        self.assertEqual(feed.wait(None, 5.0), feed.current())
+        self.assertLess(time.monotonic() - t0, 1.0)
+
+
+class StatsServerTest(unittest.TestCase):
+    def setUp(self):
+        self.feed = StatsFeed()
+        self.feed.publish({"status": "idle"})
+        server = StatsServer("127.0.0.1:0", self.feed)
+        server.start()
+        self.addCleanup(server.close)
+        self.port = server._server.server_address[1]
+
+    def get(self, path, etag=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.addCleanup(conn.close)
+        conn.request("GET", path, headers={"If-None-Match": etag} if etag else {})
+        resp = conn.getresponse()
+        return resp.status, resp.getheader("ETag"), resp.read()
+
+    def publish_later(self, delay, snapshot):
+        t = threading.Timer(delay, self.feed.publish, (snapshot,))
+        t.start()
+        self.addCleanup(t.cancel)
+
+    def test_etag_and_304(self):
+        status, etag, body = self.get("/stats")
+        self.assertEqual((status, json.loads(body)), (200, {"status": "idle"}))
+        self.assertEqual(self.get("/stats", etag), (304, etag, b""))
+        self.feed.publish({"status": "busy"})
+        status, new_etag, body = self.get("/stats", etag)
+        self.assertEqual((status, json.loads(body)), (200, {"status": "busy"}))
+        self.assertNotEqual(new_etag, etag)
+
+    def test_long_poll_wakes_on_change(self):
+        _, etag, _ = self.get("/stats")
+        self.publish_later(0.2, {"status": "busy"})
+        t0 = time.monotonic()
+        status, new_etag, body = self.get("/stats?wait=10", etag)
+        elapsed = time.monotonic() - t0
+        self.assertEqual((status, json.loads(body)), (200, {"status": "busy"}))
+        self.assertNotEqual(new_etag, etag)
+        self.assertGreaterEqual(elapsed, 0.15)
+        self.assertLess(elapsed, 5.0)
+
+    def test_long_poll_ignores_unchanged_publishes(self):
+        _, etag, _ = self.get("/stats")
+        self.publish_later(0.1, {"status": "idle"})  # same snapshot: no new version
+        t0 = time.monotonic()
+        status, same, _ = self.get("/stats?wait=0.5", etag)
+        self.assertEqual((status, same), (304, etag))
+        self.assertGreaterEqual(time.monotonic() - t0, 0.45)
+
+    def test_long_poll_times_out_with_304(self):
+        _, etag, _ = self.get("/stats")
+        t0 = time.monotonic()
+        self.assertEqual(self.get("/stats?wait=0.3", etag), (304, etag, b""))
+        elapsed = time.monotonic() - t0
+        self.assertGreaterEqual(elapsed, 0.25)
+        self.assertLess(elapsed, 5.0)
+
+    def test_wait_without_etag_or_with_bad_value_does_not_block(self):
+        t0 = time.monotonic()
+        self.assertEqual(self.get("/stats?wait=10")[0], 200)
+        _, etag, _ = self.get("/stats")
+        self.assertEqual(self.get("/stats?wait=soon", etag)[0], 304)
+        self.assertEqual(self.get("/stats?wait=-3", etag)[0], 304)
+        self.assertLess(time.monotonic() - t0, 2.0)
+
+    def test_unknown_path(self):
+        self.assertEqual(self.get("/nope")[0], 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import time
+import unittest
+from unittest import mock
+
+import task_cost
+from task_cost import OpCosts, measured
+
+
+def _spin(ms):
+    end = time.process_time() + ms / 1000.0
+    while time.process_time() < end:
+        pass
+    return "spun"
+
+
+def _touch(n_bytes):
+    buf = bytearray(n_bytes)
+    for i in range(0, n_bytes, 4096):
+        buf[i] = 1
+    return len(buf)
+
+
+class MeasuredTest(unittest.TestCase):
+    def test_returns_result_and_usage(self):
+        out, usage = measured(_spin, 30)
+        self.assertEqual(out, "spun")
+        self.assertGreaterEqual(usage["run_ms"], 25.0)
+        self.assertGreaterEqual(usage["cpu_ms"], 25.0)
+        if task_cost.resource is not None:
+            self.assertAlmostEqual(usage["cpu_ms"], usage["cpu_user_ms"] + usage["cpu_sys_ms"], places=2)
+            self.assertIn("peak_rss_kb", usage)
+
+    def test_waiting_is_not_cpu(self):
+        _, usage = measured(time.sleep, 0.05)
+        self.assertGreaterEqual(usage["run_ms"], 45.0)
+        self.assertLess(usage["cpu_ms"], usage["run_ms"] / 2)
+
+    def test_errors_propagate(self):
+        with self.assertRaises(ZeroDivisionError):
+            measured(lambda: 1 / 0)
+
+    @unittest.skipUnless(task_cost._reset_peak_rss(), "peak RSS cannot be reset here")
+    def test_peak_rss_is_per_call(self):
+        _, big = measured(_touch, 64 << 20)
+        self.assertGreaterEqual(big["rss_delta_kb"], 60 << 10)
+        _, small = measured(_touch, 1 << 20)
+        # The earlier 64 MB peak does not carry over into the next call.
+        self.assertLess(small["rss_delta_kb"], 16 << 10)
+        self.assertLess(small["peak_rss_kb"], big["peak_rss_kb"])
+
+    def test_without_resource_or_proc(self):
+        with mock.patch.object(task_cost, "resource", None), mock.patch.object(task_cost, "_can_reset_peak", False):
+            out, usage = measured(_spin, 5)
+        self.assertEqual(out, "spun")
+        self.assertEqual(set(usage), {"run_ms", "cpu_ms"})
+
+
+class OpCostsTest(unittest.TestCase):
+    def test_snapshot_is_per_task_means(self):
+        costs = OpCosts()
+        costs.record("op", {"run_ms": 10.0, "cpu_ms": 8.0, "peak_rss_kb": 500, "rss_delta_kb": 20}, wall_ms=15.0)
+        costs.record("op", {"run_ms": 30.0, "cpu_ms": 12.0, "peak_rss_kb": 300, "rss_delta_kb": 70}, wall_ms=45.0)
+        self.assertEqual(costs.snapshot(), {"op": {
+            "tasks": 2, "run_ms": 20.0, "cpu_ms": 10.0, "queue_ms": 10.0, "cpu_util": 0.5,
+            "peak_rss_kb": 500, "rss_delta_kb": 70,
+        }})
+
+    def test_batch_call_is_spread_over_its_tasks(self):
+        costs = OpCosts()
+        costs.record("batchy", {"run_ms": 40.0, "cpu_ms": 40.0}, tasks=4, wall_ms=60.0)
+        costs.record("batchy", {"run_ms": 10.0, "cpu_ms": 10.0}, wall_ms=10.0)
+        snap = costs.snapshot()["batchy"]
+        self.assertEqual((snap["tasks"], snap["run_ms"], snap["queue_ms"], snap["cpu_util"]), (5, 10.0, 4.0, 1.0))
+
+    def test_missing_fields_and_wall_time(self):
+        costs = OpCosts()
+        costs.record("a", {"run_ms": 5.0})  # no wall time: no queueing
+        costs.record("b", {})
+        snap = costs.snapshot()
+        self.assertEqual(snap["a"], {"tasks": 1, "run_ms": 5.0, "cpu_ms": 0.0, "queue_ms": 0.0, "cpu_util": 0.0,
+                                     "peak_rss_kb": 0, "rss_delta_kb": 0})
+        self.assertEqual(snap["b"]["cpu_util"], 0.0)
+
+    def test_snapshot_is_a_copy(self):
+        costs = OpCosts()
+        costs.record("op", {"run_ms": 1.0})
+        snap = costs.snapshot()
+        snap["op"]["tasks"] = 99
+        costs.record("op", {"run_ms": 1.0})
+        self.assertEqual(costs.snapshot()["op"]["tasks"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()